@@ -1,7 +1,18 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init, worker_ready
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'loop_assignment.settings')
 app = Celery('loop_assignment')
 app.config_from_object('django.conf:settings', namespace='CELERY')
-app.autodiscover_tasks()
\ No newline at end of file
+app.autodiscover_tasks()
+
+
+# Preload lookups and the deferred heavy imports before the first task (see
+# store_monitor/warmup.py): in every prefork child, and in the main process, which runs
+# the tasks with the solo/threads pools and is what later prefork children fork from
+@worker_process_init.connect
+@worker_ready.connect
+def warm_start_worker(**kwargs):
+    from store_monitor.warmup import warm_start
+    warm_start()
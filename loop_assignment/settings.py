@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -86,6 +88,85 @@ DATABASES = {
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 
+# Report engine: 'columnar' (single pass, bulk loaded), 'per_store' (query per store)
+# 'vectorized' (numpy, all stores at once), 'pollstore' (vectorized over memory-mapped
+# poll files, see POLL_STORE_PATH) or 'incremental' (hourly aggregates)
+REPORT_ENGINE = 'columnar'
+
+# Day-partitioned .npy export of StoreStatus used by the 'pollstore' engine
+POLL_STORE_PATH = BASE_DIR / 'poll_store'
+
+# archive_polls rolls polls older than this many days (before the newest poll) into
+# daily summaries; reports only read the last 7 days plus each store's prior poll
+POLL_RETENTION_DAYS = 30
+
+# Stores per report shard (0 = single task). Shards fan out as a Celery chord,
+# or run on a local process pool when CELERY_TASK_ALWAYS_EAGER is set.
+REPORT_SHARD_SIZE = 2000
+REPORT_LOCAL_WORKERS = None  # None = os.cpu_count()
+
+# The default cache carries state the web and worker processes both read: report status
+# and shard progress, ingestion job progress, /metrics/ counters, report deduplication
+# and the data generation counter. Any deployment with separate web and worker processes
+# must share it by setting CACHE_URL (e.g. redis://localhost:6379/1, next to the broker);
+# without it the cache is local memory, which only suits a single process (tests,
+# benchmarks, CELERY_TASK_ALWAYS_EAGER).
+CACHE_URL = os.environ.get('CACHE_URL')
+
+# Per-store report rows are cached in a bounded in-process LRU in front of the
+# 'store_reports' cache, which should be shared between workers in production, e.g.
+#   {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://localhost:6379/2"}
+#   {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": "/var/tmp/store_reports"}
+CACHES = {
+    "default": (
+        {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": CACHE_URL} if CACHE_URL
+        else {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    ),
+    "store_reports": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "store_reports",
+        "OPTIONS": {"MAX_ENTRIES": 100000},
+    },
+}
+STORE_REPORT_CACHE_ALIAS = "store_reports"
+STORE_REPORT_CACHE_MAX_BYTES = 32 * 1024 * 1024  # per process
+STORE_REPORT_CACHE_TIMEOUT = 3600
+
+# Rows per chunk when streaming CSVs into the database (bounds ingestion memory)
+INGEST_CHUNK_SIZE = 100000
+# 'auto' uses COPY FROM STDIN on PostgreSQL and executemany INSERTs elsewhere;
+# 'insert' forces executemany
+INGEST_LOADER = 'auto'
+
+# GET /get_report/<id>/events/ (server-sent events) reads the report status from the shared
+# cache this often and closes the stream after REPORT_EVENTS_TIMEOUT seconds (clients reconnect)
+REPORT_EVENTS_POLL_SECONDS = 0.5
+REPORT_EVENTS_TIMEOUT = 300
+
+# GET /stores/<id>/uptime/ serves from a per-process in-memory index of the last week's
+# polls. Ingestion invalidates it through the default cache; the database is also
+# rechecked at most this often
+POLL_INDEX_RECHECK_SECONDS = 30
+
+# Prometheus text endpoint at /metrics/ (report/ingestion counters and stage timings)
+METRICS_ENABLED = True
+
+# Profile each generate_report run: None, 'cprofile' (reports/<id>.prof, open with
+# pstats or snakeviz) or 'pyinstrument' (reports/<id>.profile.html, needs pyinstrument)
+REPORT_PROFILE = None
+
+# generate_report / ingestion emit one JSON line per event on the 'store_monitor' logger
+# (quiet under `manage.py test` unless STORE_MONITOR_LOG_LEVEL is set)
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {
+        "store_monitor": {"handlers": ["console"], "level": os.environ.get(
+            "STORE_MONITOR_LOG_LEVEL", "WARNING" if "test" in sys.argv else "INFO")},
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
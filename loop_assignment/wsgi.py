@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "loop_assignment.settings")
 
 application = get_wsgi_application()
+
+# Load /stores/<id>/uptime/'s in-memory poll index in the background before the first request
+from store_monitor.poll_index import warm_poll_index  # noqa: E402
+
+warm_poll_index()
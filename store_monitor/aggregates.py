@@ -0,0 +1,227 @@
+from datetime import timedelta
+import hashlib
+from itertools import groupby
+from operator import itemgetter
+from django.db import transaction
+from django.db.models import Max, Q, Sum
+from store_monitor.engine import POLL_CHUNK_SIZE, in_store_range, report_row
+from store_monitor.lookups import store_lookups
+from store_monitor.models import StoreStatus, StoreHourlyUptime, StoreUptimeState
+
+# Stores read per poll query (one index range each) and upserted together when folding
+# in new polls
+STORE_BATCH = 400
+
+
+def floor_hour(ts):
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def business_seconds(schedule, start, end):
+    return schedule.seconds_between(start.timestamp(), end.timestamp())
+
+
+def schedule_key(schedule):
+    """Digest of the zone and compiled hours a store's buckets are computed with."""
+    return hashlib.blake2b(repr(schedule.key).encode(), digest_size=12).hexdigest()
+
+
+def _flush(buckets, states):
+    with transaction.atomic():
+        StoreHourlyUptime.objects.bulk_create(
+            buckets, batch_size=2000, update_conflicts=True, unique_fields=['store_id', 'hour_start'],
+            update_fields=['uptime_seconds', 'downtime_seconds', 'carry_in_ts', 'carry_in_active'],
+        )
+        StoreUptimeState.objects.bulk_create(
+            states, batch_size=2000, update_conflicts=True, unique_fields=['store_id'],
+            update_fields=['first_poll_ts', 'first_active', 'last_poll_ts', 'last_active', 'schedule_key'],
+        )
+    buckets.clear()
+    states.clear()
+
+
+# Drop the buckets and state of stores whose schedule changed or that received polls older
+# than their high-water mark (see ingest._import); the next update folds them in again
+def forget_stores(store_ids):
+    with transaction.atomic():
+        for i in range(0, len(store_ids), STORE_BATCH):
+            batch = store_ids[i:i + STORE_BATCH]
+            StoreHourlyUptime.objects.filter(store_id__in=batch).delete()
+            StoreUptimeState.objects.filter(store_id__in=batch).delete()
+
+
+def update_aggregates(store_range=None):
+    """Fold polls newer than each store's high-water mark into the hourly buckets.
+
+    The newest poll per store (an index-only scan) picks the stores with new
+    polls, and each is read from its own high-water mark on. Only the bucket
+    holding a store's previous last poll can already exist, so an update
+    touches new rows plus one row per store. A store whose timezone or business
+    hours changed since its buckets were computed is recomputed from its polls.
+    Polls older than a store's high-water mark are only picked up once its
+    buckets are dropped (ingestion does that for late polls it inserts;
+    otherwise use rebuild_aggregates). Returns the number of polls applied.
+    """
+    schedule_for = store_lookups().schedule
+    keys = {}
+
+    def key_for(store_id):
+        schedule = schedule_for(store_id)
+        key = keys.get(id(schedule))
+        if key is None:
+            key = keys[id(schedule)] = schedule_key(schedule)
+        return key
+
+    states = {s.store_id: s for s in in_store_range(StoreUptimeState.objects, store_range)}
+    changed = sorted(store_id for store_id, state in states.items() if state.schedule_key != key_for(store_id))
+    if changed:
+        forget_stores(changed)
+        for store_id in changed:
+            del states[store_id]
+
+    polls = in_store_range(StoreStatus.objects, store_range)
+    newest = polls.values('store_id').annotate(newest=Max('timestamp_utc')).values_list('store_id', 'newest')
+    pending = sorted(
+        store_id for store_id, newest_ts in newest.iterator(chunk_size=POLL_CHUNK_SIZE)
+        if store_id not in states or newest_ts > states[store_id].last_poll_ts
+    )
+
+    applied = 0
+    changed_buckets, changed_states = [], []
+    for i in range(0, len(pending), STORE_BATCH):
+        batch = pending[i:i + STORE_BATCH]
+        ranges, open_hours = Q(), Q()
+        for store_id in batch:
+            state = states.get(store_id)
+            if state is None:
+                ranges |= Q(store_id=store_id)
+            else:
+                ranges |= Q(store_id=store_id, timestamp_utc__gt=state.last_poll_ts)
+                # The bucket holding the store's current last poll may receive more polls
+                open_hours |= Q(store_id=store_id, hour_start=floor_hour(state.last_poll_ts))
+        existing = {}
+        if open_hours:
+            existing = {(b.store_id, b.hour_start): b for b in StoreHourlyUptime.objects.filter(open_hours)}
+
+        rows = polls.filter(ranges).order_by('store_id', 'timestamp_utc').values_list(
+            'store_id', 'timestamp_utc', 'status')
+        for store_id, group in groupby(rows.iterator(chunk_size=POLL_CHUNK_SIZE), key=itemgetter(0)):
+            state = states.get(store_id)
+            new_polls = [(ts, status == 'active') for _, ts, status in group]
+            if state is None:
+                state = StoreUptimeState(store_id=store_id, first_poll_ts=new_polls[0][0],
+                                         first_active=new_polls[0][1], schedule_key=key_for(store_id))
+                prev_ts, prev_active = None, None
+            else:
+                prev_ts, prev_active = state.last_poll_ts, state.last_active
+
+            schedule = schedule_for(store_id)
+            store_buckets = {}
+            for ts, active in new_polls:
+                hour = floor_hour(ts)
+                bucket = store_buckets.get(hour) or existing.get((store_id, hour))
+                if bucket is None:
+                    bucket = StoreHourlyUptime(store_id=store_id, hour_start=hour,
+                                               carry_in_ts=prev_ts, carry_in_active=prev_active)
+                store_buckets[hour] = bucket
+                if prev_ts is not None:
+                    seconds = business_seconds(schedule, prev_ts, ts)
+                    if prev_active:
+                        bucket.uptime_seconds += seconds
+                    else:
+                        bucket.downtime_seconds += seconds
+                prev_ts, prev_active = ts, active
+
+            state.last_poll_ts, state.last_active = prev_ts, prev_active
+            changed_buckets.extend(store_buckets.values())
+            changed_states.append(state)
+            applied += len(new_polls)
+        _flush(changed_buckets, changed_states)
+    return applied
+
+
+# Drop every bucket and state and fold all polls in from scratch
+def rebuild_aggregates():
+    with transaction.atomic():
+        StoreHourlyUptime.objects.all().delete()
+        StoreUptimeState.objects.all().delete()
+    return update_aggregates()
+
+
+def _boundary_polls(hour_start, hour_end):
+    """Polls of one boundary hour per store, preceded by the bucket's carry-in poll."""
+    carry = {
+        store_id: (ts, active)
+        for store_id, ts, active in StoreHourlyUptime.objects.filter(
+            hour_start=hour_start, carry_in_ts__isnull=False
+        ).values_list('store_id', 'carry_in_ts', 'carry_in_active')
+    }
+    rows = StoreStatus.objects.filter(timestamp_utc__gte=hour_start, timestamp_utc__lt=hour_end).order_by(
+        'store_id', 'timestamp_utc'
+    ).values_list('store_id', 'timestamp_utc', 'status')
+    polls = {}
+    for store_id, group in groupby(rows.iterator(chunk_size=POLL_CHUNK_SIZE), key=itemgetter(0)):
+        polls[store_id] = ([carry[store_id]] if store_id in carry else []) + [
+            (ts, status == 'active') for _, ts, status in group
+        ]
+    return polls
+
+
+def incremental_report_rows(now_utc, last_hour, last_day, last_week):
+    """Report rows from the hourly buckets instead of raw polls.
+
+    Same rules as compute_uptime_downtime: an interval counts when the poll
+    closing it is after the window start. Whole hours after the window start
+    come from summing at most 168 buckets in the DB; the hour containing the
+    window start is corrected from its raw polls (and carry-in), then the open
+    interval from the last poll to now and any lead-in before the first poll
+    are added.
+    """
+    update_aggregates()
+    window_starts = [last_hour, last_day, last_week]
+    hours = [(floor_hour(ps), floor_hour(ps) + timedelta(hours=1)) for ps in window_starts]
+
+    sums = {}
+    for w, (_, whole_from) in enumerate(hours):
+        sums[f'up_{w}'] = Sum('uptime_seconds', filter=Q(hour_start__gte=whole_from), default=0)
+        sums[f'down_{w}'] = Sum('downtime_seconds', filter=Q(hour_start__gte=whole_from), default=0)
+    bucket_sums = {
+        row['store_id']: row
+        for row in StoreHourlyUptime.objects.filter(hour_start__gte=min(h for _, h in hours))
+        .values('store_id').annotate(**sums)
+    }
+    boundary = [_boundary_polls(start, end) for start, end in hours]
+    schedule_for = store_lookups().schedule
+
+    for state in StoreUptimeState.objects.order_by('store_id').iterator(chunk_size=POLL_CHUNK_SIZE):
+        schedule = schedule_for(state.store_id)
+        sums_row = bucket_sums.get(state.store_id, {})
+        tail = business_seconds(schedule, state.last_poll_ts, now_utc)
+        uptime, downtime = [], []
+        for w, window_start in enumerate(window_starts):
+            up, down = sums_row.get(f'up_{w}', 0), sums_row.get(f'down_{w}', 0)
+            if state.last_active:
+                up += tail
+            else:
+                down += tail
+
+            # Polls in the window-start hour that close an interval inside the window
+            polls = boundary[w].get(state.store_id, [])
+            for (prev_ts, prev_active), (ts, _) in zip(polls, polls[1:]):
+                if ts > window_start:
+                    seconds = business_seconds(schedule, prev_ts, ts)
+                    if prev_active:
+                        up += seconds
+                    else:
+                        down += seconds
+
+            # Lead-in: first poll inside the window holds from the window start
+            if state.first_poll_ts > window_start:
+                seconds = business_seconds(schedule, window_start, state.first_poll_ts)
+                if state.first_active:
+                    up += seconds
+                else:
+                    down += seconds
+            uptime.append(up / 60)
+            downtime.append(down / 60)
+        yield report_row(state.store_id, *uptime, *downtime)
@@ -0,0 +1,84 @@
+import base64
+import binascii
+import json
+from functools import reduce
+from operator import or_
+from django.db.models import Q
+from rest_framework.utils.encoders import JSONEncoder
+from store_monitor.engine import POLL_CHUNK_SIZE
+from store_monitor.models import BusinessHour, StoreStatus, Timezone
+
+# Browsable tables: name -> (model, output fields, keyset, time field). The keyset
+# is the table's unique constraint, so it orders rows totally and pages are read
+# straight off its index.
+TABLES = {
+    'timezone': (Timezone, ['store_id', 'timezone_str'], ['store_id', 'timezone_str'], None),
+    'businesshour': (
+        BusinessHour,
+        ['store_id', 'day_of_week', 'start_time_local', 'end_time_local'],
+        ['store_id', 'day_of_week', 'start_time_local', 'end_time_local'],
+        None,
+    ),
+    'storestatus': (StoreStatus, ['store_id', 'timestamp_utc', 'status'], ['store_id', 'timestamp_utc'],
+                    'timestamp_utc'),
+}
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(row, keyset):
+    values = json.dumps([row[name] for name in keyset], cls=JSONEncoder)
+    return base64.urlsafe_b64encode(values.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, keyset):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor("Malformed cursor")
+    if not isinstance(values, list) or len(values) != len(keyset):
+        raise InvalidCursor("Cursor does not match this table")
+    return values
+
+
+def after(keyset, values):
+    """Rows strictly after `values` in keyset order: (a > x) OR (a = x AND b > y) OR ..."""
+    return reduce(or_, (
+        Q(**dict(zip(keyset[:i], values[:i])), **{f'{name}__gt': values[i]}) for i, name in enumerate(keyset)
+    ))
+
+
+def table_rows(table, store_id=None, since=None, until=None):
+    """values() queryset for `table` in keyset order, filtered by store and time window."""
+    model, fields, keyset, time_field = TABLES[table]
+    rows = model.objects.all()
+    if store_id is not None:
+        rows = rows.filter(store_id=store_id)
+    if since is not None:
+        rows = rows.filter(**{f'{time_field}__gte': since})
+    if until is not None:
+        rows = rows.filter(**{f'{time_field}__lt': until})
+    return rows.order_by(*keyset).values(*fields)
+
+
+def table_page(table, limit=DEFAULT_PAGE_SIZE, cursor=None, **filters):
+    """One page of rows after `cursor`. Returns (rows, next cursor or None)."""
+    _, _, keyset, _ = TABLES[table]
+    rows = table_rows(table, **filters)
+    if cursor:
+        rows = rows.filter(after(keyset, decode_cursor(cursor, keyset)))
+    page = list(rows[:limit + 1])
+    if len(page) <= limit:
+        return page, None
+    return page[:limit], encode_cursor(page[limit - 1], keyset)
+
+
+def ndjson_lines(table, **filters):
+    """Every matching row as one JSON line, read in chunks (constant memory)."""
+    encoder = JSONEncoder()
+    for row in table_rows(table, **filters).iterator(chunk_size=POLL_CHUNK_SIZE):
+        yield encoder.encode(row) + '\n'
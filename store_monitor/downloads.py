@@ -0,0 +1,127 @@
+import gzip
+import os
+import re
+import shutil
+import tempfile
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from store_monitor.report_formats import DEFAULT_FORMAT, format_extension
+
+# Bytes per read when streaming a report; memory per request stays at one chunk
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def report_path(report_id, fmt=DEFAULT_FORMAT):
+    return os.path.join(settings.BASE_DIR, 'reports', f'{report_id}.{format_extension(fmt)}')
+
+
+def gzip_path(path):
+    """Path of a gzip copy of `path`, compressed on first use.
+
+    Compression streams file to a uniquely named temp file (one per request,
+    even between threads of one process) that is renamed into place, so
+    concurrent requests never serve a partial copy. Reports are write-once,
+    but a stale copy (older than the CSV) is rebuilt anyway.
+    """
+    gz = path + '.gz'
+    if not os.path.exists(gz) or os.path.getmtime(gz) < os.path.getmtime(path):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(gz), suffix='.tmp')
+        try:
+            with open(path, 'rb') as src, os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+            os.replace(tmp, gz)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    return gz
+
+
+def accepts_gzip(request):
+    for coding in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = coding.partition(';')
+        if name.strip().lower() == 'gzip':
+            q = params.strip().lower()
+            try:
+                return not q.startswith('q=') or float(q[2:]) > 0
+            except ValueError:
+                return False
+    return False
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single 'bytes=' range.
+
+    Returns None to serve the whole file (no header, or a form we don't
+    support such as multiple ranges) and False when the range can't be satisfied.
+    """
+    match = RANGE_RE.match(header.replace(' ', '')) if header else None
+    if match is None or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_file(request, path, filename, content_type='text/csv', compressible=True):
+    """Stream `path` with gzip negotiation, conditional GETs and byte ranges.
+
+    Each encoding is its own representation with its own ETag, and ranges
+    apply to the representation being sent (the .gz bytes when gzipped).
+    Files that are already compressed are sent as-is (compressible=False).
+    """
+    encoding = None
+    if compressible and accepts_gzip(request):
+        path, encoding = gzip_path(path), 'gzip'
+    stat = os.stat(path)
+    etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}{"-gz" if encoding else ""}"'
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), stat.st_size)
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if if_range and if_range not in (etag, http_date(last_modified)):
+            byte_range = None
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+        elif byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(_read_range(path, start, end - start + 1),
+                                             status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Length'] = end - start + 1
+        else:
+            # FileResponse hands the open file to wsgi.file_wrapper (sendfile) when the server has one
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+            response.block_size = CHUNK_SIZE
+        if response.status_code != 416:
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+            if encoding:
+                response['Content-Encoding'] = encoding
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
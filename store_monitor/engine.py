@@ -0,0 +1,195 @@
+from array import array
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+from operator import itemgetter
+import re
+import pytz
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from store_monitor.lookups import DEFAULT_TIMEZONE, store_lookups
+from store_monitor.models import StoreStatus, StoreDailySummary, BusinessHour, Timezone
+
+POLL_CHUNK_SIZE = 20000
+
+# Report windows as '<n><unit>' (m, h, d or w). The default three keep their
+# original column names; windows up to an hour are reported in minutes, longer
+# ones in hours.
+DEFAULT_WINDOWS = ['1h', '1d', '7d']
+WINDOW_NAMES = {'1h': 'hour', '1d': 'day', '7d': 'week'}
+WINDOW_RE = re.compile(r'^([1-9]\d*)([mhdw])$')
+WINDOW_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+
+
+class StorePolls:
+    """One store's polls, oldest first, as epoch seconds (array('d')) and statuses (bytearray, 1 = active).
+
+    About 9 bytes per poll instead of a (datetime, bool) tuple per poll. Indexing
+    and iteration still give (datetime, active) pairs for code that wants them.
+    """
+
+    __slots__ = ('epochs', 'active')
+
+    def __init__(self, epochs=None, active=None):
+        self.epochs = array('d') if epochs is None else epochs
+        self.active = bytearray() if active is None else active
+
+    @classmethod
+    def from_pairs(cls, polls):
+        compact = cls()
+        for ts, active in polls:
+            compact.append(ts.timestamp(), active)
+        return compact
+
+    def append(self, epoch, active):
+        self.epochs.append(epoch)
+        self.active.append(active)
+
+    def __len__(self):
+        return len(self.epochs)
+
+    def __getitem__(self, i):
+        return datetime.fromtimestamp(self.epochs[i], timezone.utc), bool(self.active[i])
+
+    def __iter__(self):
+        for epoch, active in zip(self.epochs, self.active):
+            yield datetime.fromtimestamp(epoch, timezone.utc), bool(active)
+
+    def __eq__(self, other):
+        return isinstance(other, StorePolls) and self.epochs == other.epochs and self.active == other.active
+
+
+# Business minutes -> CSV row (hour in minutes, day/week in hours). Values are
+# snapped to 1e-6 first so float noise can't flip a .5 tie between engines.
+def report_row(store_id, up_hour, up_day, up_week, down_hour, down_day, down_week):
+    return [
+        store_id,
+        round(round(up_hour, 6)), round(round(up_day / 60, 6)), round(round(up_week / 60, 6)),
+        round(round(down_hour, 6)), round(round(down_day / 60, 6)), round(round(down_week / 60, 6))
+    ]
+
+
+def window_length(window):
+    match = WINDOW_RE.match(window)
+    if match is None:
+        raise ValueError(f"Invalid window {window!r}: expected e.g. 30m, 1h, 3d or 2w")
+    return timedelta(**{WINDOW_UNITS[match.group(2)]: int(match.group(1))})
+
+
+def window_header(windows):
+    names = [WINDOW_NAMES.get(w, w) for w in windows]
+    return ['store_id'] + [f'uptime_last_{n}' for n in names] + [f'downtime_last_{n}' for n in names]
+
+
+# Like report_row for any windows: `minutes` is uptime per window, then downtime per window
+def window_row(store_id, minutes, windows):
+    scale = [1 if window_length(w) <= timedelta(hours=1) else 60 for w in windows] * 2
+    return [store_id] + [round(round(m / s, 6)) for m, s in zip(minutes, scale)]
+
+
+# Restrict a queryset to an inclusive (first, last) store_id range (None = all stores)
+def in_store_range(queryset, store_range):
+    if store_range is None:
+        return queryset.all()
+    first, last = store_range
+    return queryset.filter(store_id__gte=first, store_id__lte=last)
+
+
+# The given store ids that exist anywhere in the data: polls (live or archived), a
+# timezone or business hours. Each table answers from its store_id index.
+def known_stores(store_ids):
+    known = set()
+    for model in (StoreStatus, StoreDailySummary, Timezone, BusinessHour):
+        missing = set(store_ids) - known
+        if not missing:
+            break
+        known.update(model.objects.filter(store_id__in=missing).values_list('store_id', flat=True).distinct())
+    return known
+
+
+def prior_poll_ids(since, store_range=None, store_ids=None):
+    """Ids of each store's latest poll at or before `since`, as a subquery.
+
+    The status a store carries into a window is the last poll before it; the
+    MAX per store is answered from the (store_id, timestamp_utc) index.
+    `store_ids` limits it to those stores.
+    """
+    qn = connection.ops.quote_name
+    table, store, ts = qn(StoreStatus._meta.db_table), qn('store_id'), qn('timestamp_utc')
+    where, params = f"{ts} <= %s", [connection.ops.adapt_datetimefield_value(since)]
+    if store_range is not None:
+        where += f" AND {store} >= %s AND {store} <= %s"
+        params += list(store_range)
+    if store_ids is not None:
+        where += f" AND {store} IN ({', '.join(['%s'] * len(store_ids))})" if store_ids else " AND 1 = 0"
+        params += list(store_ids)
+    return RawSQL(
+        f"SELECT s.{qn('id')} FROM {table} s JOIN (SELECT {store}, MAX({ts}) AS last_ts FROM {table} "
+        f"WHERE {where} GROUP BY {store}) p ON p.{store} = s.{store} AND p.last_ts = s.{ts}",
+        params,
+    )
+
+
+def report_polls(store_range=None, since=None, until=None, store_ids=None):
+    """(store_id, timestamp_utc, status) rows sorted by store and time.
+
+    With `since` (the start of the longest report window) only polls after it
+    are read, plus each store's latest poll at or before it: older polls can't
+    change any window. Stores whose polls all predate `since` still appear.
+    `until` drops polls after a point-in-time report's "now" and `store_ids`
+    reads only those stores, both straight off the (store_id, timestamp_utc) index.
+    """
+    polls = in_store_range(StoreStatus.objects, store_range)
+    if store_ids is not None:
+        polls = polls.filter(store_id__in=store_ids)
+    if until is not None:
+        polls = polls.filter(timestamp_utc__lte=until)
+    columns = ('store_id', 'timestamp_utc', 'status')
+    if since is None:
+        return polls.order_by('store_id', 'timestamp_utc').values_list(*columns)
+    window = polls.filter(timestamp_utc__gt=since).values_list(*columns)
+    prior = polls.filter(pk__in=prior_poll_ids(since, store_range, store_ids)).values_list(*columns)
+    return window.union(prior, all=True).order_by('store_id', 'timestamp_utc')
+
+
+# Stream polls once (see report_polls), sorted by (store_id, timestamp_utc), grouped
+# per store into StorePolls
+def iter_store_polls(store_range=None, chunk_size=POLL_CHUNK_SIZE, since=None):
+    rows = report_polls(store_range, since)
+    for store_id, group in groupby(rows.iterator(chunk_size=chunk_size), key=itemgetter(0)):
+        polls = StorePolls()
+        for _, ts, status in group:
+            polls.append(ts.timestamp(), status == 'active')
+        yield store_id, polls
+
+
+# Single pass: (store_id, tz, business_hours, polls) for every store, with
+# business_hours already compiled (shared WeeklySchedules from lookups.py)
+def iter_store_inputs(store_range=None, since=None):
+    lookups = store_lookups()
+    for store_id, polls in iter_store_polls(store_range, since=since):
+        schedule = lookups.schedule(store_id)
+        yield store_id, schedule.tz, schedule, polls
+
+
+# Original path: three queries per store. Kept for benchmarks and comparison.
+def iter_store_inputs_per_store(store_range=None, since=None):
+    store_ids = in_store_range(StoreStatus.objects, store_range).order_by('store_id').values_list('store_id', flat=True).distinct()
+    for store_id in store_ids:
+        tz_obj = Timezone.objects.filter(store_id=store_id).first()
+        tz = pytz.timezone(tz_obj.timezone_str if tz_obj else DEFAULT_TIMEZONE)
+
+        hours = BusinessHour.objects.filter(store_id=store_id)
+        # No rows: open all day
+        business_hours = {h.day_of_week: (h.start_time_local, h.end_time_local) for h in hours} or None
+
+        polls = StoreStatus.objects.filter(store_id=store_id).order_by('timestamp_utc').values_list('timestamp_utc', 'status')
+        if since is not None:
+            prior = polls.filter(timestamp_utc__lte=since).last()
+            polls = ([prior] if prior else []) + list(polls.filter(timestamp_utc__gt=since))
+        yield store_id, tz, business_hours, StorePolls.from_pairs((ts, status == 'active') for ts, status in polls)
+
+
+REPORT_ENGINES = {
+    'columnar': iter_store_inputs,
+    'per_store': iter_store_inputs_per_store,
+}
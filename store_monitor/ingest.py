@@ -0,0 +1,433 @@
+import csv
+import hashlib
+import io
+import os
+import threading
+import time as timer
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models.constants import OnConflict
+from store_monitor.aggregates import forget_stores, update_aggregates
+from store_monitor.instrumentation import Metrics, log_event
+from store_monitor.models import StoreStatus, StoreUptimeState, BusinessHour, Timezone, IngestionWatermark
+
+DATA_PATH = "store-monitoring-data"
+DEFAULT_CHUNK_SIZE = 100000
+JOB_TIMEOUT = 24 * 3600
+COPY_NULL = '\\N'
+DATA_GENERATION_KEY = 'data_generation'
+
+
+class IngestProgress:
+    """Ingestion job status, written by the worker into the shared default cache for any web process.
+
+    Per-file counters are updated after each chunk is parsed and inserted;
+    throughput and ETA are derived from bytes read across all files.
+    """
+
+    def __init__(self, job_id):
+        self.key = f"ingest_job:{job_id}"
+        self.lock = threading.Lock()
+        self.started = None
+        self.status = {
+            'job_id': job_id, 'state': 'queued', 'current_files': [], 'rows_parsed': 0, 'rows_inserted': 0,
+            'rows_skipped': 0, 'rows_late': 0,
+            'rows_per_sec': 0, 'eta_seconds': None, 'files': {}, 'missing': [], 'errors': [],
+        }
+
+    @staticmethod
+    def get(job_id):
+        return cache.get(f"ingest_job:{job_id}")
+
+    def _save(self):
+        files = self.status['files'].values()
+        self.status['rows_parsed'] = sum(f['rows_parsed'] for f in files)
+        self.status['rows_inserted'] = sum(f['rows_inserted'] for f in files)
+        self.status['rows_skipped'] = sum(f['rows_skipped'] for f in files)
+        # Inserted polls older than their store's aggregates (counted once a file is done)
+        self.status['rows_late'] = sum(f.get('late', 0) for f in files)
+        if self.started is not None:
+            elapsed = timer.perf_counter() - self.started
+            bytes_read = sum(f['bytes_read'] for f in files)
+            bytes_total = sum(f['bytes_total'] for f in files)
+            if elapsed and bytes_read:
+                self.status['rows_per_sec'] = round(self.status['rows_inserted'] / elapsed)
+                self.status['eta_seconds'] = round((bytes_total - bytes_read) * elapsed / bytes_read, 1)
+        cache.set(self.key, self.status, timeout=JOB_TIMEOUT)
+
+    def _update(self, state=None, **changes):
+        with self.lock:
+            if state is not None:
+                self.status['state'] = state
+            self.status.update(changes)
+            self._save()
+
+    def queue(self):
+        self._update()
+
+    def start(self):
+        self.started = timer.perf_counter()
+        self._update('running')
+
+    def file_started(self, filename, bytes_total):
+        with self.lock:
+            self.status['current_files'].append(filename)
+            self.status['files'][filename] = {
+                'rows_parsed': 0, 'rows_inserted': 0, 'rows_skipped': 0, 'bytes_read': 0, 'bytes_total': bytes_total,
+            }
+            self._save()
+
+    def chunk_parsed(self, filename, rows):
+        with self.lock:
+            self.status['files'][filename]['rows_parsed'] += rows
+            self._save()
+
+    def chunk_inserted(self, filename, inserted, skipped, bytes_read):
+        with self.lock:
+            self.status['files'][filename]['rows_inserted'] += inserted
+            self.status['files'][filename]['rows_skipped'] += skipped
+            self.status['files'][filename]['bytes_read'] = bytes_read
+            self._save()
+
+    def file_done(self, filename, stats):
+        with self.lock:
+            self.status['current_files'].remove(filename)
+            self.status['files'][filename].update(stats, bytes_read=self.status['files'][filename]['bytes_total'])
+            self._save()
+
+    def finish(self, missing):
+        self._update('complete', missing=missing, current_files=[], eta_seconds=0)
+
+    def fail(self, error):
+        with self.lock:
+            self.status['errors'].append(error)
+        self._update('failed', current_files=[])
+
+
+# Counter bumped whenever ingestion changes the data, so in-memory copies of it
+# (poll_index.PollIndex) know to reload; every process reads it from the shared default cache
+def data_generation():
+    return cache.get(DATA_GENERATION_KEY, 0)
+
+
+def bump_data_generation():
+    if not cache.add(DATA_GENERATION_KEY, 1, timeout=None):
+        cache.incr(DATA_GENERATION_KEY)
+
+
+def _chunk_size():
+    return getattr(settings, 'INGEST_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+# 'copy' (PostgreSQL COPY FROM STDIN) or 'insert' (executemany, any database)
+def _loader():
+    loader = getattr(settings, 'INGEST_LOADER', 'auto')
+    if loader == 'auto':
+        return 'copy' if connection.vendor == 'postgresql' else 'insert'
+    if loader == 'copy' and connection.vendor != 'postgresql':
+        raise ValueError(f"INGEST_LOADER 'copy' needs PostgreSQL, not {connection.vendor}")
+    return loader
+
+
+def _bulk_insert(model, columns, rows):
+    """Insert plain tuples in one transaction, skipping conflicting rows.
+
+    Same semantics as bulk_create(ignore_conflicts=True) but builds no model
+    instances. Returns the number of rows actually inserted.
+    """
+    if _loader() == 'copy':
+        return _copy_insert(model, columns, rows)
+    return _executemany_insert(model, columns, rows)
+
+
+def _copy_buffer(rows):
+    """Rows as CSV for COPY ... (FORMAT csv, NULL '\\N'), so None and '' stay distinct."""
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(
+        tuple(COPY_NULL if value is None else value for value in row) for row in rows
+    )
+    buffer.seek(0)
+    return buffer
+
+
+def _copy_insert(model, columns, rows):
+    """COPY the chunk into a temporary staging table, then move it over.
+
+    COPY cannot skip conflicting rows itself, so the staged rows go in with
+    one INSERT ... SELECT ... ON CONFLICT DO NOTHING. The staging table is
+    dropped when the chunk's transaction commits.
+    """
+    ops = connection.ops
+    table = ops.quote_name(model._meta.db_table)
+    staging = ops.quote_name(f'{model._meta.db_table}_staging')
+    column_list = ", ".join(ops.quote_name(model._meta.get_field(c).column) for c in columns)
+    copy_sql = f"COPY {staging} ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')"
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {staging} ON COMMIT DROP AS SELECT {column_list} FROM {table} WITH NO DATA"
+        )
+        buffer = _copy_buffer(rows)
+        raw = cursor.cursor
+        if hasattr(raw, 'copy_expert'):
+            # psycopg2
+            raw.copy_expert(copy_sql, buffer)
+        else:
+            # psycopg 3
+            with raw.copy(copy_sql) as copy:
+                copy.write(buffer.getvalue())
+        cursor.execute(
+            f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {staging} ON CONFLICT DO NOTHING"
+        )
+        return max(cursor.rowcount, 0)
+
+
+def _executemany_insert(model, columns, rows):
+    """One executemany of a column-ordered INSERT ... ON CONFLICT DO NOTHING (or the backend's equivalent)."""
+    ops = connection.ops
+    fields = [model._meta.get_field(c) for c in columns]
+    sql = "%s %s (%s) VALUES (%s) %s" % (
+        ops.insert_statement(on_conflict=OnConflict.IGNORE),
+        ops.quote_name(model._meta.db_table),
+        ", ".join(ops.quote_name(f.column) for f in fields),
+        ", ".join(["%s"] * len(fields)),
+        ops.on_conflict_suffix_sql(fields, OnConflict.IGNORE, None, None),
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+        return max(cursor.rowcount, 0)
+
+
+def _parse_timestamps(values):
+    import pandas as pd
+    return pd.to_datetime(values.str.replace(' UTC', '', regex=False), utc=True, format='ISO8601')
+
+
+# Timestamps as the text Django stores/compares ('YYYY-MM-DD HH:MM:SS[.ffffff]', UTC)
+def _db_timestamps(ts):
+    return ts.dt.strftime('%Y-%m-%d %H:%M:%S.%f').str.replace(r'\.000000$', '', regex=True)
+
+
+DIGEST_BLOCK = 1 << 20
+
+
+def _digest_from(f, offset, digest, end=None):
+    f.seek(offset)
+    remaining = None if end is None else end - offset
+    while remaining is None or remaining > 0:
+        block = f.read(DIGEST_BLOCK if remaining is None else min(DIGEST_BLOCK, remaining))
+        if not block:
+            break
+        digest.update(block)
+        if remaining is not None:
+            remaining -= len(block)
+    return digest
+
+
+def _appended_offset(f, mark, size):
+    """(offset, digest) to resume a source file from.
+
+    The offset is the previous import's size when the file still starts with
+    exactly the bytes imported then, ending on a line break (rows were only
+    appended); otherwise 0, to re-read it all. `digest` covers the bytes
+    before the offset.
+    """
+    if mark and mark.digest and 0 < mark.file_size <= size:
+        f.seek(mark.file_size - 1)
+        if f.read(1) == b'\n':
+            digest = _digest_from(f, 0, hashlib.blake2b(digest_size=16), mark.file_size)
+            if digest.hexdigest() == mark.digest:
+                return mark.file_size, digest
+    return 0, hashlib.blake2b(digest_size=16)
+
+
+# CSV chunks from `offset` on (with the file's header row for column names)
+def _read_chunks(f, offset, size, chunksize):
+    import pandas as pd
+    f.seek(0)
+    if not offset:
+        return pd.read_csv(f, chunksize=chunksize, dtype=str)
+    names = next(csv.reader([f.readline().decode()]))
+    if offset >= size:
+        return []
+    f.seek(offset)
+    return pd.read_csv(f, chunksize=chunksize, dtype=str, header=None, names=names)
+
+
+def _import(path, model, columns, transform, chunksize=None, progress=None, full=False, timestamp=None,
+            metrics=None):
+    """Stream a CSV in chunks through `transform` into `model`. Returns import stats.
+
+    Rows already in the table are skipped by the model's unique constraint (and
+    counted as skipped), so rows that arrive late or out of order are never
+    lost. The source's IngestionWatermark lets a re-import skip rows it has
+    already seen: an unchanged file is not read at all, and a file that was
+    only appended to (same leading bytes, see _appended_offset) is read from
+    where the last import stopped. Any other change re-reads the whole file.
+    `full` ignores the watermark.
+
+    Polls (rows with a `timestamp` column) at or before their store's hourly
+    aggregate high-water mark (StoreUptimeState.last_poll_ts) are inserted
+    separately. Any of them that are new ('late' in the stats) get their
+    stores' aggregates dropped, so the next update_aggregates recomputes those
+    stores. Reading and transforming chunks is timed as the 'parse' stage of
+    `metrics`, inserting as 'insert'.
+    """
+    # pandas is only needed here, so importing this module (e.g. from the web views) stays cheap
+    import pandas as pd
+
+    metrics = metrics or Metrics()
+    filename = os.path.basename(path)
+    start = timer.perf_counter()
+    late, late_stores = 0, set()
+    with open(path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        if progress:
+            progress.file_started(filename, st.st_size)
+        mark = None if full else IngestionWatermark.objects.filter(source=filename).first()
+        if mark and (mark.file_size, mark.file_mtime) == (st.st_size, st.st_mtime):
+            rows, inserted, latest = mark.rows, 0, mark.max_timestamp
+        else:
+            with metrics.stage('parse'):
+                offset, digest = _appended_offset(f, mark, st.st_size)
+            if offset:
+                # Only appended to: the rows already imported are skipped unread
+                latest, rows, inserted = mark.max_timestamp, mark.rows, 0
+                if progress:
+                    progress.chunk_inserted(filename, 0, mark.rows, offset)
+            else:
+                latest = None
+                rows = inserted = 0
+            aggregated = dict(StoreUptimeState.objects.values_list('store_id', 'last_poll_ts')) if timestamp else {}
+            chunks = metrics.timed('parse', _read_chunks(f, offset, st.st_size, chunksize or _chunk_size()))
+            for chunk in chunks:
+                parsed = len(chunk)
+                parse_start = timer.perf_counter()
+                old = None
+                if timestamp:
+                    ts = _parse_timestamps(chunk[timestamp])
+                    if len(ts):
+                        newest = ts.max().to_pydatetime()
+                        latest = newest if latest is None else max(latest, newest)
+                    chunk = chunk.assign(**{timestamp: _db_timestamps(ts)})
+                    if aggregated:
+                        old = (ts <= pd.to_datetime(chunk['store_id'].map(aggregated), utc=True)).to_numpy()
+                if old is not None and old.any():
+                    parts = [(chunk[~old], False), (chunk[old], True)]
+                else:
+                    parts = [(chunk, False)]
+                parts = [(part, transform(part), is_old) for part, is_old in parts if len(part)]
+                metrics.add('parse', timer.perf_counter() - parse_start)
+                if progress:
+                    progress.chunk_parsed(filename, parsed)
+                added = 0
+                with metrics.stage('insert'):
+                    for part, values, is_old in parts:
+                        count = _bulk_insert(model, columns, zip(*(values[c] for c in columns)))
+                        added += count
+                        if is_old and count:
+                            late += count
+                            late_stores.update(part['store_id'])
+                rows += parsed
+                inserted += added
+                if progress:
+                    progress.chunk_inserted(filename, added, parsed - added, f.tell())
+            if late_stores:
+                forget_stores(sorted(late_stores))
+                log_event('ingest_late_polls', file=filename, polls=late, stores=len(late_stores))
+            with metrics.stage('parse'):
+                _digest_from(f, offset, digest)
+            IngestionWatermark.objects.update_or_create(source=filename, defaults={
+                'file_size': st.st_size, 'file_mtime': st.st_mtime, 'rows': rows, 'max_timestamp': latest,
+                'digest': digest.hexdigest(),
+            })
+    seconds = timer.perf_counter() - start
+    stats = {
+        'file': filename,
+        'rows': rows,
+        'inserted': inserted,
+        'skipped': rows - inserted,
+        'late': late,
+        'seconds': round(seconds, 3),
+        'rows_per_sec': round(rows / seconds) if seconds else rows,
+    }
+    if progress:
+        progress.file_done(filename, stats)
+    return stats
+
+
+def import_timezones(path, chunksize=None, progress=None, full=False, metrics=None):
+    return _import(path, Timezone, ['store_id', 'timezone_str'], lambda chunk: chunk, chunksize, progress, full,
+                   metrics=metrics)
+
+
+def import_business_hours(path, chunksize=None, progress=None, full=False, metrics=None):
+    def transform(chunk):
+        return {
+            'store_id': chunk['store_id'],
+            'day_of_week': chunk['dayOfWeek'].astype(int),
+            'start_time_local': chunk['start_time_local'],
+            'end_time_local': chunk['end_time_local'],
+        }
+    return _import(path, BusinessHour, ['store_id', 'day_of_week', 'start_time_local', 'end_time_local'],
+                   transform, chunksize, progress, full, metrics=metrics)
+
+
+def import_store_status(path, chunksize=None, progress=None, full=False, metrics=None):
+    return _import(path, StoreStatus, ['store_id', 'timestamp_utc', 'status'], lambda chunk: chunk,
+                   chunksize, progress, full, timestamp='timestamp_utc', metrics=metrics)
+
+
+IMPORTERS = [
+    ('timezones.csv', import_timezones),
+    ('menu_hours.csv', import_business_hours),
+    ('store_status.csv', import_store_status),
+]
+
+
+# Files go to different tables, so they can load concurrently, except on
+# SQLite where concurrent writers just wait on the database lock
+def _parallel_safe():
+    return connection.vendor != 'sqlite'
+
+
+def _run_in_thread(importer, path, chunksize, progress, full, metrics):
+    try:
+        return importer(path, chunksize, progress, full, metrics)
+    finally:
+        connection.close()
+
+
+def import_all(data_path=DATA_PATH, chunksize=None, progress=None, full=False, metrics=None):
+    """Import every source file present in data_path. Returns (stats, missing files).
+
+    Safe to re-run: only rows not already ingested are inserted (see _import).
+    Stage times in `metrics` add up across files, so with parallel loading they
+    can exceed the wall time; updating the hourly aggregates is 'aggregate'.
+    """
+    metrics = metrics or Metrics()
+    present, missing = [], []
+    for filename, importer in IMPORTERS:
+        path = os.path.join(data_path, filename)
+        if os.path.exists(path):
+            present.append((importer, path))
+        else:
+            missing.append(filename)
+
+    if len(present) > 1 and _parallel_safe():
+        with ThreadPoolExecutor(max_workers=len(present)) as pool:
+            futures = [
+                pool.submit(_run_in_thread, importer, path, chunksize, progress, full, metrics)
+                for importer, path in present
+            ]
+            stats = [future.result() for future in futures]
+    else:
+        stats = [importer(path, chunksize, progress, full, metrics) for importer, path in present]
+
+    if any(s['inserted'] for s in stats):
+        # New polls, or new timezones/hours (their stores' buckets are recomputed)
+        with metrics.stage('aggregate'):
+            update_aggregates()
+        bump_data_generation()
+    return stats, missing
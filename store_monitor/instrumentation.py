@@ -0,0 +1,188 @@
+import cProfile
+import json
+import logging
+import threading
+import time as timer
+from collections import Counter
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+logger = logging.getLogger('store_monitor')
+
+# Label values listed on /metrics/ even before anything was counted
+REPORT_ENGINE_NAMES = ('columnar', 'per_store', 'vectorized', 'pollstore', 'incremental')
+REPORT_STAGES = ('query', 'compute', 'serialize', 'write')
+INGEST_STAGES = ('parse', 'insert', 'aggregate')
+
+
+def log_event(event, **fields):
+    """Log one JSON object per line so log shippers can index the fields."""
+    logger.info(json.dumps({'event': event, **fields}, default=str))
+
+
+class Metrics:
+    """Stage timers, counters and an ORM query count for one report or ingestion run.
+
+    Within a thread stages are disjoint, so their times add up to at most the
+    run's wall time. Safe to share between the ingestion threads.
+    """
+
+    def __init__(self):
+        self.seconds = Counter()
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.seconds[stage] += seconds
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counts[name] += n
+
+    @contextmanager
+    def stage(self, name):
+        start = timer.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, timer.perf_counter() - start)
+
+    def timed(self, stage, iterable):
+        """Iterate `iterable`, charging the time spent producing each item to `stage`."""
+        iterator = iter(iterable)
+        while True:
+            start = timer.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.add(stage, timer.perf_counter() - start)
+            yield item
+
+    # Count every query this thread's connection runs inside the block
+    @contextmanager
+    def queries(self):
+        def count_query(execute, sql, params, many, context):
+            self.count('queries')
+            return execute(sql, params, many, context)
+        with connection.execute_wrapper(count_query):
+            yield
+
+    def as_dict(self):
+        return {'stages': {name: round(s, 6) for name, s in self.seconds.items()}, **self.counts}
+
+
+# Prometheus-style counters, kept in the shared default cache so every web and worker
+# process adds to the same totals (like the report progress counters), and /metrics/
+# from any web process reads them. Seconds are stored in microseconds.
+def _metric_key(name, labels):
+    return f"metrics:{name}:" + ','.join(f'{k}={v}' for k, v in sorted(labels.items()))
+
+
+def increment(name, value=1, **labels):
+    if name.endswith('_seconds_total'):
+        value = round(value * 10**6)
+    if not value:
+        return
+    key = _metric_key(name, labels)
+    # add + incr rather than incr falling back to set, which loses a concurrent first add
+    cache.add(key, 0, timeout=None)
+    cache.incr(key, value)
+
+
+def record_report(engine, state, metrics):
+    increment('store_monitor_reports_total', engine=engine, state=state)
+    for stage, seconds in metrics.seconds.items():
+        increment('store_monitor_report_stage_seconds_total', seconds, stage=stage)
+    for name in ('queries', 'stores', 'polls'):
+        increment(f'store_monitor_report_{name}_total', metrics.counts[name])
+
+
+def record_ingest(state, stats, metrics):
+    increment('store_monitor_ingest_jobs_total', state=state)
+    for file_stats in stats:
+        increment('store_monitor_ingest_rows_total', file_stats['inserted'], file=file_stats['file'], result='inserted')
+        increment('store_monitor_ingest_rows_total', file_stats['skipped'], file=file_stats['file'], result='skipped')
+    for stage, seconds in metrics.seconds.items():
+        increment('store_monitor_ingest_stage_seconds_total', seconds, stage=stage)
+
+
+def _labelled(name, label_sets):
+    keys = {_metric_key(name, labels): labels for labels in label_sets}
+    values = cache.get_many(list(keys))
+    if name.endswith('_seconds_total'):
+        return [(labels, values.get(key, 0) / 10**6) for key, labels in keys.items()]
+    return [(labels, values.get(key, 0)) for key, labels in keys.items()]
+
+
+def render_metrics(engines, ingest_files, report_states, store_cache):
+    """Prometheus text exposition (format 0.0.4) of the counters above plus gauges."""
+    families = [
+        ('store_monitor_reports_total', 'counter', 'Reports finished, by engine and outcome',
+         [{'engine': e, 'state': s} for e in engines for s in ('complete', 'failed')]),
+        ('store_monitor_report_stage_seconds_total', 'counter', 'Report time per stage',
+         [{'stage': s} for s in REPORT_STAGES]),
+        ('store_monitor_report_queries_total', 'counter', 'ORM queries run by reports', [{}]),
+        ('store_monitor_report_stores_total', 'counter', 'Store rows written by reports', [{}]),
+        ('store_monitor_report_polls_total', 'counter', 'Polls read by reports', [{}]),
+        ('store_monitor_ingest_jobs_total', 'counter', 'Ingestion jobs finished, by outcome',
+         [{'state': s} for s in ('complete', 'failed')]),
+        ('store_monitor_ingest_rows_total', 'counter', 'Rows ingested, by file and result',
+         [{'file': f, 'result': r} for f in ingest_files for r in ('inserted', 'skipped')]),
+        ('store_monitor_ingest_stage_seconds_total', 'counter', 'Ingestion time per stage',
+         [{'stage': s} for s in INGEST_STAGES]),
+    ]
+    lines = []
+    for name, kind, help_text, label_sets in families:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        lines += [_sample(name, labels, value) for labels, value in _labelled(name, label_sets)]
+    lines += ['# HELP store_monitor_reports Reports by current state', '# TYPE store_monitor_reports gauge']
+    lines += [_sample('store_monitor_reports', {'state': s}, n) for s, n in report_states.items()]
+    lines += ['# HELP store_monitor_store_cache_total Per-store result cache lookups',
+              '# TYPE store_monitor_store_cache_total counter']
+    lines += [_sample('store_monitor_store_cache_total', {'result': r}, n) for r, n in store_cache.items()]
+    return '\n'.join(lines) + '\n'
+
+
+def _sample(name, labels, value):
+    label_text = ','.join(f'{k}="{v}"' for k, v in labels.items())
+    return f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}'
+
+
+@contextmanager
+def profiled(path_prefix):
+    """Profile the block when REPORT_PROFILE is 'cprofile' or 'pyinstrument'.
+
+    Writes <path_prefix>.prof (pstats) or <path_prefix>.profile.html and
+    yields the output path (None when profiling is off).
+    """
+    mode = getattr(settings, 'REPORT_PROFILE', None)
+    if mode == 'pyinstrument' and pyinstrument is not None:
+        profiler, path = pyinstrument.Profiler(), f'{path_prefix}.profile.html'
+        profiler.start()
+        try:
+            yield path
+        finally:
+            profiler.stop()
+            with open(path, 'w') as f:
+                f.write(profiler.output_html())
+    elif mode in ('cprofile', 'pyinstrument'):
+        # pyinstrument requested but not installed: cProfile still gives a profile
+        profiler, path = cProfile.Profile(), f'{path_prefix}.prof'
+        profiler.enable()
+        try:
+            yield path
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+    else:
+        yield None
@@ -0,0 +1,119 @@
+import threading
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+import pytz
+from django.db.models import Count, Max, Min
+from store_monitor.models import BusinessHour, IngestionWatermark, Timezone
+from store_monitor.schedule import OffsetTable, WeeklySchedule
+
+# Fallback for stores without a Timezone row (stores without BusinessHour rows are open all day)
+DEFAULT_TIMEZONE = 'America/Chicago'
+LOOKUP_SOURCES = ('timezones.csv', 'menu_hours.csv')
+LOAD_CHUNK_SIZE = 20000
+
+
+# One query for every store's timezone (first row per store wins, like .first())
+def load_timezones():
+    timezones = {}
+    rows = Timezone.objects.order_by('pk').values_list('store_id', 'timezone_str')
+    for store_id, timezone_str in rows.iterator(chunk_size=LOAD_CHUNK_SIZE):
+        timezones.setdefault(store_id, timezone_str)
+    return timezones
+
+
+# One query for every store's business hours: {store_id: {day: (start, end)}}
+def load_business_hours():
+    hours = defaultdict(dict)
+    rows = BusinessHour.objects.order_by('pk').values_list('store_id', 'day_of_week', 'start_time_local', 'end_time_local')
+    for store_id, day, start, end in rows.iterator(chunk_size=LOAD_CHUNK_SIZE):
+        hours[store_id][day] = (start, end)
+    return dict(hours)
+
+
+def lookup_version():
+    """Changes whenever Timezone or BusinessHour content may have changed.
+
+    Ingestion bumps the watermarks of the source files. The row count, id and
+    store_id extremes and the newest updated_at (all index lookups) also catch
+    rows inserted, deleted or edited in place any other way: saved through the
+    ORM, or by SQL that leaves updated_at to the database default. Bulk
+    QuerySet.update() and raw UPDATEs must set updated_at themselves.
+    """
+    marks = IngestionWatermark.objects.filter(source__in=LOOKUP_SOURCES).aggregate(Max('updated_at'))
+    fingerprint = dict(n=Count('id'), last=Max('id'), lo=Min('store_id'), hi=Max('store_id'),
+                       edited=Max('updated_at'))
+    return (
+        marks['updated_at__max'],
+        tuple(Timezone.objects.aggregate(**fingerprint).values()),
+        tuple(BusinessHour.objects.aggregate(**fingerprint).values()),
+    )
+
+
+class StoreLookups:
+    """Every store's compiled WeeklySchedule, built from one query per table.
+
+    Timezone objects and schedules are interned: stores with the same zone
+    and hours share one WeeklySchedule (and so its cached offset span).
+    `store_ids` is sorted and `schedule_idx[i]` indexes `schedules` for
+    store i. Stores without rows get the default zone, open all day.
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+        timezones = load_timezones()
+        hours = load_business_hours()
+
+        self.timezones = {}
+        self.schedules = []
+        interned = {}
+        self.store_ids = sorted(set(timezones) | set(hours))
+        self.schedule_idx = array('i')
+        for store_id in self.store_ids:
+            self.schedule_idx.append(self._intern(interned, timezones.get(store_id, DEFAULT_TIMEZONE),
+                                                  hours.get(store_id)))
+        self.default = self.schedules[self._intern(interned, DEFAULT_TIMEZONE, None)]
+
+    def _intern(self, interned, zone, business_hours):
+        key = (zone, tuple(sorted(business_hours.items())) if business_hours else None)
+        idx = interned.get(key)
+        if idx is None:
+            tz = self.timezones.get(zone)
+            if tz is None:
+                tz = self.timezones[zone] = pytz.timezone(zone)
+            idx = interned[key] = len(self.schedules)
+            self.schedules.append(WeeklySchedule(business_hours, tz))
+        return idx
+
+    def schedule(self, store_id):
+        i = bisect_left(self.store_ids, store_id)
+        if i < len(self.store_ids) and self.store_ids[i] == store_id:
+            return self.schedules[self.schedule_idx[i]]
+        return self.default
+
+    def prepare(self, start_epoch, end_epoch):
+        """Precompute each zone's UTC offsets over [start, end) for every schedule.
+
+        Business-time lookups inside the range then never call into pytz.
+        """
+        tables = {}
+        for schedule in self.schedules:
+            zone = str(schedule.tz)
+            table = tables.get(zone)
+            if table is None:
+                table = tables[zone] = OffsetTable(schedule.tz, start_epoch, end_epoch)
+            schedule.offset_table = table
+
+
+_lock = threading.Lock()
+_current = None
+
+
+def store_lookups():
+    """This process's StoreLookups, reloaded only when lookup_version() changes."""
+    global _current
+    version = lookup_version()
+    with _lock:
+        if _current is None or _current.version != version:
+            _current = StoreLookups(version)
+        return _current
@@ -0,0 +1,27 @@
+import time as timer
+from django.core.management.base import BaseCommand, CommandError
+from store_monitor.retention import MIN_RETENTION_DAYS, archive_polls, retention_days
+
+
+class Command(BaseCommand):
+    help = "Roll polls older than the retention period into daily per-store summaries and delete them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-days', type=int, default=None,
+                            help=f"Days of polls to keep before the newest one (default: POLL_RETENTION_DAYS, "
+                                 f"minimum {MIN_RETENTION_DAYS})")
+
+    def handle(self, *args, **options):
+        keep_days = options['keep_days'] if options['keep_days'] is not None else retention_days()
+        start = timer.perf_counter()
+        try:
+            stats = archive_polls(keep_days)
+        except ValueError as e:
+            raise CommandError(str(e))
+        if stats['cutoff'] is None:
+            self.stdout.write("No polls to archive")
+            return
+        self.stdout.write(
+            f"Archived {stats['archived']} polls before {stats['cutoff'].isoformat()} into {stats['summaries']} "
+            f"daily summaries over {stats['days']} days in {timer.perf_counter() - start:.1f}s"
+        )
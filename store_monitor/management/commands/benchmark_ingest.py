@@ -0,0 +1,78 @@
+import shutil
+import tempfile
+import time as timer
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Max
+from django.test.utils import override_settings
+from store_monitor.engine import POLL_CHUNK_SIZE, report_polls
+from store_monitor.ingest import import_all
+from store_monitor.instrumentation import Metrics
+from store_monitor.models import (
+    BusinessHour, IngestionWatermark, StoreHourlyUptime, StoreStatus, StoreUptimeState, Timezone,
+)
+from store_monitor.partitions import partition_store_status
+from store_monitor.synthetic import write_csvs
+
+TABLES = [StoreStatus, BusinessHour, Timezone, IngestionWatermark, StoreHourlyUptime, StoreUptimeState]
+
+
+# Seconds to stream the report's polls (last week plus each store's prior poll)
+def scan_seconds(repeat):
+    since = StoreStatus.objects.aggregate(Max('timestamp_utc'))['timestamp_utc__max'] - timedelta(days=7)
+    best = None
+    for _ in range(repeat):
+        start = timer.perf_counter()
+        polls = sum(1 for _ in report_polls(since=since).iterator(chunk_size=POLL_CHUNK_SIZE))
+        seconds = timer.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return polls, best
+
+
+class Command(BaseCommand):
+    help = ("Ingestion time per loader (executemany INSERT, and COPY on PostgreSQL) and the report's poll scan "
+            "before/after partitioning StoreStatus, on a synthetic dataset (throwaway test database)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stores', type=int, default=2000)
+        parser.add_argument('--days', type=int, default=30)
+        parser.add_argument('--poll-minutes', type=int, default=60)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=3, help="Scans per measurement (best is reported)")
+        parser.add_argument('--brin', action='store_true', help="Partition with a BRIN timestamp_utc index")
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self._run(workdir, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _run(self, workdir, options):
+        polls = write_csvs(workdir, stores=options['stores'], days=options['days'],
+                           poll_minutes=options['poll_minutes'], seed=options['seed'])
+        self.stdout.write(f"{connection.vendor}: {options['stores']} stores, {polls} polls over {options['days']} days")
+        loaders = ['insert', 'copy'] if connection.vendor == 'postgresql' else ['insert']
+        for loader in loaders:
+            for model in TABLES:
+                model.objects.all().delete()
+            metrics = Metrics()
+            with override_settings(INGEST_LOADER=loader):
+                start = timer.perf_counter()
+                stats, _ = import_all(workdir, metrics=metrics)
+                seconds = timer.perf_counter() - start
+            rows = sum(s['rows'] for s in stats)
+            self.stdout.write(f"{'ingest ' + loader:>22}: {seconds:7.2f}s  {rows / seconds:9.0f} rows/s  "
+                              f"(insert stage {metrics.seconds['insert']:.2f}s)")
+
+        scanned, seconds = scan_seconds(options['repeat'])
+        self.stdout.write(f"{'scan plain table':>22}: {seconds:7.3f}s  {scanned} polls")
+        if connection.vendor == 'postgresql':
+            partition_store_status(brin=options['brin'])
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {connection.ops.quote_name(StoreStatus._meta.db_table)}")
+            scanned, seconds = scan_seconds(options['repeat'])
+            self.stdout.write(f"{'scan partitioned':>22}: {seconds:7.3f}s  {scanned} polls")
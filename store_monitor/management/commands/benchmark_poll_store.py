@@ -0,0 +1,78 @@
+import gc
+import resource
+import shutil
+import tempfile
+import time as timer
+import tracemalloc
+from django.core.management.base import BaseCommand
+from django.db import connection
+from store_monitor.pollstore import PollStore, compact_poll_store
+from store_monitor.synthetic import load_dataset
+from store_monitor.vectorized import load_poll_columns
+
+
+# Resident set size in bytes (current on Linux, peak elsewhere)
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def measure(scan):
+    """(seconds, RSS growth, peak Python allocations) for one full scan."""
+    gc.collect()
+    rss = rss_bytes()
+    start = timer.perf_counter()
+    columns = scan()
+    seconds = timer.perf_counter() - start
+    grown = rss_bytes() - rss
+    del columns
+    gc.collect()
+
+    tracemalloc.start()
+    scan()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, grown, peak
+
+
+class Command(BaseCommand):
+    help = "Compare full poll scans from the ORM against the memory-mapped poll store (throwaway test database)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stores', type=int, default=10000)
+        parser.add_argument('--days', type=int, default=7)
+        parser.add_argument('--poll-minutes', type=int, default=60)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        path = tempfile.mkdtemp()
+        try:
+            self._run(options, path)
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _run(self, options, path):
+        polls = load_dataset(stores=options['stores'], days=options['days'],
+                             poll_minutes=options['poll_minutes'], seed=options['seed'])
+        start = timer.perf_counter()
+        manifest = compact_poll_store(path)
+        self.stdout.write(f"Compacted {polls} polls into {len(manifest['partitions'])} partitions "
+                          f"in {timer.perf_counter() - start:.1f}s")
+
+        # Poll store first so the ORM run can't leave freed pages for it to reuse
+        scans = [('pollstore', lambda: PollStore(path).load_columns()), ('orm', load_poll_columns)]
+        for name, scan in scans:
+            seconds, grown, peak = measure(scan)
+            self.stdout.write(f"{name:>10}: {seconds:8.3f}s  RSS +{grown / 2**20:7.1f} MiB  "
+                              f"peak alloc {peak / 2**20:7.1f} MiB")
+
+        store_ids, store_idx, epochs, active = load_poll_columns()
+        columns = PollStore(path).load_columns()
+        same = (store_ids == columns[0] and (store_idx == columns[1]).all()
+                and (abs(epochs - columns[2]) < 1e-6).all() and (active == columns[3]).all())
+        self.stdout.write(f"pollstore matches orm: {same}")
@@ -0,0 +1,64 @@
+import time as timer
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Max
+from django.test.utils import CaptureQueriesContext
+from store_monitor.engine import REPORT_ENGINES
+from store_monitor.models import StoreStatus
+from store_monitor.synthetic import load_dataset
+from store_monitor.tasks import store_report_row
+from store_monitor.vectorized import vectorized_report_rows
+
+ENGINES = [*REPORT_ENGINES, 'vectorized']
+
+
+# Uncached rows so every engine does the full computation
+def engine_rows(name, now_utc, windows):
+    if name == 'vectorized':
+        return list(vectorized_report_rows(now_utc, *windows))
+    return [
+        store_report_row(store_id, now_utc, *windows, tz, business_hours, polls)
+        for store_id, tz, business_hours, polls in REPORT_ENGINES[name](since=windows[-1])
+    ]
+
+
+class Command(BaseCommand):
+    help = "Benchmark report engines on a synthetic dataset (uses a throwaway test database)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stores', type=int, default=10000)
+        parser.add_argument('--days', type=int, default=7)
+        parser.add_argument('--poll-minutes', type=int, default=60)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--engines', nargs='+', default=ENGINES, choices=ENGINES)
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self._run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _run(self, options):
+        start = timer.perf_counter()
+        polls = load_dataset(stores=options['stores'], days=options['days'],
+                             poll_minutes=options['poll_minutes'], seed=options['seed'])
+        self.stdout.write(f"Loaded {options['stores']} stores / {polls} polls in {timer.perf_counter() - start:.1f}s")
+
+        now_utc = StoreStatus.objects.aggregate(Max('timestamp_utc'))['timestamp_utc__max']
+        windows = (now_utc - timedelta(hours=1), now_utc - timedelta(days=1), now_utc - timedelta(days=7))
+
+        results = {}
+        for name in options['engines']:
+            with CaptureQueriesContext(connection) as queries:
+                start = timer.perf_counter()
+                rows = engine_rows(name, now_utc, windows)
+                elapsed = timer.perf_counter() - start
+            results[name] = rows
+            self.stdout.write(f"{name:>10}: {elapsed:8.2f}s  {len(queries):>7} queries  {len(rows)} rows")
+
+        names = list(results)
+        for name in names[1:]:
+            same = results[name] == results[names[0]]
+            self.stdout.write(f"{name} matches {names[0]}: {same}")
@@ -0,0 +1,61 @@
+import csv
+import io
+import os
+import random
+import shutil
+import tempfile
+import time as timer
+import tracemalloc
+from uuid import UUID
+from django.core.management.base import BaseCommand
+from store_monitor.report_formats import REPORT_HEADER, available_formats, write_rows
+
+
+# Report-shaped rows, generated lazily so only the writer's own memory is measured
+def synthetic_rows(stores, seed):
+    rng = random.Random(seed)
+    for _ in range(stores):
+        yield [str(UUID(int=rng.getrandbits(128))), rng.randint(0, 60), rng.randint(0, 24), rng.randint(0, 168),
+               rng.randint(0, 60), rng.randint(0, 24), rng.randint(0, 168)]
+
+
+# The previous writer: whole CSV in a StringIO, then written out in one go
+def write_in_memory(path, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(REPORT_HEADER)
+    writer.writerows(rows)
+    content = buffer.getvalue()
+    with open(path, 'w', newline='') as f:
+        f.write(content)
+    return os.path.getsize(path)
+
+
+class Command(BaseCommand):
+    help = "Peak memory, time and size of the report writer stage per output format (synthetic rows)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stores', type=int, default=100000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        stores, seed = options['stores'], options['seed']
+        path = tempfile.mkdtemp()
+        writers = [('in-memory csv', 'csv', lambda out: write_in_memory(out, synthetic_rows(stores, seed)))]
+        writers += [
+            (f'streamed {fmt}', fmt, lambda out, fmt=fmt: write_rows(out, synthetic_rows(stores, seed), fmt)[1])
+            for fmt in available_formats()
+        ]
+        try:
+            for name, fmt, write in writers:
+                out = os.path.join(path, f'report.{fmt}')
+                tracemalloc.start()
+                start = timer.perf_counter()
+                size = write(out)
+                seconds = timer.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                self.stdout.write(f"{name:>16}: {seconds:7.2f}s  peak alloc {peak / 2**20:7.1f} MiB  "
+                                  f"file {size / 2**20:7.1f} MiB")
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,95 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import time as timer
+from collections import Counter
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from store_monitor.management.commands.benchmark_suite import flatten, git_commit
+from store_monitor.warmup import WARM_MODULES
+
+# Entry points as a fresh interpreter runs them: the web app up to a resolved URLconf
+# (WSGI and ASGI), a Celery worker up to its imported task modules, and the imports a
+# worker's warm-start adds on top (see warmup.py)
+ENTRY_POINTS = {
+    'wsgi': "import loop_assignment.wsgi; from django.urls import get_resolver; get_resolver().url_patterns",
+    'asgi': "import loop_assignment.asgi; from django.urls import get_resolver; get_resolver().url_patterns",
+    'worker': "from loop_assignment.celery import app; app.loader.import_default_modules()",
+    'worker_warm': ("from loop_assignment.celery import app; app.loader.import_default_modules(); "
+                    f"import importlib; [importlib.import_module(m) for m in {WARM_MODULES!r}]"),
+}
+
+
+def package_import_us(stderr):
+    """`python -X importtime` output -> {top-level package: import time in us}.
+
+    Sums each module's own ("self") time by package: cumulative times can't be
+    used, because packages loaded through importlib.import_module (Django apps,
+    Celery task modules) get no line of their own.
+    """
+    packages = Counter()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        packages[name.strip().split('.')[0]] += int(self_us)
+    return packages
+
+
+class Command(BaseCommand):
+    help = ("Startup cost of the web (WSGI/ASGI) and Celery worker entry points in fresh interpreters: wall "
+            "time, and import time per package from `python -X importtime`; prints JSON")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', nargs='+', default=list(ENTRY_POINTS), choices=list(ENTRY_POINTS))
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per entry point (best wall time is kept)")
+        parser.add_argument('--top', type=int, default=10, help="Slowest packages to list")
+        parser.add_argument('--output', default=None, help="Write the JSON here instead of stdout")
+        parser.add_argument('--baseline', default=None, help="Earlier JSON output to compare against")
+
+    def handle(self, *args, **options):
+        results = {name: self._measure(ENTRY_POINTS[name], options) for name in options['entries']}
+        output = {
+            'meta': {'commit': git_commit(), 'timestamp': timezone.now().isoformat(),
+                     'python': platform.python_version(), 'platform': platform.platform()},
+            'results': results,
+        }
+        text = json.dumps(output, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(text + '\n')
+        else:
+            self.stdout.write(text)
+        if options['baseline']:
+            self._compare(options['baseline'], results)
+
+    def _run(self, code, *flags):
+        env = {**os.environ}
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'loop_assignment.settings')
+        start = timer.perf_counter()
+        proc = subprocess.run([sys.executable, *flags, '-c', code], cwd=settings.BASE_DIR, env=env,
+                              capture_output=True, text=True, check=True)
+        return timer.perf_counter() - start, proc.stderr
+
+    def _measure(self, code, options):
+        wall = min(self._run(code)[0] for _ in range(options['repeat']))
+        _, stderr = self._run(code, '-X', 'importtime')
+        packages = package_import_us(stderr)
+        return {
+            'wall_seconds': round(wall, 3),
+            'import_seconds': round(sum(packages.values()) / 1e6, 3),
+            'packages_ms': {name: round(us / 1000, 1) for name, us in packages.most_common(options['top'])},
+        }
+
+    def _compare(self, path, results):
+        with open(path) as f:
+            baseline = dict(flatten(json.load(f)['results']))
+        for name, value in flatten(results):
+            old = baseline.get(name)
+            if not old:
+                continue
+            change = (value - old) / old * 100
+            self.stderr.write(f"{name:>40}: {old:>10g} -> {value:<10g} {change:+7.1f}%")
@@ -0,0 +1,267 @@
+import json
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time as timer
+import tracemalloc
+from datetime import timedelta
+from itertools import groupby
+from operator import itemgetter
+import django
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Max
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from store_monitor.engine import iter_store_inputs, iter_store_polls, report_polls
+from store_monitor.ingest import import_all
+from store_monitor.lookups import load_business_hours, store_lookups
+from store_monitor.models import Report, StoreStatus
+from store_monitor.poll_index import refresh_poll_index
+from store_monitor.result_cache import store_report_cache
+from store_monitor.synthetic import HOUR_SHAPES, write_csvs
+from store_monitor.tasks import (
+    business_minutes, compute_uptime_downtime, generate_report, report_windows, store_report_row,
+)
+
+ENGINES = ['columnar', 'vectorized', 'pollstore', 'incremental']
+# Metrics where a larger value is better; everything else timed is lower-is-better
+HIGHER_IS_BETTER = ('rows_per_sec', 'calls_per_sec')
+
+
+def peak_rss_bytes():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def weights(values):
+    """'a=2,b' -> {'a': 2.0, 'b': 1.0}"""
+    if not values:
+        return None
+    parsed = {}
+    for item in values.split(','):
+        name, _, weight = item.partition('=')
+        parsed[name.strip()] = float(weight or 1)
+    return parsed
+
+
+def flatten(results, prefix=''):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f'{prefix}{key}.')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f'{prefix}{key}', value
+
+
+class Command(BaseCommand):
+    help = ("Benchmark ingestion, business_minutes / compute_uptime_downtime, poll memory, the single-store uptime endpoint "
+            "and end-to-end generate_report on a synthetic dataset (throwaway test database); prints JSON for tracking across commits")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stores', type=int, default=2000)
+        parser.add_argument('--days', type=int, default=7)
+        parser.add_argument('--poll-minutes', type=int, default=60)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--timezones', default=None, help="Timezone mix, e.g. 'America/Chicago=3,Asia/Kolkata'")
+        parser.add_argument('--hour-shapes', default=None,
+                            help=f"Business-hour shape mix from {', '.join(HOUR_SHAPES)}, e.g. 'day=3,overnight'")
+        parser.add_argument('--outage-minutes', type=float, default=None,
+                            help="Mean outage length (default: every poll down independently)")
+        parser.add_argument('--jitter-minutes', type=float, default=0)
+        parser.add_argument('--drop-rate', type=float, default=0.0)
+        parser.add_argument('--engines', nargs='+', default=ENGINES, choices=ENGINES)
+        parser.add_argument('--calls', type=int, default=20000, help="Calls per micro-benchmark")
+        parser.add_argument('--output', default=None, help="Write the JSON here instead of stdout")
+        parser.add_argument('--baseline', default=None, help="Earlier JSON output to compare against")
+
+    def handle(self, *args, **options):
+        dataset = {
+            'stores': options['stores'], 'days': options['days'], 'poll_minutes': options['poll_minutes'],
+            'seed': options['seed'], 'timezone_mix': weights(options['timezones']),
+            'hour_shapes': weights(options['hour_shapes']), 'outage_minutes': options['outage_minutes'],
+            'jitter_minutes': options['jitter_minutes'], 'drop_rate': options['drop_rate'],
+        }
+        workdir = tempfile.mkdtemp()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(BASE_DIR=workdir, POLL_STORE_PATH=f'{workdir}/poll_store'):
+                results = self._run(dataset, options, workdir)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        output = {
+            'meta': {
+                'commit': git_commit(), 'timestamp': timezone.now().isoformat(), 'python': platform.python_version(),
+                'django': django.get_version(), 'platform': platform.platform(), 'database': connection.vendor,
+            },
+            'dataset': dataset,
+            'results': results,
+        }
+        text = json.dumps(output, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(text + '\n')
+        else:
+            self.stdout.write(text)
+        if options['baseline']:
+            self._compare(options['baseline'], results)
+
+    def _run(self, dataset, options, workdir):
+        # Peak RSS is the process high-water mark after each stage, so it only grows
+        results = {'peak_rss_bytes': {}}
+        data_path = f'{workdir}/data'
+        polls = write_csvs(data_path, **dataset)
+
+        start = timer.perf_counter()
+        stats, _ = import_all(data_path)
+        seconds = timer.perf_counter() - start
+        results['ingest'] = {
+            'polls': polls,
+            'seconds': round(seconds, 3),
+            'rows_per_sec': round(sum(s['rows'] for s in stats) / seconds) if seconds else None,
+            'files': {s['file']: {'rows': s['rows'], 'rows_per_sec': s['rows_per_sec']} for s in stats},
+        }
+        results['peak_rss_bytes']['ingest'] = peak_rss_bytes()
+
+        now_utc = StoreStatus.objects.aggregate(Max('timestamp_utc'))['timestamp_utc__max']
+        results['business_minutes'] = self._business_minutes(now_utc, options)
+        results['compute_uptime_downtime'] = self._compute_uptime_downtime(now_utc)
+        results['poll_memory'] = self._poll_memory(now_utc)
+        results['peak_rss_bytes']['micro'] = peak_rss_bytes()
+        results['store_uptime'] = self._store_uptime(options)
+        results['peak_rss_bytes']['store_uptime'] = peak_rss_bytes()
+
+        results['generate_report'] = {}
+        for engine in options['engines']:
+            cache.clear()
+            store_report_cache.clear()
+            store_report_cache.shared.clear()
+            report_id = f'benchmark-{engine}'
+            Report.objects.create(report_id=report_id)
+            with override_settings(REPORT_ENGINE=engine, REPORT_SHARD_SIZE=0), \
+                    CaptureQueriesContext(connection) as queries:
+                start = timer.perf_counter()
+                generate_report(report_id)
+                seconds = timer.perf_counter() - start
+            report = Report.objects.get(report_id=report_id)
+            results['generate_report'][engine] = {
+                'seconds': round(seconds, 3), 'queries': len(queries), 'rows': report.rows, 'state': report.state,
+            }
+            results['peak_rss_bytes'][f'generate_report.{engine}'] = peak_rss_bytes()
+        return results
+
+    def _business_minutes(self, now_utc, options):
+        """Random intervals of up to a week over the stores' own hours and zones."""
+        rng = random.Random(options['seed'])
+        hours = load_business_hours()
+        lookups = store_lookups()
+        samples = []
+        for _ in range(options['calls']):
+            store_id = rng.choice(lookups.store_ids)
+            start = now_utc - timedelta(seconds=rng.randint(0, 7 * 86400))
+            end = start + timedelta(seconds=rng.randint(0, 7 * 86400))
+            samples.append((start, end, lookups.schedule(store_id).tz, hours.get(store_id)))
+        start = timer.perf_counter()
+        for sample in samples:
+            business_minutes(*sample)
+        seconds = timer.perf_counter() - start
+        return {'calls': len(samples), 'seconds': round(seconds, 4),
+                'us_per_call': round(seconds / len(samples) * 1e6, 3), 'calls_per_sec': round(len(samples) / seconds)}
+
+    def _compute_uptime_downtime(self, now_utc):
+        """One call per store and report window, over the week's polls."""
+        windows = report_windows(now_utc)
+        inputs = list(iter_store_inputs(since=windows[-1]))
+        start = timer.perf_counter()
+        for _, tz, schedule, polls in inputs:
+            for window_start in windows:
+                compute_uptime_downtime(window_start, now_utc, tz, schedule, polls)
+        seconds = timer.perf_counter() - start
+        calls = len(inputs) * len(windows)
+        return {'calls': calls, 'seconds': round(seconds, 4),
+                'us_per_call': round(seconds / calls * 1e6, 3) if calls else None,
+                'calls_per_sec': round(calls / seconds) if seconds else None}
+
+    def _poll_memory(self, now_utc):
+        """Bytes the week's polls hold as (datetime, bool) tuples vs StorePolls, and the peak while computing rows."""
+        windows = report_windows(now_utc)
+        lookups = store_lookups()
+
+        def tuples():
+            rows = report_polls(since=windows[-1]).iterator()
+            return {store_id: [(ts, status == 'active') for _, ts, status in group]
+                    for store_id, group in groupby(rows, key=itemgetter(0))}
+
+        tracemalloc.start()
+        try:
+            held = {}
+            for name, load in (('tuples', tuples), ('compact', lambda: dict(iter_store_polls(since=windows[-1])))):
+                before = tracemalloc.get_traced_memory()[0]
+                polls = load()
+                held[name] = tracemalloc.get_traced_memory()[0] - before
+                if name == 'tuples':
+                    del polls
+            count = sum(len(p) for p in polls.values())
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            for store_id, store_polls in polls.items():
+                schedule = lookups.schedule(store_id)
+                store_report_row(store_id, now_utc, *windows, schedule.tz, schedule, store_polls)
+            compute_peak = tracemalloc.get_traced_memory()[1] - before
+        finally:
+            tracemalloc.stop()
+        return {
+            'polls': count, 'tuples_bytes': held['tuples'], 'compact_bytes': held['compact'],
+            'tuples_bytes_per_poll': round(held['tuples'] / count, 1) if count else None,
+            'compact_bytes_per_poll': round(held['compact'] / count, 1) if count else None,
+            'compute_peak_bytes': compute_peak,
+        }
+
+    def _store_uptime(self, options):
+        """GET /stores/<id>/uptime/ latency for random stores, through the full Django stack."""
+        start = timer.perf_counter()
+        index = refresh_poll_index()
+        build_seconds = timer.perf_counter() - start
+        rng = random.Random(options['seed'])
+        store_ids = list(index.polls)
+        client = Client()
+        latencies = []
+        with override_settings(ALLOWED_HOSTS=['*']):
+            for _ in range(min(options['calls'], 2000)):
+                url = f'/stores/{rng.choice(store_ids)}/uptime/'
+                start = timer.perf_counter()
+                client.get(url)
+                latencies.append(timer.perf_counter() - start)
+        latencies.sort()
+        return {
+            'calls': len(latencies), 'index_build_seconds': round(build_seconds, 3),
+            'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+            'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+        }
+
+    def _compare(self, path, results):
+        with open(path) as f:
+            baseline = dict(flatten(json.load(f)['results']))
+        for name, value in flatten(results):
+            old = baseline.get(name)
+            if not old or name.endswith(('.calls', '.rows', '.polls', '.queries')):
+                continue
+            change = (value - old) / old * 100
+            better = change > 0 if name.endswith(HIGHER_IS_BETTER) else change < 0
+            self.stderr.write(f"{name:>48}: {old:>14g} -> {value:<14g} {change:+7.1f}% "
+                              f"{'better' if better else 'worse' if change else ''}")
@@ -0,0 +1,18 @@
+import time as timer
+from django.core.management.base import BaseCommand
+from store_monitor.pollstore import compact_poll_store, poll_store_path
+
+
+class Command(BaseCommand):
+    help = "Export StoreStatus into the memory-mapped, day-partitioned poll store read by REPORT_ENGINE='pollstore'"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=None, help="Output directory (default: POLL_STORE_PATH)")
+
+    def handle(self, *args, **options):
+        start = timer.perf_counter()
+        manifest = compact_poll_store(options['path'])
+        self.stdout.write(
+            f"Wrote {manifest['rows']} polls for {manifest['stores']} stores in {len(manifest['partitions'])} "
+            f"day partitions to {options['path'] or poll_store_path()} in {timer.perf_counter() - start:.1f}s"
+        )
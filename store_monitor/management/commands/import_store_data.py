@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from store_monitor.ingest import DATA_PATH, import_all
+
+
+class Command(BaseCommand):
+    help = "Stream timezones.csv, menu_hours.csv and store_status.csv into the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data-path', default=DATA_PATH)
+        parser.add_argument('--chunksize', type=int, default=None,
+                            help="Rows per chunk (default: INGEST_CHUNK_SIZE)")
+        parser.add_argument('--full', action='store_true',
+                            help="Re-read every file, including those unchanged since the last import")
+
+    def handle(self, *args, **options):
+        stats, missing = import_all(options['data_path'], options['chunksize'], full=options['full'])
+        for s in stats:
+            self.stdout.write(f"{s['file']}: {s['rows']} rows ({s['inserted']} inserted, {s['skipped']} skipped, "
+                              f"{s['late']} late) in {s['seconds']}s ({s['rows_per_sec']} rows/sec)")
+        for filename in missing:
+            self.stdout.write(self.style.WARNING(f"{filename} missing"))
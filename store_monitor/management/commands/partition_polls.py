@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from store_monitor.partitions import DEFAULT_MONTHS_AHEAD, partition_store_status
+
+
+class Command(BaseCommand):
+    help = "Partition StoreStatus by month of timestamp_utc (PostgreSQL), or add the missing monthly partitions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=DEFAULT_MONTHS_AHEAD,
+                            help="Months of empty partitions to create past the newest poll")
+        parser.add_argument('--brin', action='store_true',
+                            help="Index timestamp_utc with BRIN instead of a b-tree (first run only)")
+
+    def handle(self, *args, **options):
+        try:
+            stats = partition_store_status(options['months_ahead'], options['brin'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        action = "Partitioned StoreStatus" if stats['converted'] else "StoreStatus already partitioned"
+        self.stdout.write(f"{action}; created {len(stats['created'])} partitions: {', '.join(stats['created']) or '-'}")
@@ -0,0 +1,38 @@
+import time as timer
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from store_monitor.aggregates import incremental_report_rows, rebuild_aggregates
+from store_monitor.engine import iter_store_inputs
+from store_monitor.models import StoreStatus
+from store_monitor.tasks import report_windows, store_report_row
+
+
+class Command(BaseCommand):
+    help = "Rebuild the hourly uptime aggregates from raw polls (run after business hours or timezones change)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Compare the incremental report against a full recompute")
+
+    def handle(self, *args, **options):
+        start = timer.perf_counter()
+        applied = rebuild_aggregates()
+        self.stdout.write(f"Folded {applied} polls into hourly aggregates in {timer.perf_counter() - start:.1f}s")
+        if options['check']:
+            self._check()
+
+    def _check(self):
+        now_utc = StoreStatus.objects.aggregate(Max('timestamp_utc'))['timestamp_utc__max']
+        if not now_utc:
+            return
+        windows = report_windows(now_utc)
+        expected = {
+            store_id: store_report_row(store_id, now_utc, *windows, tz, business_hours, polls)
+            for store_id, tz, business_hours, polls in iter_store_inputs()
+        }
+        mismatches = [row for row in incremental_report_rows(now_utc, *windows) if expected.get(row[0]) != row]
+        for row in mismatches[:20]:
+            self.stdout.write(f"  incremental {row} != full {expected.get(row[0])}")
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} of {len(expected)} stores differ from the full recompute")
+        self.stdout.write(f"All {len(expected)} stores match the full recompute")
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.functions import Now
+from django.utils import timezone
 
 # Store poll data: store_id, timestamp (UTC), and status (active/inactive)
 class StoreStatus(models.Model):
@@ -7,8 +9,28 @@ class StoreStatus(models.Model):
     status = models.CharField(max_length=10)
 
     class Meta:
+        constraints = [
+            # One poll per store and timestamp; also the index report queries use
+            models.UniqueConstraint(fields=['store_id', 'timestamp_utc'], name='unique_store_poll'),
+        ]
         indexes = [
-            models.Index(fields=['store_id', 'timestamp_utc']),  # Speed up queries
+            models.Index(fields=['timestamp_utc']),  # newest poll ("now") and the report window scan
+        ]
+
+# Polls rolled up per store and UTC day by archive_polls once they are older than the
+# retention period (the raw rows are deleted, see retention.py)
+class StoreDailySummary(models.Model):
+    store_id = models.CharField(max_length=50)
+    day = models.DateField()
+    polls = models.IntegerField()
+    active_polls = models.IntegerField()
+    first_poll_ts = models.DateTimeField()
+    last_poll_ts = models.DateTimeField()
+    last_active = models.BooleanField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['store_id', 'day'], name='unique_store_day'),
         ]
 
 # Business hours: store_id, day (0=Monday, 6=Sunday), start/end times (local)
@@ -17,8 +39,105 @@ class BusinessHour(models.Model):
     day_of_week = models.IntegerField()
     start_time_local = models.TimeField()
     end_time_local = models.TimeField()
+    # Last write, part of lookups.lookup_version (the database fills it for raw inserts)
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now(), db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['store_id', 'day_of_week', 'start_time_local', 'end_time_local'],
+                                    name='unique_business_hour'),
+        ]
 
 # Timezone mapping: store_id to timezone (default: America/Chicago)
 class Timezone(models.Model):
     store_id = models.CharField(max_length=50)
-    timezone_str = models.CharField(max_length=50)
\ No newline at end of file
+    timezone_str = models.CharField(max_length=50)
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now(), db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['store_id', 'timezone_str'], name='unique_store_timezone'),
+        ]
+
+# Business uptime/downtime (seconds) per store and UTC hour. Each interval between two
+# polls is booked to the hour of the poll that closes it; carry_in_* is the poll just
+# before the first poll of the hour (None for a store's first poll)
+class StoreHourlyUptime(models.Model):
+    store_id = models.CharField(max_length=50)
+    hour_start = models.DateTimeField()
+    uptime_seconds = models.FloatField(default=0)
+    downtime_seconds = models.FloatField(default=0)
+    carry_in_ts = models.DateTimeField(null=True)
+    carry_in_active = models.BooleanField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['store_id', 'hour_start'], name='unique_store_hour'),
+        ]
+
+# Aggregation high-water mark per store: first and last poll folded into the buckets, and
+# the schedule they were computed with (aggregates.schedule_key; a change rebuilds them)
+class StoreUptimeState(models.Model):
+    store_id = models.CharField(max_length=50, unique=True)
+    first_poll_ts = models.DateTimeField()
+    first_active = models.BooleanField()
+    last_poll_ts = models.DateTimeField()
+    last_active = models.BooleanField()
+    schedule_key = models.CharField(max_length=32, default='')
+
+
+# Import high-water mark per source file: an unchanged file (same size and mtime) is
+# skipped outright, one that still starts with the imported bytes (digest) is read from
+# file_size on, and any other change is re-read with rows deduplicated by the unique keys
+class IngestionWatermark(models.Model):
+    source = models.CharField(max_length=100, unique=True)
+    file_size = models.BigIntegerField()
+    file_mtime = models.FloatField()
+    rows = models.BigIntegerField()
+    max_timestamp = models.DateTimeField(null=True)
+    digest = models.CharField(max_length=32, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+# One row per requested report: lifecycle state plus timings (queue wait = started - created,
+# compute = finished - started) and output size, so status lookups never touch the filesystem
+class Report(models.Model):
+    QUEUED, RUNNING, COMPLETE, FAILED = 'queued', 'running', 'complete', 'failed'
+    STATES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (COMPLETE, 'Complete'), (FAILED, 'Failed')]
+
+    report_id = models.CharField(max_length=64, unique=True)
+    state = models.CharField(max_length=10, choices=STATES, default=QUEUED)
+    engine = models.CharField(max_length=20, blank=True)
+    # Output format, see report_formats.REPORT_FORMATS
+    format = models.CharField(max_length=10, default='csv')
+    # Point-in-time / custom-window / store-subset parameters ({} for the standard report)
+    # and their digest, which is part of what identifies shareable work (see tasks.request_report)
+    params = models.JSONField(default=dict, blank=True)
+    params_key = models.CharField(max_length=32, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+    rows = models.IntegerField(null=True)
+    bytes = models.BigIntegerField(null=True)
+    error = models.TextField(blank=True)
+    # Data the report was computed from (newest poll + ingestion version, see tasks.report_snapshot)
+    snapshot = models.CharField(max_length=100, blank=True)
+    # Set when this request was attached to another in-flight report for the same snapshot
+    coalesced_into = models.CharField(max_length=64, blank=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'finished_at']),  # latency stats over recent reports
+            models.Index(fields=['snapshot', 'format', 'params_key', 'state']),
+        ]
+
+    @property
+    def queue_wait_seconds(self):
+        if self.started_at is None:
+            return None
+        return (self.started_at - self.created_at).total_seconds()
+
+    @property
+    def compute_seconds(self):
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return (self.finished_at - self.started_at).total_seconds()
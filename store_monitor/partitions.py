@@ -0,0 +1,131 @@
+from datetime import datetime
+import pytz
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from store_monitor.models import StoreStatus
+
+# StoreStatus as a PostgreSQL table partitioned by month of timestamp_utc. Report
+# window scans (timestamp_utc > now - 7 days) then only read the newest partitions,
+# and old months can be dropped whole. Rows outside every month land in the
+# DEFAULT partition until partition_store_status() is run again.
+DEFAULT_MONTHS_AHEAD = 3
+
+
+def _month_start(ts):
+    ts = ts.astimezone(pytz.utc)
+    return datetime(ts.year, ts.month, 1, tzinfo=pytz.utc)
+
+
+def _next_month(start):
+    return datetime(start.year + start.month // 12, start.month % 12 + 1, 1, tzinfo=pytz.utc)
+
+
+def month_ranges(first, last):
+    """[start, end) UTC month bounds covering first..last."""
+    start, ranges = _month_start(first), []
+    while start <= last:
+        ranges.append((start, _next_month(start)))
+        start = _next_month(start)
+    return ranges
+
+
+def _q(name):
+    return connection.ops.quote_name(name)
+
+
+def _partition_name(table, start):
+    return f"{table}_p{start:%Y%m}"
+
+
+def is_partitioned():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass",
+                       [StoreStatus._meta.db_table])
+        return cursor.fetchone() is not None
+
+
+def _partitions(cursor, table):
+    cursor.execute("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = %s::regclass", [table])
+    return {name.strip('"') for name, in cursor.fetchall()}
+
+
+def _add_partitions(cursor, table, first, last):
+    """Create the missing monthly partitions for first..last, moving their rows out of DEFAULT."""
+    column = _q(StoreStatus._meta.get_field('timestamp_utc').column)
+    default = _q(f"{table}_default")
+    existing = _partitions(cursor, table)
+    missing = [(lo, hi) for lo, hi in month_ranges(first, last) if _partition_name(table, lo) not in existing]
+    if not missing:
+        return []
+    # The DEFAULT partition may not hold rows of a new partition's range, so it is
+    # detached while they are moved
+    cursor.execute(f"ALTER TABLE {_q(table)} DETACH PARTITION {default}")
+    for lo, hi in missing:
+        bounds = f"FROM ('{lo.isoformat()}') TO ('{hi.isoformat()}')"
+        cursor.execute(f"CREATE TABLE {_q(_partition_name(table, lo))} PARTITION OF {_q(table)} FOR VALUES {bounds}")
+        window = f"{column} >= '{lo.isoformat()}' AND {column} < '{hi.isoformat()}'"
+        cursor.execute(f"INSERT INTO {_q(table)} SELECT * FROM {default} WHERE {window}")
+        cursor.execute(f"DELETE FROM {default} WHERE {window}")
+    cursor.execute(f"ALTER TABLE {_q(table)} ATTACH PARTITION {default} DEFAULT")
+    return [_partition_name(table, lo) for lo, _ in missing]
+
+
+def _convert(cursor, table, brin, ahead_until):
+    """Rebuild the plain table as a partitioned one with the same columns, keys and index names."""
+    column = _q(StoreStatus._meta.get_field('timestamp_utc').column)
+    pk = _q(StoreStatus._meta.pk.column)
+    old = f"{table}_unpartitioned"
+    cursor.execute(f"ALTER TABLE {_q(table)} RENAME TO {_q(old)}")
+    cursor.execute(f"CREATE TABLE {_q(table)} (LIKE {_q(old)} INCLUDING DEFAULTS INCLUDING IDENTITY) "
+                   f"PARTITION BY RANGE ({column})")
+    cursor.execute(f"CREATE TABLE {_q(table + '_default')} PARTITION OF {_q(table)} DEFAULT")
+    cursor.execute(f"SELECT MIN({column}), MAX({column}) FROM {_q(old)}")
+    first, last = cursor.fetchone()
+    created = _add_partitions(cursor, table, first or timezone.now(), max(filter(None, (last, ahead_until))))
+    cursor.execute(f"INSERT INTO {_q(table)} SELECT * FROM {_q(old)}")
+    # Drop the old table first: its indexes and constraints hold the names reused below
+    cursor.execute(f"DROP TABLE {_q(old)}")
+    cursor.execute(f"SELECT setval(pg_get_serial_sequence(%s, %s), COALESCE(MAX({pk}), 0) + 1, false) "
+                   f"FROM {_q(table)}", [table, StoreStatus._meta.pk.column])
+    # A partitioned table's keys must include the partition column
+    cursor.execute(f"ALTER TABLE {_q(table)} ADD PRIMARY KEY ({pk}, {column})")
+    with connection.schema_editor() as editor:
+        for constraint in StoreStatus._meta.constraints:
+            editor.add_constraint(StoreStatus, constraint)
+        for index in StoreStatus._meta.indexes:
+            if brin and index.fields == ['timestamp_utc']:
+                # Much smaller than a b-tree for append-mostly time data; window scans are range scans
+                cursor.execute(f"CREATE INDEX {_q(index.name)} ON {_q(table)} USING brin ({column})")
+            else:
+                editor.add_index(StoreStatus, index)
+    return created
+
+
+def partition_store_status(months_ahead=DEFAULT_MONTHS_AHEAD, brin=False):
+    """Partition StoreStatus by month (PostgreSQL only), or add partitions to it.
+
+    The first run rebuilds the table in one transaction: monthly partitions over
+    the existing polls plus `months_ahead` months, a DEFAULT partition for
+    anything else, and the same unique constraint and index names as the model.
+    `brin` makes the timestamp_utc index a BRIN index. Later runs only add the
+    months that are missing (polls already in DEFAULT are moved into them).
+    Returns {'converted': bool, 'created': [partition names]}.
+    """
+    if connection.vendor != 'postgresql':
+        raise ValueError(f"Partitioning StoreStatus needs PostgreSQL, not {connection.vendor}")
+    table = StoreStatus._meta.db_table
+    newest = StoreStatus.objects.aggregate(Max('timestamp_utc'))['timestamp_utc__max']
+    latest = newest or timezone.now()
+    ahead_until = _month_start(latest)
+    for _ in range(months_ahead):
+        ahead_until = _next_month(ahead_until)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        if not is_partitioned():
+            return {'converted': True, 'created': _convert(cursor, table, brin, ahead_until)}
+        column = _q(StoreStatus._meta.get_field('timestamp_utc').column)
+        cursor.execute(f"SELECT MIN({column}) FROM {_q(table + '_default')}")
+        first = cursor.fetchone()[0]
+        start = min(filter(None, (first, latest)))
+        return {'converted': False, 'created': _add_partitions(cursor, table, start, ahead_until)}
@@ -0,0 +1,120 @@
+import os
+import threading
+import time as timer
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max
+from store_monitor.engine import iter_store_polls
+from store_monitor.ingest import data_generation
+from store_monitor.instrumentation import log_event
+from store_monitor.lookups import lookup_version, store_lookups
+from store_monitor.models import StoreStatus
+from store_monitor.tasks import prepare_schedules, report_snapshot, report_windows, store_report_row
+
+DEFAULT_RECHECK_SECONDS = 30
+
+
+class PollIndex:
+    """Every store's report-window polls held in memory, for one-store lookups.
+
+    Holds the polls a report reads (the week before the newest poll plus each
+    store's prior poll) and the compiled schedules, so a store's row is computed
+    without touching the database. Never modified after it is built.
+    """
+
+    def __init__(self):
+        self.generation = data_generation()
+        self.snapshot = report_snapshot()
+        self.lookups = store_lookups()
+        self.now = StoreStatus.objects.aggregate(Max('timestamp_utc'))['timestamp_utc__max']
+        self.polls = {}
+        if self.now is not None:
+            self.windows = report_windows(self.now)
+            prepare_schedules(self.now)
+            self.polls = dict(iter_store_polls(since=self.windows[-1]))
+        self.checked = timer.monotonic()
+
+    def row(self, store_id):
+        """The store's report row ([store_id, uptime_last_hour, ...]); None for unknown stores."""
+        polls = self.polls.get(store_id)
+        if polls is None:
+            return None
+        schedule = self.lookups.schedule(store_id)
+        return store_report_row(store_id, self.now, *self.windows, schedule.tz, schedule, polls)
+
+    def stale(self):
+        # Ingestion bumps the generation (seen at once through the shared cache); the database
+        # is rechecked every POLL_INDEX_RECHECK_SECONDS to catch anything else: new polls, and
+        # timezones or business hours edited in place (the index holds its own compiled lookups)
+        if self.generation != data_generation():
+            return True
+        if timer.monotonic() - self.checked < getattr(settings, 'POLL_INDEX_RECHECK_SECONDS',
+                                                      DEFAULT_RECHECK_SECONDS):
+            return False
+        self.checked = timer.monotonic()
+        return report_snapshot() != self.snapshot or lookup_version() != self.lookups.version
+
+
+_lock = threading.Lock()
+_current = None
+_refreshing = False
+
+
+def poll_index():
+    """This process's PollIndex, or None until its first build has finished.
+
+    Builds always run in one background thread, started by warm_poll_index()
+    when the web application loads (or by the first call), so no request waits
+    on loading a week of polls. A stale index keeps answering while it is rebuilt.
+    """
+    index = _current
+    if index is None or index.stale():
+        _refresh_in_background()
+    return index
+
+
+def warm_poll_index():
+    """Start building this process's index (called from the WSGI / ASGI modules)."""
+    if _current is None:
+        _refresh_in_background()
+
+
+def refresh_poll_index():
+    """Rebuild this process's index now and return it."""
+    global _current
+    index = PollIndex()
+    with _lock:
+        _current = index
+    return index
+
+
+def _refresh_in_background():
+    global _refreshing
+    with _lock:
+        if _refreshing:
+            return
+        _refreshing = True
+    threading.Thread(target=_rebuild, daemon=True).start()
+
+
+def _rebuild():
+    global _refreshing
+    try:
+        refresh_poll_index()
+    except Exception as e:
+        # Lookups keep getting the previous index (or a 503); the next one retries
+        log_event('poll_index_failed', error=f'{type(e).__name__}: {e}')
+    finally:
+        _refreshing = False
+        connection.close()
+
+
+# A build running when a server forks its workers (e.g. gunicorn --preload) has no thread
+# in the children: let each child start its own
+def _after_fork():
+    global _lock, _refreshing
+    _lock = threading.Lock()
+    _refreshing = False
+
+
+os.register_at_fork(after_in_child=_after_fork)
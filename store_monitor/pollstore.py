@@ -0,0 +1,272 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import time as timer
+from array import array
+from contextlib import contextmanager
+from datetime import datetime
+from uuid import uuid4
+import numpy as np
+import pytz
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from store_monitor.engine import POLL_CHUNK_SIZE
+from store_monitor.models import StoreStatus
+from store_monitor.vectorized import load_schedules
+
+DAY_MICROS = 86400 * 10**6
+MANIFEST = 'manifest.json'
+VERSION_NAME = re.compile(r'v\d{8}T\d{12}')
+# A compaction holding the lock longer than this is presumed dead
+LOCK_TIMEOUT = 1800
+LOCK_POLL_SECONDS = 0.2
+
+
+def poll_store_path():
+    return str(getattr(settings, 'POLL_STORE_PATH', os.path.join(settings.BASE_DIR, 'poll_store')))
+
+
+def _epoch_micros(ts):
+    return round(ts.timestamp() * 10**6)
+
+
+def _write_partition(path, codes, micros, active, n_stores):
+    """One day of polls, sorted by (store code, ts).
+
+    offsets[c]:offsets[c + 1] are the rows of store code c, so a store range
+    is a contiguous slice of every column.
+    """
+    os.makedirs(path)
+    np.save(os.path.join(path, 'store.npy'), codes)
+    np.save(os.path.join(path, 'ts.npy'), micros)
+    np.save(os.path.join(path, 'status.npy'), np.packbits(active))
+    offsets = np.searchsorted(codes, np.arange(n_stores + 1)).astype(np.int64)
+    np.save(os.path.join(path, 'offsets.npy'), offsets)
+
+
+@contextmanager
+def compaction_lock(path):
+    """Serialize compactions of `path` across processes (cache.add in the shared default cache)."""
+    key = f"poll_store_lock:{hashlib.blake2b(str(path).encode(), digest_size=8).hexdigest()}"
+    token = uuid4().hex
+    while not cache.add(key, token, timeout=LOCK_TIMEOUT):
+        timer.sleep(LOCK_POLL_SECONDS)
+    try:
+        yield
+    finally:
+        if cache.get(key) == token:
+            cache.delete(key)
+
+
+def compact_poll_store(path=None, chunk_size=POLL_CHUNK_SIZE):
+    """Export StoreStatus into day-partitioned .npy columns under `path`.
+
+    stores.npy is the sorted store_id dictionary; each day directory holds
+    int32 store codes, int64 epoch microseconds, a packed status bitset and a
+    per-store offset index. Every export is a new version directory, published
+    by atomically replacing manifest.json, which names it; readers pin the
+    version they opened (see PollStore), so `path` is always there and a reader
+    never mixes two exports. The previous version is kept for readers still on
+    it. Compactions of one path run one at a time (compaction_lock).
+    Returns the manifest.
+    """
+    path = str(path or poll_store_path())
+    with compaction_lock(path):
+        return _export(path, chunk_size)
+
+
+def _export(path, chunk_size=POLL_CHUNK_SIZE):
+    store_ids = []
+    codes, micros, active = array('i'), array('q'), bytearray()
+    rows = StoreStatus.objects.order_by('store_id', 'timestamp_utc').values_list('store_id', 'timestamp_utc', 'status')
+    for store_id, ts, status in rows.iterator(chunk_size=chunk_size):
+        if not store_ids or store_ids[-1] != store_id:
+            store_ids.append(store_id)
+        codes.append(len(store_ids) - 1)
+        micros.append(_epoch_micros(ts))
+        active.append(status == 'active')
+    codes = np.frombuffer(codes, dtype=np.int32)
+    micros = np.frombuffer(micros, dtype=np.int64)
+    active = np.frombuffer(active, dtype=np.bool_)
+
+    previous = read_manifest(path)
+    version = datetime.now(pytz.utc).strftime('v%Y%m%dT%H%M%S%f')
+    root = os.path.join(path, version)
+    os.makedirs(root)
+    np.save(os.path.join(root, 'stores.npy'), np.asarray(store_ids, dtype=str))
+
+    # Stable sort by day keeps the (store, ts) order inside each partition
+    days = micros // DAY_MICROS
+    order = np.argsort(days, kind='stable')
+    day_values, starts = np.unique(days[order], return_index=True)
+    partitions = []
+    for day, idx in zip(day_values, np.split(order, starts[1:])):
+        name = datetime.fromtimestamp(int(day) * 86400, pytz.utc).strftime('%Y-%m-%d')
+        _write_partition(os.path.join(root, name), codes[idx], micros[idx], active[idx], len(store_ids))
+        partitions.append(name)
+
+    manifest = {
+        'version': version,
+        'rows': len(micros),
+        'stores': len(store_ids),
+        'partitions': partitions,
+        'max_timestamp_us': int(micros.max()) if len(micros) else None,
+    }
+    tmp = os.path.join(path, MANIFEST + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(path, MANIFEST))
+
+    # Older versions (and any a failed export left behind) have no readers left
+    keep = {version, (previous or {}).get('version')}
+    for name in os.listdir(path):
+        if VERSION_NAME.fullmatch(name) and name not in keep:
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+    return manifest
+
+
+def read_manifest(path=None):
+    try:
+        with open(os.path.join(path or poll_store_path(), MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _is_current(manifest, stats):
+    if manifest is None or 'version' not in manifest:
+        return False
+    latest = _epoch_micros(stats['latest']) if stats['latest'] else None
+    return (manifest['rows'], manifest['max_timestamp_us']) == (stats['rows'], latest)
+
+
+# Re-export when the table has changed since the last compaction (row count or newest
+# poll). Concurrent callers wait for one compaction and all use its export.
+def refresh_poll_store(path=None):
+    path = str(path or poll_store_path())
+    stats = StoreStatus.objects.aggregate(rows=Count('id'), latest=Max('timestamp_utc'))
+    manifest = read_manifest(path)
+    if _is_current(manifest, stats):
+        return manifest
+    with compaction_lock(path):
+        manifest = read_manifest(path)
+        return manifest if _is_current(manifest, stats) else _export(path)
+
+
+class PollStore:
+    """Read side of the compacted poll files.
+
+    Every column is opened with np.load(mmap_mode='r'), so a scan only pages
+    in the slices it touches and nothing is parsed or copied per row.
+    """
+
+    def __init__(self, path=None):
+        self.path = str(path or poll_store_path())
+        self.manifest = read_manifest(self.path)
+        if self.manifest is None:
+            raise FileNotFoundError(f"No poll store at {self.path}; run compact_poll_store")
+        # Pinned to the export the manifest named when opened, even if a newer one lands
+        self.root = os.path.join(self.path, self.manifest['version'])
+        self.stores = np.load(os.path.join(self.root, 'stores.npy'), mmap_mode='r')
+
+    def _column(self, partition, name):
+        return np.load(os.path.join(self.root, partition, f'{name}.npy'), mmap_mode='r')
+
+    # Store code range [lo, hi) for an inclusive (first, last) store_id range
+    def code_range(self, store_range=None):
+        if store_range is None:
+            return 0, len(self.stores)
+        first, last = store_range
+        return (int(np.searchsorted(self.stores, first, side='left')),
+                int(np.searchsorted(self.stores, last, side='right')))
+
+    @staticmethod
+    def _day(since):
+        return since.astimezone(pytz.utc).strftime('%Y-%m-%d')
+
+    def _prior(self, partitions, lo, hi):
+        """Each store's newest poll in `partitions`, as one scan slice.
+
+        Walks the partitions newest first and stops once every store is found,
+        reading one row per store from each partition it touches.
+        """
+        micros, active = np.zeros(hi - lo, np.int64), np.zeros(hi - lo, np.bool_)
+        found = np.zeros(hi - lo, np.bool_)
+        for partition in reversed(partitions):
+            offsets = self._column(partition, 'offsets')[lo:hi + 1]
+            new = (np.diff(offsets) > 0) & ~found
+            if new.any():
+                last = offsets[1:][new] - 1
+                micros[new] = self._column(partition, 'ts')[last]
+                bits = self._column(partition, 'status')[last // 8]
+                active[new] = (bits >> (7 - last % 8)) & 1
+                found |= new
+                if found.all():
+                    break
+        offsets = np.concatenate([[0], np.cumsum(found)]).astype(np.int64)
+        return offsets, micros[found], active[found]
+
+    def scan(self, store_range=None, since=None):
+        """Yield (offsets, epoch micros, active) per day partition, oldest first.
+
+        offsets are relative to the first row of the range (one per store plus
+        an end marker); the columns are zero-copy views of the mapped files.
+        With `since`, partitions from its day on are read in full and older ones
+        only for each store's latest poll (yielded first, as one slice).
+        """
+        lo, hi = self.code_range(store_range)
+        partitions = self.manifest['partitions']
+        if since is not None:
+            day = self._day(since)
+            older = [p for p in partitions if p < day]
+            partitions = [p for p in partitions if p >= day]
+            if older:
+                yield self._prior(older, lo, hi)
+        for partition in partitions:
+            offsets = self._column(partition, 'offsets')[lo:hi + 1]
+            start, end = int(offsets[0]), int(offsets[-1])
+            if start == end:
+                continue
+            bits = self._column(partition, 'status')[start // 8:(end + 7) // 8]
+            active = np.unpackbits(bits, count=end - (start // 8) * 8)[start % 8:].view(np.bool_)
+            yield offsets - start, self._column(partition, 'ts')[start:end], active
+
+    def load_columns(self, store_range=None, since=None):
+        """Same polls as vectorized.load_poll_columns, read from the files.
+
+        Every store in the dictionary has polls, so store_idx is the code minus
+        the start of the range. Rows are scattered straight into (store, ts)
+        order using the offset indexes: store c's rows from a partition go
+        after its rows from every earlier partition. With `since` this can keep
+        a few more polls than the ORM loader (the rest of since's day), which
+        doesn't change any report window.
+        """
+        lo, hi = self.code_range(store_range)
+        slices = list(self.scan(store_range, since))
+        counts = np.array([np.diff(offsets) for offsets, _, _ in slices]).reshape(len(slices), hi - lo)
+        per_store = counts.sum(axis=0)
+        store_start = np.concatenate([[0], np.cumsum(per_store)[:-1]])
+        earlier = np.cumsum(counts, axis=0) - counts
+
+        n = int(per_store.sum())
+        epochs, active = np.empty(n, np.float64), np.empty(n, np.bool_)
+        for (offsets, micros, bits), before in zip(slices, earlier):
+            shift = np.repeat(store_start + before - offsets[:-1], np.diff(offsets))
+            dest = shift + np.arange(len(micros))
+            epochs[dest] = micros / 10**6
+            active[dest] = bits
+        return (
+            self.stores[lo:hi].tolist(),
+            np.repeat(np.arange(hi - lo, dtype=np.int64), per_store),
+            epochs,
+            active,
+        )
+
+
+# Drop-in for vectorized.load_vectorized_inputs backed by the compacted files
+def load_pollstore_inputs(store_range=None, since=None):
+    store_ids, store_idx, epochs, active = PollStore().load_columns(store_range, since)
+    return store_ids, store_idx, epochs, active, load_schedules(store_ids)
@@ -0,0 +1,148 @@
+import csv
+import gzip
+import io
+import os
+import time as timer
+from importlib.util import find_spec
+from itertools import islice
+from store_monitor.instrumentation import Metrics
+
+# zstandard and pyarrow are optional and only imported by the writers that need them:
+# this module is loaded by the web process (through the serializers) and pyarrow pulls in numpy
+HAS_ZSTANDARD = find_spec('zstandard') is not None
+HAS_PYARROW = find_spec('pyarrow') is not None
+
+# Rows encoded per write; the writer never holds more than one batch
+BATCH_ROWS = 5000
+
+REPORT_HEADER = [
+    'store_id',
+    'uptime_last_hour',
+    'uptime_last_day',
+    'uptime_last_week',
+    'downtime_last_hour',
+    'downtime_last_day',
+    'downtime_last_week'
+]
+
+
+class CsvWriter:
+    """CSV over a binary file, optionally through a compressing stream."""
+
+    def __init__(self, raw, header=REPORT_HEADER, compress=None):
+        self.stream = compress(raw) if compress else None
+        self.text = io.TextIOWrapper(raw if self.stream is None else self.stream, encoding='utf-8', newline='')
+        self.writer = csv.writer(self.text)
+        self.writer.writerow(header)
+
+    def write_batch(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.text.flush()
+        self.text.detach()
+        if self.stream is not None:
+            self.stream.close()
+
+
+class ParquetWriter:
+    """One row group per batch, so memory stays at one batch of columns."""
+
+    def __init__(self, raw, header=REPORT_HEADER):
+        import pyarrow
+        import pyarrow.parquet as parquet
+        self.pyarrow = pyarrow
+        columns = [pyarrow.field('store_id', pyarrow.string())]
+        columns += [pyarrow.field(name, pyarrow.int64()) for name in header[1:]]
+        self.schema = pyarrow.schema(columns)
+        self.writer = parquet.ParquetWriter(raw, self.schema)
+
+    def write_batch(self, rows):
+        columns = [list(column) for column in zip(*rows)]
+        self.writer.write_batch(self.pyarrow.record_batch(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+class _TimedFile:
+    """Passes everything through to `raw`, charging write() calls to the 'write' stage."""
+
+    def __init__(self, raw, metrics):
+        self.raw = raw
+        self.metrics = metrics
+
+    def write(self, data):
+        with self.metrics.stage('write'):
+            return self.raw.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+def _gzip(raw):
+    return gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6, mtime=0)
+
+
+def _zstd(raw):
+    import zstandard
+    return zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=False)
+
+
+# name: (file extension, content type, writer factory, available)
+REPORT_FORMATS = {
+    'csv': ('csv', 'text/csv', CsvWriter, True),
+    'csv.gz': ('csv.gz', 'application/gzip', lambda raw, header: CsvWriter(raw, header, _gzip), True),
+    'csv.zst': ('csv.zst', 'application/zstd', lambda raw, header: CsvWriter(raw, header, _zstd),
+                HAS_ZSTANDARD),
+    'parquet': ('parquet', 'application/vnd.apache.parquet', ParquetWriter, HAS_PYARROW),
+}
+DEFAULT_FORMAT = 'csv'
+
+
+def available_formats():
+    return [name for name, (_, _, _, available) in REPORT_FORMATS.items() if available]
+
+
+def format_extension(fmt):
+    return REPORT_FORMATS[fmt][0]
+
+
+def format_content_type(fmt):
+    return REPORT_FORMATS[fmt][1]
+
+
+def write_rows(path, rows, fmt=DEFAULT_FORMAT, batch_rows=None, metrics=None, header=REPORT_HEADER):
+    """Stream rows into `path` in batches of `batch_rows`. Returns (rows, bytes).
+
+    Written to a temporary file and renamed into place, so readers never see
+    a partial report. With `metrics` (instrumentation.Metrics), time spent in
+    file writes goes to the 'write' stage and the rest of the writer's time
+    (encoding, compression) to 'serialize'.
+    """
+    _, _, writer_class, available = REPORT_FORMATS[fmt]
+    if not available:
+        raise ValueError(f"Report format {fmt!r} needs an optional dependency that is not installed")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    count = 0
+    rows = iter(rows)
+    metrics = metrics or Metrics()
+    with open(tmp, 'wb') as raw:
+        # Rows are pulled outside the timed calls, so producing them is not charged here
+        writer = _serialized(metrics, writer_class, _TimedFile(raw, metrics), header)
+        while batch := list(islice(rows, batch_rows or BATCH_ROWS)):
+            _serialized(metrics, writer.write_batch, batch)
+            count += len(batch)
+        _serialized(metrics, writer.close)
+    with metrics.stage('write'):
+        os.replace(tmp, path)
+    return count, os.path.getsize(path)
+
+
+def _serialized(metrics, call, *args):
+    written = metrics.seconds['write']
+    start = timer.perf_counter()
+    result = call(*args)
+    metrics.add('serialize', timer.perf_counter() - start - (metrics.seconds['write'] - written))
+    return result
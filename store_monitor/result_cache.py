@@ -0,0 +1,127 @@
+import hashlib
+import pickle
+import threading
+from collections import Counter, OrderedDict
+from django.conf import settings
+from django.core.cache import cache, caches
+from store_monitor.schedule import WeeklySchedule
+
+DEFAULT_ALIAS = 'store_reports'
+DEFAULT_LOCAL_MAX_BYTES = 32 * 2**20
+DEFAULT_TIMEOUT = 3600
+STAT_NAMES = ('local_hits', 'shared_hits', 'misses')
+
+
+def input_version(tz, business_hours, polls):
+    """Digest of everything a store's row depends on besides the report time.
+
+    Covers the timezone, the business hours and the polls' high-water mark
+    (count and newest timestamp), so editing hours or a timezone, or loading
+    polls, changes the key instead of serving a stale row. business_hours may
+    be a dict, None (open all day) or a compiled WeeklySchedule.
+    """
+    if isinstance(business_hours, WeeklySchedule):
+        hours = business_hours.key
+    else:
+        hours = sorted((day, str(start), str(end)) for day, (start, end) in (business_hours or {}).items())
+    newest = polls[-1][0].isoformat() if polls else ''
+    return hashlib.blake2b(repr((str(tz), hours, len(polls), newest)).encode(), digest_size=12).hexdigest()
+
+
+class LRUCache:
+    """Process-local LRU bounded by the pickled size of its values."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= evicted
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+class StoreReportCache:
+    """Two-tier cache for per-store report rows.
+
+    A bounded in-process LRU sits in front of a Django cache alias
+    (STORE_REPORT_CACHE_ALIAS) that can be shared between workers, e.g. a
+    Redis or file-based cache. Hit/miss counts are kept per process and added
+    by flush_stats() to counters in the default cache, which every process
+    shares whatever backs the rows.
+    """
+
+    def __init__(self):
+        self.local = LRUCache(getattr(settings, 'STORE_REPORT_CACHE_MAX_BYTES', DEFAULT_LOCAL_MAX_BYTES))
+        self.stats = Counter()
+
+    @property
+    def shared(self):
+        return caches[getattr(settings, 'STORE_REPORT_CACHE_ALIAS', DEFAULT_ALIAS)]
+
+    @staticmethod
+    def key(store_id, now_utc, tz, business_hours, polls):
+        return f"store_report:{store_id}:{now_utc.isoformat()}:{input_version(tz, business_hours, polls)}"
+
+    def get(self, key):
+        row = self.local.get(key)
+        if row is not None:
+            self.stats['local_hits'] += 1
+            return row
+        row = self.shared.get(key)
+        if row is not None:
+            self.stats['shared_hits'] += 1
+            self.local.set(key, row, len(pickle.dumps(row)))
+            return row
+        self.stats['misses'] += 1
+        return None
+
+    def set(self, key, row):
+        self.local.set(key, row, len(pickle.dumps(row)))
+        self.shared.set(key, row, timeout=getattr(settings, 'STORE_REPORT_CACHE_TIMEOUT', DEFAULT_TIMEOUT))
+
+    def flush_stats(self):
+        for name in STAT_NAMES:
+            count = self.stats.pop(name, 0)
+            if count:
+                cache.add(f"store_report_cache:{name}", 0, timeout=None)
+                cache.incr(f"store_report_cache:{name}", count)
+
+    def clear(self):
+        self.local.clear()
+        self.stats.clear()
+
+
+store_report_cache = StoreReportCache()
+
+
+# Counters across every process that flushed them
+def cache_stats():
+    store_report_cache.flush_stats()
+    stats = {name: cache.get(f"store_report_cache:{name}", 0) for name in STAT_NAMES}
+    lookups = sum(stats.values())
+    stats['hit_rate'] = round((lookups - stats['misses']) / lookups, 4) if lookups else None
+    return stats
@@ -0,0 +1,74 @@
+from datetime import datetime, time, timedelta
+from itertools import groupby
+from operator import itemgetter
+import pytz
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min
+from store_monitor.engine import POLL_CHUNK_SIZE, prior_poll_ids
+from store_monitor.models import StoreDailySummary, StoreStatus
+
+# Reports look back 7 days from the newest poll, so those polls always stay in StoreStatus
+MIN_RETENTION_DAYS = 7
+DEFAULT_RETENTION_DAYS = 30
+
+
+def retention_days():
+    return getattr(settings, 'POLL_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+
+
+def _summarize(store_id, polls, summary):
+    """Fold one store's polls for a day into its summary (new or partly archived)."""
+    active = sum(1 for _, is_active in polls if is_active)
+    if summary is None:
+        summary = StoreDailySummary(store_id=store_id, day=polls[0][0].date(), polls=0, active_polls=0,
+                                    first_poll_ts=polls[0][0], last_poll_ts=polls[-1][0], last_active=polls[-1][1])
+    summary.polls += len(polls)
+    summary.active_polls += active
+    summary.first_poll_ts = min(summary.first_poll_ts, polls[0][0])
+    if polls[-1][0] >= summary.last_poll_ts:
+        summary.last_poll_ts, summary.last_active = polls[-1]
+    return summary
+
+
+def archive_polls(keep_days=None):
+    """Roll polls older than `keep_days` before the newest poll into StoreDailySummary.
+
+    Works one UTC day at a time, oldest first, each day in its own transaction
+    (summarize, then delete the raw rows). Each store's latest poll before the
+    cutoff is kept: it carries the store's status into the report window (see
+    engine.report_polls), so reports are unchanged. Summaries of a day that was
+    partly archived before are merged. Returns archive stats.
+    """
+    keep_days = retention_days() if keep_days is None else keep_days
+    if keep_days < MIN_RETENTION_DAYS:
+        raise ValueError(f"Polls must be kept for at least {MIN_RETENTION_DAYS} days (the report window)")
+    stats = {'cutoff': None, 'archived': 0, 'days': 0, 'summaries': 0}
+    newest = StoreStatus.objects.aggregate(Max('timestamp_utc'))['timestamp_utc__max']
+    if newest is None:
+        return stats
+    cutoff = stats['cutoff'] = newest - timedelta(days=keep_days)
+    old = StoreStatus.objects.filter(timestamp_utc__lt=cutoff).exclude(pk__in=prior_poll_ids(cutoff))
+
+    while True:
+        oldest = old.aggregate(Min('timestamp_utc'))['timestamp_utc__min']
+        if oldest is None:
+            return stats
+        day = oldest.astimezone(pytz.utc).date()
+        day_end = datetime.combine(day + timedelta(days=1), time(0), tzinfo=pytz.utc)
+        with transaction.atomic():
+            batch = old.filter(timestamp_utc__lt=day_end)
+            existing = {s.store_id: s for s in StoreDailySummary.objects.filter(day=day)}
+            rows = batch.order_by('store_id', 'timestamp_utc').values_list('store_id', 'timestamp_utc', 'status')
+            summaries = [
+                _summarize(store_id, [(ts, status == 'active') for _, ts, status in group], existing.get(store_id))
+                for store_id, group in groupby(rows.iterator(chunk_size=POLL_CHUNK_SIZE), key=itemgetter(0))
+            ]
+            StoreDailySummary.objects.bulk_create(
+                summaries, batch_size=2000, update_conflicts=True, unique_fields=['store_id', 'day'],
+                update_fields=['polls', 'active_polls', 'first_poll_ts', 'last_poll_ts', 'last_active'],
+            )
+            deleted, _ = batch.delete()
+        stats['archived'] += deleted
+        stats['days'] += 1
+        stats['summaries'] += len(summaries)
@@ -0,0 +1,152 @@
+import math
+from bisect import bisect_right
+from datetime import datetime
+
+DAY_SECONDS = 24 * 3600
+WEEK_SECONDS = 7 * DAY_SECONDS
+# 1970-01-01 was a Thursday: shift epoch seconds so week offsets start Monday 00:00
+EPOCH_MONDAY_SHIFT = 3 * DAY_SECONDS
+# Offsets are probed this far apart; real zones never change offset twice within it
+TRANSITION_PROBE_SECONDS = 7 * DAY_SECONDS
+
+
+def utc_offset(tz, epoch):
+    return int(datetime.fromtimestamp(epoch, tz).utcoffset().total_seconds())
+
+
+# UTC offset changes (DST transitions) in (start, end]: [(epoch, new_offset), ...]
+def utc_transitions(tz, start, end):
+    transitions = []
+    lo = math.floor(start)
+    offset_lo = utc_offset(tz, lo)
+    stop = math.ceil(end)
+    while lo < stop:
+        hi = min(lo + TRANSITION_PROBE_SECONDS, stop)
+        if utc_offset(tz, hi) == offset_lo:
+            lo = hi
+            continue
+        # Bisect down to the first second with the new offset
+        a, b = lo, hi
+        while b - a > 1:
+            mid = (a + b) // 2
+            if utc_offset(tz, mid) == offset_lo:
+                a = mid
+            else:
+                b = mid
+        offset_lo = utc_offset(tz, b)
+        transitions.append((b, offset_lo))
+        lo = b
+    return transitions
+
+
+class OffsetTable:
+    """A zone's UTC offsets over [lo, hi), computed once and shared by its schedules.
+
+    bounds[i] is where offsets[i] starts to apply (bounds[0] == lo).
+    """
+
+    def __init__(self, tz, lo, hi):
+        self.lo, self.hi = lo, hi
+        self.bounds, self.offsets = [lo], [utc_offset(tz, lo)]
+        for transition, new_offset in utc_transitions(tz, lo, hi):
+            self.bounds.append(transition)
+            self.offsets.append(new_offset)
+
+
+# Span [lo, hi) around epoch over which tz keeps a constant UTC offset
+def offset_span(tz, epoch):
+    lo, hi = epoch - TRANSITION_PROBE_SECONDS, epoch + TRANSITION_PROBE_SECONDS
+    offset = utc_offset(tz, lo)
+    for transition, new_offset in utc_transitions(tz, lo, hi):
+        if transition > epoch:
+            return lo, transition, offset
+        lo, offset = transition, new_offset
+    return lo, hi, offset
+
+
+class WeeklySchedule:
+    """Business hours compiled into sorted open/close offsets within a local week.
+
+    `opens`/`closes` are seconds from Monday 00:00 local time (minute aligned,
+    merged and non-overlapping) and `prefix[i]` is the business time before
+    segment i, so the business time up to any instant is one bisect. Overnight
+    shifts (end < start) run into the next day, Sunday wrapping to Monday.
+    business_hours=None means open around the clock.
+    """
+
+    def __init__(self, business_hours, tz):
+        self.tz = tz
+        self._span = (0, 0, 0)
+        self.offset_table = None
+        segments = [] if business_hours is not None else [(0, WEEK_SECONDS)]
+        for day, (start, end) in (business_hours or {}).items():
+            open_s = day * DAY_SECONDS + start.hour * 3600 + start.minute * 60
+            close_s = day * DAY_SECONDS + end.hour * 3600 + end.minute * 60
+            if close_s < open_s:
+                close_s += DAY_SECONDS
+            if close_s > WEEK_SECONDS:
+                segments.append((0, close_s - WEEK_SECONDS))
+                close_s = WEEK_SECONDS
+            if open_s < close_s:
+                segments.append((open_s, close_s))
+
+        self.opens, self.closes, self.prefix = [], [], []
+        total = 0
+        for open_s, close_s in sorted(segments):
+            if self.closes and open_s <= self.closes[-1]:
+                if close_s > self.closes[-1]:
+                    total += close_s - self.closes[-1]
+                    self.closes[-1] = close_s
+                continue
+            self.opens.append(open_s)
+            self.closes.append(close_s)
+            self.prefix.append(total)
+            total += close_s - open_s
+        self.week_total = total
+        self.key = (str(tz), tuple(self.opens), tuple(self.closes))
+
+    # Business seconds in [Monday 00:00 of the epoch week, local)
+    def _local_cumulative(self, local):
+        weeks, offset = divmod(local + EPOCH_MONDAY_SHIFT, WEEK_SECONDS)
+        total = weeks * self.week_total
+        i = bisect_right(self.opens, offset) - 1
+        if i >= 0:
+            total += self.prefix[i] + min(offset, self.closes[i]) - self.opens[i]
+        return total
+
+    # Business seconds between two epoch times, split at DST transitions
+    def seconds_between(self, start, end):
+        if start >= end:
+            return 0
+        table = self.offset_table
+        if table is not None and table.lo <= start and end <= table.hi:
+            return self._seconds_from_table(table, start, end)
+        lo, hi, offset = self._span
+        if not lo <= start < hi:
+            lo, hi, offset = self._span = offset_span(self.tz, start)
+        if end <= hi:
+            return self._local_cumulative(end + offset) - self._local_cumulative(start + offset)
+
+        total = 0
+        offset = utc_offset(self.tz, start)
+        for transition, new_offset in utc_transitions(self.tz, start, end):
+            if transition >= end:
+                break
+            total += self._local_cumulative(transition + offset) - self._local_cumulative(start + offset)
+            start, offset = transition, new_offset
+        return total + self._local_cumulative(end + offset) - self._local_cumulative(start + offset)
+
+    # Same as the transition loop in seconds_between, with offsets from a precomputed table
+    def _seconds_from_table(self, table, start, end):
+        i = bisect_right(table.bounds, start) - 1
+        total = 0
+        while i + 1 < len(table.bounds) and table.bounds[i + 1] < end:
+            offset = table.offsets[i]
+            total += self._local_cumulative(table.bounds[i + 1] + offset) - self._local_cumulative(start + offset)
+            start = table.bounds[i + 1]
+            i += 1
+        offset = table.offsets[i]
+        return total + self._local_cumulative(end + offset) - self._local_cumulative(start + offset)
+
+    def minutes(self, start_utc, end_utc):
+        return self.seconds_between(start_utc.timestamp(), end_utc.timestamp()) / 60
@@ -1,5 +1,8 @@
 from rest_framework import serializers
 from .models import *
+from .browse import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from .engine import WINDOW_RE, known_stores
+from .report_formats import DEFAULT_FORMAT, REPORT_FORMATS, available_formats
 
 class TimezoneSerializer(serializers.ModelSerializer):
      class Meta:
@@ -16,9 +19,59 @@ class StoreStatusSerializer(serializers.ModelSerializer):
         model = StoreStatus
         fields = ['store_id', 'timestamp_utc', 'status']
 
+class TableQuerySerializer(serializers.Serializer):
+    store_id = serializers.CharField(required=False)
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=MAX_PAGE_SIZE, default=DEFAULT_PAGE_SIZE)
+    cursor = serializers.CharField(required=False)
+    export = serializers.ChoiceField(choices=['ndjson'], required=False)
+
+MAX_REPORT_WINDOWS = 10
+MAX_REPORT_STORES = 10000
+
 class TriggerReportSerializer(serializers.Serializer):
     report_id = serializers.CharField()
 
+# A list, also accepted as one comma-separated string (e.g. from a query string)
+class CommaListField(serializers.ListField):
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = [item.strip() for item in data.split(',') if item.strip()]
+        return super().to_internal_value(data)
+
+class TriggerReportRequestSerializer(serializers.Serializer):
+    format = serializers.ChoiceField(choices=list(REPORT_FORMATS), default=DEFAULT_FORMAT)
+    as_of = serializers.DateTimeField(required=False)
+    windows = CommaListField(
+        child=serializers.RegexField(WINDOW_RE, error_messages={'invalid': "Expected e.g. 30m, 1h, 3d or 2w"}),
+        required=False, allow_empty=False, max_length=MAX_REPORT_WINDOWS,
+    )
+    store_ids = CommaListField(child=serializers.CharField(max_length=50), required=False, allow_empty=False,
+                               max_length=MAX_REPORT_STORES)
+
+    def validate_format(self, value):
+        if value not in available_formats():
+            raise serializers.ValidationError(f"'{value}' needs an optional dependency that is not installed")
+        return value
+
+    def validate_store_ids(self, value):
+        unknown = sorted(set(value) - known_stores(value))
+        if unknown:
+            shown = ', '.join(unknown[:20]) + (f' and {len(unknown) - 20} more' if len(unknown) > 20 else '')
+            raise serializers.ValidationError(f"Unknown store ids: {shown}")
+        return value
+
 class GetReportSerializer(serializers.Serializer):
     status = serializers.CharField()
-    csv_content = serializers.CharField(required=False)
\ No newline at end of file
+    csv_content = serializers.CharField(required=False)
+    shards_done = serializers.IntegerField(required=False)
+    shards_total = serializers.IntegerField(required=False)
+    error = serializers.CharField(required=False)
+    rows = serializers.IntegerField(required=False)
+    size = serializers.IntegerField(required=False)
+    queue_wait_seconds = serializers.FloatField(required=False)
+    compute_seconds = serializers.FloatField(required=False)
+    format = serializers.CharField(required=False)
+    params = serializers.DictField(required=False)
+    download_url = serializers.CharField(required=False)
\ No newline at end of file
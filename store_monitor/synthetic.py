@@ -0,0 +1,137 @@
+import csv
+import os
+import random
+import uuid
+from datetime import datetime, timedelta, time
+import pytz
+from store_monitor.models import StoreStatus, BusinessHour, Timezone
+
+# Deterministic synthetic data for benchmarks and tests
+TIMEZONES = ['America/Chicago', 'America/New_York', 'America/Denver', 'America/Los_Angeles']
+DEFAULT_END = datetime(2023, 1, 25, 18, 0, tzinfo=pytz.utc)
+QUARTERS = [0, 15, 30, 45]
+
+
+# Business-hour shapes: (day, open, close) rows for one store. 'all_day' has no rows
+# (the open-all-day fallback); 'overnight' closes after midnight.
+def _day_shift(rng):
+    return [(day, time(rng.randint(6, 11), rng.choice(QUARTERS)), time(rng.randint(17, 23), rng.choice(QUARTERS)))
+            for day in range(7)]
+
+
+def _overnight_shift(rng):
+    return [(day, time(rng.randint(18, 22), rng.choice(QUARTERS)), time(rng.randint(1, 4), rng.choice(QUARTERS)))
+            for day in range(7)]
+
+
+def _weekdays_shift(rng):
+    return [row for row in _day_shift(rng) if row[0] < 5]
+
+
+HOUR_SHAPES = {
+    'day': _day_shift,
+    'overnight': _overnight_shift,
+    'weekdays': _weekdays_shift,
+    'all_day': lambda rng: [],
+}
+
+
+def _pick(rng, weights):
+    """Weighted choice from a {value: weight} dict (no draw when there is one value)."""
+    if len(weights) == 1:
+        return next(iter(weights))
+    if len(set(weights.values())) == 1:
+        return rng.choice(list(weights))
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def generate_dataset(stores=100, days=7, poll_minutes=60, seed=0, end=DEFAULT_END, timezone_mix=None,
+                     timezone_coverage=0.9, hours_coverage=0.8, hour_shapes=None, outage_minutes=None,
+                     jitter_minutes=0, drop_rate=0.0):
+    """Build (timezones, business_hours, polls) lists of unsaved model objects.
+
+    Every store is polled every `poll_minutes` for `days` days ending at `end`.
+    Some stores have no timezone or hours so the fallbacks get exercised too.
+
+    timezone_mix / hour_shapes: {name: weight} (default: the four US zones
+    evenly, 'day' shifts only; see HOUR_SHAPES). Each store's uptime is drawn
+    from U(0.7, 1.0). By default each poll is independently down; with
+    `outage_minutes` outages come in bursts of that mean length instead.
+    `jitter_minutes` moves each poll by up to that much either way (capped
+    below half the interval, so polls stay ordered) and `drop_rate` skips
+    polls, leaving gaps. Same arguments, same dataset; the
+    defaults reproduce the original generator.
+    """
+    rng = random.Random(seed)
+    timezone_mix = timezone_mix or dict.fromkeys(TIMEZONES, 1)
+    hour_shapes = hour_shapes or {'day': 1}
+    timezones, hours, polls = [], [], []
+    start = end - timedelta(days=days)
+    step = timedelta(minutes=poll_minutes)
+    jitter_seconds = min(jitter_minutes * 60, poll_minutes * 30 - 1)
+
+    for _ in range(stores):
+        store_id = str(uuid.UUID(int=rng.getrandbits(128)))
+
+        if rng.random() < timezone_coverage:
+            timezones.append(Timezone(store_id=store_id, timezone_str=_pick(rng, timezone_mix)))
+
+        if rng.random() < hours_coverage:
+            for day, opens, closes in HOUR_SHAPES[_pick(rng, hour_shapes)](rng):
+                hours.append(BusinessHour(store_id=store_id, day_of_week=day,
+                                          start_time_local=opens, end_time_local=closes))
+
+        uptime = rng.uniform(0.7, 1.0)
+        if outage_minutes:
+            # Two-state chain: mean outage of `outage_minutes`, down (1 - uptime) of the time
+            outage_polls = max(outage_minutes / poll_minutes, 1)
+            recover = 1 / outage_polls
+            fail = min((1 - uptime) * recover / uptime, 1)
+            active = True
+        ts = start + timedelta(seconds=rng.randint(0, int(step.total_seconds()) - 1),
+                               microseconds=rng.choice([0, rng.randint(1, 999999)]))
+        while ts <= end:
+            if outage_minutes:
+                active = rng.random() >= fail if active else rng.random() < recover
+            else:
+                active = rng.random() < uptime
+            poll_ts = ts
+            if jitter_seconds > 0:
+                poll_ts += timedelta(seconds=rng.randint(-jitter_seconds, jitter_seconds))
+            if poll_ts <= end and (not drop_rate or rng.random() >= drop_rate):
+                status = 'active' if active else 'inactive'
+                polls.append(StoreStatus(store_id=store_id, timestamp_utc=poll_ts, status=status))
+            ts += step
+
+    return timezones, hours, polls
+
+
+def load_dataset(batch_size=5000, **kwargs):
+    """Generate a dataset and bulk insert it. Returns the number of polls."""
+    timezones, hours, polls = generate_dataset(**kwargs)
+    Timezone.objects.bulk_create(timezones, batch_size=batch_size)
+    BusinessHour.objects.bulk_create(hours, batch_size=batch_size)
+    StoreStatus.objects.bulk_create(polls, batch_size=batch_size)
+    return len(polls)
+
+
+def write_csvs(data_path, **kwargs):
+    """Generate a dataset as timezones.csv / menu_hours.csv / store_status.csv."""
+    timezones, hours, polls = generate_dataset(**kwargs)
+    os.makedirs(data_path, exist_ok=True)
+    with open(os.path.join(data_path, 'timezones.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['store_id', 'timezone_str'])
+        writer.writerows((t.store_id, t.timezone_str) for t in timezones)
+    with open(os.path.join(data_path, 'menu_hours.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['store_id', 'dayOfWeek', 'start_time_local', 'end_time_local'])
+        writer.writerows((h.store_id, h.day_of_week, h.start_time_local.strftime('%H:%M:%S'),
+                          h.end_time_local.strftime('%H:%M:%S')) for h in hours)
+    with open(os.path.join(data_path, 'store_status.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['store_id', 'status', 'timestamp_utc'])
+        for p in polls:
+            fmt = '%Y-%m-%d %H:%M:%S.%f UTC' if p.timestamp_utc.microsecond else '%Y-%m-%d %H:%M:%S UTC'
+            writer.writerow((p.store_id, p.status, p.timestamp_utc.strftime(fmt)))
+    return len(polls)
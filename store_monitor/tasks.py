@@ -1,167 +1,577 @@
-from celery import shared_task
+from bisect import bisect_right
+from celery import chord, shared_task
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+import django
 from django.db.models import Max
-from datetime import datetime, timedelta, time
+from datetime import datetime, timedelta
+import hashlib
+import json
 import pytz
-import csv
 import os
-from store_monitor.models import StoreStatus, BusinessHour, Timezone
+import shutil
+from uuid import uuid4
+from store_monitor.models import IngestionWatermark, Report, StoreStatus
+from store_monitor.aggregates import incremental_report_rows
+from store_monitor.downloads import report_path
+from store_monitor.engine import (
+    DEFAULT_WINDOWS, REPORT_ENGINES, StorePolls, report_row, window_header, window_length,
+)
+from store_monitor.ingest import DATA_PATH, IngestProgress, import_all
+from store_monitor.instrumentation import Metrics, log_event, profiled, record_ingest, record_report
+from store_monitor.lookups import store_lookups
+from store_monitor.result_cache import store_report_cache
+from store_monitor.report_formats import DEFAULT_FORMAT, REPORT_HEADER, write_rows
+from store_monitor.schedule import WeeklySchedule
 from django.conf import settings
 from django.core.cache import cache
-import io
+from django.utils import timezone
 
 # Calculate minutes within business hours between two UTC timestamps
 def business_minutes(start_utc, end_utc, tz, business_hours):
     if start_utc >= end_utc:
         return 0
-    local_start = start_utc.astimezone(tz)
-    local_end = end_utc.astimezone(tz)
-    total_minutes = 0
-    current = local_start
-    while current < local_end:
-        day = current.weekday()
-        next_day = (current + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-        if day in business_hours:
-            start_time, end_time = business_hours[day]
-            day_start = current.replace(hour=start_time.hour, minute=start_time.minute)
-            day_end = current.replace(hour=end_time.hour, minute=end_time.minute)
-            b_start = max(day_start, current)
-            b_end = min(day_end, min(local_end, next_day))
-            if b_start < b_end:
-                total_minutes += (b_end - b_start).total_seconds() / 60
-        current = next_day
-    return total_minutes
+    return WeeklySchedule(business_hours, tz).minutes(start_utc, end_utc)
 
 # Compute uptime/downtime by interpolating polls
+# (business_hours may be a precompiled WeeklySchedule)
 def compute_uptime_downtime(period_start, period_end, tz, business_hours, polls):
+    if not isinstance(business_hours, WeeklySchedule):
+        business_hours = WeeklySchedule(business_hours, tz)
+    return window_uptime_downtime((period_start,), period_end, business_hours, polls)[0]
+
+# (uptime, downtime) business minutes for each window start up to period_end.
+# Each poll's status holds until the next poll (the last one until period_end) and
+# a window counts every such interval that ends after its start, in full; before a
+# store's first poll the window takes that poll's status. Interval minutes are
+# computed once and shared by all windows.
+def window_uptime_downtime(window_starts, period_end, schedule, polls):
     if not polls:
         # No polls? All downtime during business hours
-        return 0, business_minutes(period_start, period_end, tz, business_hours)
-    
-    # Find the status just before the period
-    prev_time = None
-    prev_status = None
-    for t, active in polls:
-        if t <= period_start:
-            prev_time, prev_status = t, active
-        else:
-            break
-    
-    # If no prior status, use the first poll’s status
-    if prev_status is None and polls:
-        prev_status = polls[0][1]
-    elif prev_status is None:
-        # No polls at all? All downtime
-        return 0, business_minutes(period_start, period_end, tz, business_hours)
-
-    # Build intervals: each poll extends its status to the next poll
-    intervals = []
-    current_time = period_start
-    i = next((idx for idx, (t, _) in enumerate(polls) if t > period_start), len(polls))
-    if prev_status is not None:
-        for j in range(i - 1 if prev_time and prev_time <= period_start else i, len(polls)):
-            t, active = polls[j]
-            intervals.append((current_time, t, prev_status))
-            current_time, prev_status = t, active
-    if current_time < period_end:
-        intervals.append((current_time, period_end, prev_status))
-    
-    # Sum up minutes for uptime/downtime
-    uptime, downtime = 0, 0
-    for start, end, active in intervals:
-        bus_min = business_minutes(start, end, tz, business_hours)
-        if active:
-            uptime += bus_min
-        else:
-            downtime += bus_min
-    return uptime, downtime
+        return [(0, schedule.minutes(start, period_end)) for start in window_starts]
+    if not isinstance(polls, StorePolls):
+        polls = StorePolls.from_pairs(polls)
+    epochs, active = polls.epochs, polls.active
+    starts = [start.timestamp() for start in window_starts]
+    end = period_end.timestamp()
+
+    # Intervals from the last poll at or before the earliest window start onward
+    first = max(bisect_right(epochs, min(starts)) - 1, 0)
+    seconds_between = schedule.seconds_between
+    minutes = [seconds_between(epochs[k], epochs[k + 1]) / 60 for k in range(first, len(epochs) - 1)]
+    if epochs[-1] < end:
+        minutes.append(seconds_between(epochs[-1], end) / 60)
+
+    results = []
+    for start in starts:
+        uptime, downtime = 0, 0
+        k = bisect_right(epochs, start) - 1
+        if k < 0:
+            # No prior status: the first poll's status covers the lead-in
+            lead_in = seconds_between(start, epochs[0]) / 60
+            if active[0]:
+                uptime += lead_in
+            else:
+                downtime += lead_in
+            k = 0
+        for k in range(k, first + len(minutes)):
+            if active[k]:
+                uptime += minutes[k - first]
+            else:
+                downtime += minutes[k - first]
+        results.append((uptime, downtime))
+    return results
+
+# Compute one CSV row (hour in minutes, day/week in hours)
+def store_report_row(store_id, now_utc, last_hour, last_day, last_week, tz, business_hours, polls):
+    if not isinstance(business_hours, WeeklySchedule):
+        business_hours = WeeklySchedule(business_hours, tz)
+    (u_h_min, d_h_min), (u_d_min, d_d_min), (u_w_min, d_w_min) = window_uptime_downtime(
+        (last_hour, last_day, last_week), now_utc, business_hours, polls)
 
-# Helper: cache per store report
+    row = report_row(store_id, u_h_min, u_d_min, u_w_min, d_h_min, d_d_min, d_w_min)
+    return row
+
+# Helper: cache per store report, keyed on a version of the store's inputs (see result_cache.py)
 def get_store_report(store_id, now_utc, last_hour, last_day, last_week, tz, business_hours, polls):
-    cache_key = f"store_report:{store_id}:{now_utc.isoformat()}"
-    cached = cache.get(cache_key)
+    cache_key = store_report_cache.key(store_id, now_utc, tz, business_hours, polls)
+    cached = store_report_cache.get(cache_key)
     if cached:
         return cached
 
-    u_h_min, d_h_min = compute_uptime_downtime(last_hour, now_utc, tz, business_hours, polls)
-    u_d_min, d_d_min = compute_uptime_downtime(last_day, now_utc, tz, business_hours, polls)
-    u_w_min, d_w_min = compute_uptime_downtime(last_week, now_utc, tz, business_hours, polls)
+    row = store_report_row(store_id, now_utc, last_hour, last_day, last_week, tz, business_hours, polls)
+    store_report_cache.set(cache_key, row)
+    return row
+
+# Rows for every store: scalar engines go through the per-store cache,
+# 'vectorized' computes all stores at once with numpy ('pollstore' does the
+# same from the compacted poll files), 'incremental' sums the hourly aggregates.
+# Loading is timed as the 'query' stage and the uptime math as 'compute'.
+# The numpy engines (vectorized.py, pollstore.py) are imported where they are used,
+# keeping numpy out of the web process; workers preload them (see warmup.py).
+def report_rows(engine, now_utc, last_hour, last_day, last_week, metrics=None):
+    metrics = metrics or Metrics()
+    if engine in ('vectorized', 'pollstore'):
+        from store_monitor.vectorized import vectorized_rows
+        with metrics.stage('query'):
+            inputs = load_shard_inputs(engine, None, now_utc)
+        metrics.count('polls', input_polls(engine, inputs))
+        with metrics.stage('compute'):
+            rows = vectorized_rows(inputs, now_utc, last_hour, last_day, last_week)
+        yield from rows
+        return
+    if engine == 'incremental':
+        # Mostly bucket sums in the database, so it all counts as 'query'
+        yield from metrics.timed('query', incremental_report_rows(now_utc, last_hour, last_day, last_week))
+        return
+    stats = store_report_cache.stats.copy()
+    for store_id, tz, business_hours, polls in metrics.timed('query', REPORT_ENGINES[engine](since=last_week)):
+        metrics.count('polls', len(polls))
+        with metrics.stage('compute'):
+            row = get_store_report(store_id, now_utc, last_hour, last_day, last_week, tz, business_hours, polls)
+        yield row
+    cache_hits(metrics, stats)
+
+
+# Per-store cache lookups since `before` (a copy of store_report_cache.stats), then flush them
+def cache_hits(metrics, before):
+    for name, count in (store_report_cache.stats - before).items():
+        metrics.count(f'cache_{name}', count)
+    store_report_cache.flush_stats()
+
+
+# Polls in a shard's inputs (see load_shard_inputs)
+def input_polls(engine, inputs):
+    if engine in ('vectorized', 'pollstore'):
+        return len(inputs[2])
+    return sum(len(polls) for _, _, _, polls in inputs)
+
 
-    row = [
-        store_id,
-        round(u_h_min), round(u_d_min / 60), round(u_w_min / 60),
-        round(d_h_min), round(d_d_min / 60), round(d_w_min / 60)
+# Time ranges ending at "now"
+def report_windows(now_utc):
+    return now_utc - timedelta(hours=1), now_utc - timedelta(days=1), now_utc - timedelta(days=7)
+
+
+# Precompute UTC offsets for every zone over the report's windows (plus a day of slack)
+def prepare_schedules(now_utc):
+    start = now_utc - timedelta(days=8)
+    store_lookups().prepare(start.timestamp(), (now_utc + timedelta(days=1)).timestamp())
+
+
+# Contiguous (first, last) store_id ranges of at most shard_size stores
+def store_shards(shard_size):
+    store_ids = list(StoreStatus.objects.order_by('store_id').values_list('store_id', flat=True).distinct())
+    return [
+        (store_ids[i], store_ids[min(i + shard_size, len(store_ids)) - 1])
+        for i in range(0, len(store_ids), shard_size)
     ]
 
-    # Cache for 1 hour (matches polling frequency)
-    cache.set(cache_key, row, timeout=3600)
-    return row
 
+# Shard inputs are loaded from the DB; computing them needs no DB access,
+# so the local fallback can hand them to worker processes. Only polls the
+# report windows ending at now_utc need are loaded.
+def load_shard_inputs(engine, store_range, now_utc):
+    since = report_windows(now_utc)[-1]
+    if engine == 'vectorized':
+        from store_monitor.vectorized import load_vectorized_inputs
+        return load_vectorized_inputs(store_range, since)
+    if engine == 'pollstore':
+        from store_monitor.pollstore import load_pollstore_inputs
+        return load_pollstore_inputs(store_range, since)
+    return list(REPORT_ENGINES[engine](store_range, since))
+
+
+def compute_shard_rows(engine, inputs, now_utc, metrics=None):
+    metrics = metrics or Metrics()
+    with metrics.stage('compute'):
+        if engine in ('vectorized', 'pollstore'):
+            from store_monitor.vectorized import vectorized_rows
+            return vectorized_rows(inputs, now_utc, *report_windows(now_utc))
+        stats = store_report_cache.stats.copy()
+        rows = [
+            get_store_report(store_id, now_utc, *report_windows(now_utc), tz, business_hours, polls)
+            for store_id, tz, business_hours, polls in inputs
+        ]
+    cache_hits(metrics, stats)
+    return rows
+
+
+# Per-shard progress, readable while the report is running. Shards finish in worker
+# processes, so the counters live in the shared default cache.
+def report_progress(report_id):
+    total = cache.get(f"report:{report_id}:shards_total")
+    if total is None:
+        return None
+    return {'shards_done': cache.get(f"report:{report_id}:shards_done", 0), 'shards_total': total}
+
+
+def _shard_done(report_id):
+    # add + incr, not incr falling back to set: two first shards finishing at once
+    # would both set 1 and lose a count
+    key = f"report:{report_id}:shards_done"
+    cache.add(key, 0, timeout=3600)
+    cache.incr(key)
+
+
+# Cache key holding the report_id computing a snapshot in a format (and with params)
+def snapshot_key(snapshot, fmt, params_key=''):
+    key = f"report_snapshot:{snapshot}:{fmt}"
+    return f"{key}:{params_key}" if params_key else key
+
+
+# Canonical report parameters: only what was given, windows de-duplicated in order,
+# store ids sorted; {} is the standard report
+def report_params(as_of=None, windows=None, store_ids=None):
+    params = {}
+    if as_of is not None:
+        params['as_of'] = as_of.astimezone(pytz.utc).isoformat()
+    if windows:
+        params['windows'] = list(dict.fromkeys(windows))
+    if store_ids:
+        params['store_ids'] = sorted(set(store_ids))
+    return params
+
+
+def params_digest(params):
+    if not params:
+        return ''
+    return hashlib.blake2b(json.dumps(params, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+
+# Point-in-time / custom-window / store-subset report: the vectorized backend over just
+# the requested stores' polls in (now - longest window, now]
+def window_report_rows(params, now_utc, metrics):
+    from store_monitor.vectorized import load_vectorized_inputs, window_rows
+    windows = params.get('windows', DEFAULT_WINDOWS)
+    since = now_utc - max(window_length(w) for w in windows)
+    with metrics.stage('query'):
+        inputs = load_vectorized_inputs(since=since, until=now_utc, subset=params.get('store_ids'))
+    metrics.count('polls', len(inputs[2]))
+    with metrics.stage('compute'):
+        return window_rows(inputs, now_utc, windows)
+
+
+# Persist a state change and refresh the cached status, so status readers (polling
+# clients, the events stream) in any process never go to the DB. A finished report
+# also finishes every request coalesced into it.
+def set_report_state(report_id, state, **fields):
+    Report.objects.update_or_create(report_id=report_id, defaults={'state': state, **fields})
+    report_status(report_id, refresh=True)
+    if state in (Report.COMPLETE, Report.FAILED):
+        followers = list(Report.objects.filter(
+            coalesced_into=report_id, state__in=(Report.QUEUED, Report.RUNNING)
+        ).values_list('report_id', flat=True))
+        if followers:
+            leader = Report.objects.get(report_id=report_id)
+            for follower_id in followers:
+                _adopt_outcome(leader, follower_id)
+        if state == Report.FAILED:
+            snapshot, fmt, params_key = Report.objects.filter(report_id=report_id).values_list(
+                'snapshot', 'format', 'params_key').first()
+            if snapshot and cache.get(snapshot_key(snapshot, fmt, params_key)) == report_id:
+                cache.delete(snapshot_key(snapshot, fmt, params_key))
+
+
+# Report status from the cache or its (indexed) Report row; None for unknown ids.
+# refresh re-reads the row and overwrites the cached status (set_report_state); a
+# reader filling a miss only adds it, so a status it read just before a state change
+# can't replace the newer one.
+def report_status(report_id, refresh=False):
+    key = f"report_status:{report_id}"
+    status = None if refresh else cache.get(key)
+    if status is None:
+        report = Report.objects.filter(report_id=report_id).first() or _backfill_report(report_id)
+        if report is None:
+            return None
+        status = {
+            'state': report.state,
+            'rows': report.rows,
+            'bytes': report.bytes,
+            'error': report.error,
+            'queue_wait_seconds': report.queue_wait_seconds,
+            'compute_seconds': report.compute_seconds,
+            'format': report.format,
+            'params': report.params,
+        }
+        if refresh:
+            cache.set(key, status, timeout=3600)
+        else:
+            cache.add(key, status, timeout=3600)
+    return status
+
+
+# Reports written before the Report model (such as the sample in reports/) have only their
+# CSV; the first lookup records them as complete so every report endpoint serves them
+def _backfill_report(report_id):
+    path = report_path(report_id)
+    try:
+        with open(path, 'rb') as f:
+            rows = max(sum(1 for _ in f) - 1, 0)
+        stat = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    written = datetime.fromtimestamp(stat.st_mtime, tz=pytz.utc)
+    report, _ = Report.objects.get_or_create(report_id=report_id, defaults={
+        'state': Report.COMPLETE, 'created_at': written, 'started_at': written,
+        'finished_at': written, 'rows': rows, 'bytes': stat.st_size,
+    })
+    log_event('report_backfilled', report_id=report_id, rows=rows)
+    return report
 
+
+def report_latency_stats(limit=1000):
+    """p50/p99 queue wait, compute and end-to-end seconds over the latest complete reports."""
+    import numpy as np
+    rows = Report.objects.filter(state=Report.COMPLETE).order_by('-finished_at').values_list(
+        'created_at', 'started_at', 'finished_at'
+    )[:limit]
+    timings = {'queue_wait': [], 'compute': [], 'total': []}
+    for created, started, finished in rows:
+        timings['queue_wait'].append((started - created).total_seconds())
+        timings['compute'].append((finished - started).total_seconds())
+        timings['total'].append((finished - created).total_seconds())
+    stats = {'reports': len(timings['total'])}
+    for name, values in timings.items():
+        p50, p99 = np.percentile(values, [50, 99]).tolist() if values else (None, None)
+        stats[name] = {'p50': p50, 'p99': p99}
+    return stats
+
+
+# Identifies the data a report is computed from: the newest poll plus the ingestion
+# version (last change to any source file, see IngestionWatermark). None without polls.
+def report_snapshot():
+    latest = StoreStatus.objects.aggregate(Max('timestamp_utc'))['timestamp_utc__max']
+    if latest is None:
+        return None
+    version = IngestionWatermark.objects.aggregate(Max('updated_at'))['updated_at__max']
+    return f"{latest.isoformat()}|{version.isoformat() if version else '-'}"
+
+
+# Serve another report's file under report_id: a hard link when possible (report files
+# are never modified after the rename), else a copy. FileNotFoundError if it is gone.
+def _link_report(source_id, report_id, fmt=DEFAULT_FORMAT):
+    src, dst = report_path(source_id, fmt), report_path(report_id, fmt)
+    try:
+        os.link(src, dst)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        tmp = f'{dst}.{os.getpid()}.tmp'
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+
+
+# Finish report_id with the outcome of a finished report for the same snapshot
+def _adopt_outcome(leader, report_id):
+    now = timezone.now()
+    if leader.state == Report.COMPLETE:
+        _link_report(leader.report_id, report_id, leader.format)
+        report = Report.objects.get(report_id=report_id)
+        set_report_state(report_id, Report.COMPLETE, started_at=report.started_at or now, finished_at=now,
+                         rows=leader.rows, bytes=leader.bytes, snapshot=leader.snapshot)
+    else:
+        set_report_state(report_id, Report.FAILED, finished_at=now, error=leader.error)
+
+
+# Serve a finished report's file under report_id. False when the file is gone (deleted
+# or archived): the snapshot claim is released if it still names that report, and the
+# caller computes the report afresh.
+def _adopt_file(done, report_id, key):
+    try:
+        _adopt_outcome(done, report_id)
+    except FileNotFoundError:
+        if cache.get(key) == done.report_id:
+            cache.delete(key)
+        log_event('report_file_missing', report_id=report_id, source=done.report_id)
+        return False
+    return True
+
+
+# Stream rows to the report file in the report's format (one batch in memory at a time,
+# see report_formats.write_rows), then mark the report complete
+def write_report(report_id, rows, metrics=None, header=REPORT_HEADER):
+    metrics = metrics or Metrics()
+    fmt = Report.objects.filter(report_id=report_id).values_list('format', flat=True).first() or DEFAULT_FORMAT
+    count, size = write_rows(report_path(report_id, fmt), rows, fmt, metrics=metrics, header=header)
+    metrics.count('stores', count)
+    set_report_state(report_id, Report.COMPLETE, finished_at=timezone.now(), rows=count, bytes=size)
+
+
+@shared_task
+def generate_report_shard(report_id, engine, now_iso, first_store, last_store):
+    now_utc = datetime.fromisoformat(now_iso)
+    metrics = Metrics()
+    with metrics.queries():
+        with metrics.stage('query'):
+            prepare_schedules(now_utc)
+            inputs = load_shard_inputs(engine, (first_store, last_store), now_utc)
+        metrics.count('polls', input_polls(engine, inputs))
+        rows = compute_shard_rows(engine, inputs, now_utc, metrics)
+    _shard_done(report_id)
+    log_event('report_shard', report_id=report_id, engine=engine, first_store=first_store, last_store=last_store,
+              stores=len(rows), **metrics.as_dict())
+    return rows
+
+
+# Chord callback: shard results arrive in shard order
+@shared_task
+def merge_report_shards(shard_rows, report_id):
+    write_report(report_id, chain.from_iterable(shard_rows))
+
+
+# Chord errback: a failed shard fails the whole report
+@shared_task
+def report_failed(request, exc, traceback, report_id):
+    set_report_state(report_id, Report.FAILED, finished_at=timezone.now(), error=str(exc))
+
+
+# Broker-less fallback (eager mode / tests): same shards on a local process pool.
+# Waiting on the workers counts as 'compute'.
+def generate_report_local(report_id, engine, now_utc, shards, metrics=None):
+    metrics = metrics or Metrics()
+    workers = getattr(settings, 'REPORT_LOCAL_WORKERS', None)
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+        futures = []
+        for shard in shards:
+            with metrics.stage('query'):
+                inputs = load_shard_inputs(engine, shard, now_utc)
+            metrics.count('polls', input_polls(engine, inputs))
+            futures.append(pool.submit(compute_shard_rows, engine, inputs, now_utc))
+        # Shard results are written in order as they arrive, while later shards still run
+        shard_rows = metrics.timed('compute', _shard_results(report_id, futures))
+        write_report(report_id, chain.from_iterable(shard_rows), metrics)
+
+
+def _shard_results(report_id, futures):
+    for future in futures:
+        rows = future.result()
+        _shard_done(report_id)
+        yield rows
+
+
+def request_report(fmt=DEFAULT_FORMAT, params=None):
+    """Start a report for the current data and return its new report_id.
+
+    Work is shared per snapshot (report_snapshot), output format and params
+    (report_params): a finished report for the same snapshot is linked under
+    the new id at once, and a request made while one is queued or running is
+    attached to it and finishes with it. Only the first request for a snapshot
+    (claimed with cache.add) runs generate_report.
+    """
+    report_id = str(uuid4())
+    snapshot = report_snapshot()
+    params = params or {}
+    params_key = params_digest(params)
+    Report.objects.create(report_id=report_id, snapshot=snapshot or '', format=fmt, params=params,
+                          params_key=params_key)
+    if snapshot is not None:
+        key = snapshot_key(snapshot, fmt, params_key)
+        done = Report.objects.filter(snapshot=snapshot, format=fmt, params_key=params_key,
+                                     state=Report.COMPLETE).order_by('-finished_at').first()
+        if done is not None and _adopt_file(done, report_id, key):
+            return report_id
+
+        if not cache.add(key, report_id, timeout=3600):
+            leader = Report.objects.filter(report_id=cache.get(key)).first()
+            if leader is not None and leader.state in (Report.QUEUED, Report.RUNNING):
+                state = Report.RUNNING if leader.state == Report.RUNNING else Report.QUEUED
+                set_report_state(report_id, state, coalesced_into=leader.report_id,
+                                 started_at=timezone.now() if state == Report.RUNNING else None)
+                # The leader may have finished before we attached
+                leader.refresh_from_db()
+                if leader.state in (Report.COMPLETE, Report.FAILED):
+                    _adopt_outcome(leader, report_id)
+                return report_id
+            cache.set(key, report_id, timeout=3600)
+
+    log_event('report_requested', report_id=report_id, format=fmt, snapshot=snapshot, params=params)
+    generate_report.delay(report_id)
+    return report_id
+
+
+# Logs one 'report_complete'/'report_failed' event with the stage timings, counters
+# and query count (see instrumentation.Metrics), and adds them to the /metrics/
+# totals. With REPORT_PROFILE set the run is profiled next to the report file.
 @shared_task
 def generate_report(report_id):
-    # Cache full report first (so repeated requests don’t hit DB)
-    report_cache_key = f"report:{report_id}"
-    cached_report = cache.get(report_cache_key)
-    if cached_report:
-        path = os.path.join(settings.BASE_DIR, 'reports', f'{report_id}.csv')
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        with open(path, 'w', newline='') as f:
-            f.write(cached_report)
-        return
+    params = Report.objects.filter(report_id=report_id).values_list('params', flat=True).first() or {}
+    # Parameterized reports always use the vectorized backend (see window_report_rows)
+    engine = 'vectorized' if params else getattr(settings, 'REPORT_ENGINE', 'columnar')
+    set_report_state(report_id, Report.RUNNING, started_at=timezone.now(), engine=engine,
+                     snapshot=report_snapshot() or '')
+    metrics = Metrics()
+    try:
+        with profiled(os.path.splitext(report_path(report_id))[0]) as profile, metrics.queries():
+            _generate_report(report_id, engine, metrics, params)
+    except Exception as e:
+        set_report_state(report_id, Report.FAILED, finished_at=timezone.now(), error=str(e))
+        record_report(engine, 'failed', metrics)
+        log_event('report_failed', report_id=report_id, engine=engine, error=str(e), **metrics.as_dict())
+        raise
+    state = Report.objects.filter(report_id=report_id).values_list('state', flat=True).first()
+    if state in (Report.COMPLETE, Report.FAILED):
+        # Chord-sharded reports finish (and are logged per shard) in the workers
+        outcome = 'complete' if state == Report.COMPLETE else 'failed'
+        record_report(engine, outcome, metrics)
+        log_event(f'report_{outcome}', report_id=report_id, engine=engine, profile=profile, **metrics.as_dict())
 
+
+def _generate_report(report_id, engine, metrics, params=None):
     # Get latest timestamp as "now"
-    now_utc = StoreStatus.objects.aggregate(Max('timestamp_utc'))['timestamp_utc__max']
+    with metrics.stage('query'):
+        now_utc = StoreStatus.objects.aggregate(Max('timestamp_utc'))['timestamp_utc__max']
     if not now_utc:
-        path = os.path.join(settings.BASE_DIR, 'reports', f'{report_id}.txt')
-        with open(path, 'w') as f:
-            f.write('No data')
+        set_report_state(report_id, Report.FAILED, finished_at=timezone.now(), error='No data')
+        return
+
+    if params:
+        if 'as_of' in params:
+            now_utc = datetime.fromisoformat(params['as_of'])
+        header = window_header(params.get('windows', DEFAULT_WINDOWS))
+        write_report(report_id, window_report_rows(params, now_utc, metrics), metrics, header)
+        return
+
+    with metrics.stage('query'):
+        if engine == 'pollstore':
+            # Re-compact first if polls were loaded since the last export
+            from store_monitor.pollstore import refresh_poll_store
+            refresh_poll_store()
+        prepare_schedules(now_utc)
+    shard_size = getattr(settings, 'REPORT_SHARD_SIZE', 0)
+    # The incremental engine only sums precomputed buckets, so it is never sharded
+    shards = store_shards(shard_size) if shard_size and engine != 'incremental' else []
+
+    if len(shards) > 1:
+        # Fan out one subtask per store-id shard, merged by a chord callback
+        cache.set(f"report:{report_id}:shards_total", len(shards), timeout=3600)
+        cache.set(f"report:{report_id}:shards_done", 0, timeout=3600)
+        if getattr(settings, 'CELERY_TASK_ALWAYS_EAGER', False):
+            generate_report_local(report_id, engine, now_utc, shards, metrics)
+            return
+        header = [
+            generate_report_shard.s(report_id, engine, now_utc.isoformat(), first, last)
+            for first, last in shards
+        ]
+        chord(header)(merge_report_shards.s(report_id).on_error(report_failed.s(report_id=report_id)))
         return
 
-    # Time ranges
-    last_hour = now_utc - timedelta(hours=1)
-    last_day = now_utc - timedelta(days=1)
-    last_week = now_utc - timedelta(days=7)
-    store_ids = StoreStatus.objects.values_list('store_id', flat=True).distinct()
-
-    # Prepare CSV in-memory
-    buffer = io.StringIO()
-    writer = csv.writer(buffer)
-    writer.writerow([
-        'store_id',
-        'uptime_last_hour',
-        'uptime_last_day',
-        'uptime_last_week',
-        'downtime_last_hour',
-        'downtime_last_day',
-        'downtime_last_week'
-    ])
-
-    for store_id in store_ids:
-        # Timezone fallback
-        tz_obj = Timezone.objects.filter(store_id=store_id).first()
-        tz = pytz.timezone(tz_obj.timezone_str if tz_obj else 'America/Chicago')
-
-        # Business hours fallback
-        hours = BusinessHour.objects.filter(store_id=store_id)
-        business_hours = {h.day_of_week: (h.start_time_local, h.end_time_local) for h in hours}
-        if not business_hours:
-            business_hours = {d: (time(0, 0), time(23, 59)) for d in range(7)}
-
-        # Polls
-        polls = StoreStatus.objects.filter(store_id=store_id).order_by('timestamp_utc').values('timestamp_utc', 'status')
-        polls = [(p['timestamp_utc'], p['status'] == 'active') for p in polls]
-
-        # Compute (cached per store)
-        row = get_store_report(store_id, now_utc, last_hour, last_day, last_week, tz, business_hours, polls)
-        writer.writerow(row)
-
-    # Save CSV output to memory + cache + file
-    csv_content = buffer.getvalue()
-    buffer.close()
-
-    cache.set(report_cache_key, csv_content, timeout=3600)
-
-    path = os.path.join(settings.BASE_DIR, 'reports', f'{report_id}.csv')
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, 'w', newline='') as f:
-        f.write(csv_content)
+    # Single pass over polls with timezones/hours preloaded (see engine.py)
+    write_report(report_id, report_rows(engine, now_utc, *report_windows(now_utc), metrics), metrics)
+
+
+# Load the source CSVs in the background; status is readable via IngestProgress
+@shared_task
+def ingest_store_data(job_id, data_path=DATA_PATH):
+    progress = IngestProgress(job_id)
+    progress.start()
+    metrics = Metrics()
+    try:
+        stats, missing = import_all(data_path, progress=progress, metrics=metrics)
+    except Exception as e:
+        progress.fail(str(e))
+        record_ingest('failed', [], metrics)
+        log_event('ingest_failed', job_id=job_id, error=str(e), **metrics.as_dict())
+        return
+    progress.finish(missing)
+    record_ingest('complete', stats, metrics)
+    log_event('ingest_complete', job_id=job_id, files=stats, missing=missing, **metrics.as_dict())
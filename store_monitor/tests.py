@@ -1,3 +1,1132 @@
-from django.test import TestCase
+import csv
+import gzip
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+import json
+import multiprocessing
+import pickle
+import pstats
+import subprocess
+import sys
+import unittest
+from datetime import datetime, timedelta, time
+import numpy as np
+import pytz
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db.models import Max, Min, Sum
+import os
+import tempfile
+from unittest import mock
+from django.test import SimpleTestCase, TestCase, override_settings
+from store_monitor.aggregates import incremental_report_rows, rebuild_aggregates, update_aggregates
+from store_monitor.downloads import gzip_path, report_path
+from store_monitor.engine import StorePolls, iter_store_inputs, iter_store_inputs_per_store
+from store_monitor import ingest
+from store_monitor.ingest import IngestProgress, import_all
+from store_monitor.instrumentation import Metrics
+from store_monitor.lookups import DEFAULT_TIMEZONE, store_lookups
+from store_monitor.models import (
+    Report, StoreDailySummary, StoreHourlyUptime, StoreStatus, StoreUptimeState, BusinessHour, Timezone,
+)
+from store_monitor import report_formats, warmup
+from store_monitor.report_formats import REPORT_FORMATS, available_formats
+from store_monitor.partitions import month_ranges, partition_store_status
+from store_monitor import poll_index as poll_index_module
+from store_monitor.poll_index import refresh_poll_index
+from store_monitor.retention import archive_polls
+from store_monitor.synthetic import generate_dataset, load_dataset, write_csvs
+from store_monitor.schedule import OffsetTable, WeeklySchedule
+from store_monitor.tasks import (
+    _shard_done, business_minutes, compute_uptime_downtime, generate_report, get_store_report, ingest_store_data,
+    report_progress, set_report_state, store_report_row, window_report_rows, window_uptime_downtime, write_report,
+)
+from store_monitor.pollstore import (
+    MANIFEST, PollStore, compact_poll_store, compaction_lock, read_manifest, refresh_poll_store,
+)
+from store_monitor.result_cache import LRUCache, cache_stats, store_report_cache
+from store_monitor.vectorized import load_poll_columns, load_schedules, vectorized_report_rows, vectorized_rows
+from hypothesis import assume, given, settings as hypothesis_settings, strategies as st
 
-# Create your tests here.
+
+def report_windows():
+    now_utc = StoreStatus.objects.aggregate(Max('timestamp_utc'))['timestamp_utc__max']
+    return now_utc, (now_utc - timedelta(hours=1), now_utc - timedelta(days=1), now_utc - timedelta(days=7))
+
+
+def report_rows(engine):
+    now_utc, windows = report_windows()
+    return [
+        store_report_row(store_id, now_utc, *windows, tz, business_hours, polls)
+        for store_id, tz, business_hours, polls in engine()
+    ]
+
+
+# A default cache every process can see, standing in for the shared Redis one
+def shared_cache():
+    return override_settings(CACHES={**settings.CACHES, 'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tempfile.mkdtemp()}})
+
+
+# Run func in a forked process (another web or worker process) and wait for it
+def in_other_process(func, *args, **kwargs):
+    process = multiprocessing.get_context('fork').Process(target=func, args=args, kwargs=kwargs)
+    process.start()
+    process.join()
+    return process.exitcode
+
+
+class ReportEngineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        load_dataset(stores=20, days=3, seed=1)
+
+    def test_single_pass_matches_per_store_queries(self):
+        self.assertEqual(report_rows(iter_store_inputs), report_rows(iter_store_inputs_per_store))
+
+    def test_single_pass_query_count(self):
+        store_lookups()
+        # Lookup tables are already loaded: three version checks and the poll scan
+        with self.assertNumQueries(4):
+            list(iter_store_inputs())
+
+    def test_lookups_are_interned_and_reloaded_on_change(self):
+        lookups = store_lookups()
+        self.assertIs(store_lookups(), lookups)
+        schedules = [lookups.schedule(store_id) for store_id in lookups.store_ids]
+        self.assertLessEqual(len(set(map(id, schedules))), len(lookups.schedules))
+        self.assertEqual(len({id(s.tz) for s in lookups.schedules}), len({str(s.tz) for s in lookups.schedules}))
+
+        # Unknown stores: default zone, open all day
+        self.assertIs(lookups.schedule('no-such-store'), lookups.default)
+        Timezone.objects.create(store_id='zz-new', timezone_str='Asia/Kolkata')
+        reloaded = store_lookups()
+        self.assertIsNot(reloaded, lookups)
+        self.assertEqual(str(reloaded.schedule('zz-new').tz), 'Asia/Kolkata')
+
+        # Edited in place: same rows and ids, newer updated_at
+        row = Timezone.objects.get(store_id='zz-new')
+        row.timezone_str = 'Asia/Tokyo'
+        row.save()
+        self.assertEqual(str(store_lookups().schedule('zz-new').tz), 'Asia/Tokyo')
+
+    def test_compact_polls(self):
+        for store_id, tz, schedule, polls in iter_store_inputs():
+            self.assertIsInstance(polls, StorePolls)
+            self.assertEqual(StorePolls.from_pairs(list(polls)), polls)
+            self.assertEqual(pickle.loads(pickle.dumps(polls)), polls)
+
+        # Open all day: whole intervals ending inside a window count, and the
+        # week window (no prior poll) takes the first poll's status from its start
+        now = datetime(2023, 1, 25, 12, tzinfo=pytz.utc)
+        polls = StorePolls.from_pairs([(now - timedelta(days=3), True), (now - timedelta(minutes=30), False),
+                                       (now - timedelta(minutes=10), True)])
+        windows = (now - timedelta(hours=1), now - timedelta(days=1), now - timedelta(days=7))
+        self.assertEqual(window_uptime_downtime(windows, now, WeeklySchedule(None, pytz.utc), polls),
+                         [(4300, 20), (4300, 20), (10060, 20)])
+
+    def test_vectorized_matches_scalar(self):
+        now_utc, windows = report_windows()
+        self.assertEqual(list(vectorized_report_rows(now_utc, *windows)), report_rows(iter_store_inputs))
+
+
+class IncrementalAggregateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        load_dataset(stores=15, days=8, poll_minutes=45, seed=4)
+
+    def test_incremental_matches_full_recompute(self):
+        now_utc, windows = report_windows()
+        self.assertEqual(list(incremental_report_rows(now_utc, *windows)), report_rows(iter_store_inputs))
+
+    def test_new_polls_fold_into_existing_buckets(self):
+        rebuild_aggregates()
+        store_id = StoreStatus.objects.values_list('store_id', flat=True).first()
+        last = StoreStatus.objects.filter(store_id=store_id).aggregate(Max('timestamp_utc'))['timestamp_utc__max']
+        StoreStatus.objects.bulk_create([
+            StoreStatus(store_id=store_id, timestamp_utc=last + timedelta(minutes=m), status='inactive')
+            for m in (5, 70, 130)
+        ])
+        self.assertEqual(update_aggregates(), 3)
+        self.assertEqual(update_aggregates(), 0)
+        now_utc, windows = report_windows()
+        self.assertEqual(list(incremental_report_rows(now_utc, *windows)), report_rows(iter_store_inputs))
+
+    def test_schedule_change_recomputes_store(self):
+        rebuild_aggregates()
+        store_id = StoreStatus.objects.values_list('store_id', flat=True).first()
+        Timezone.objects.filter(store_id=store_id).delete()
+        Timezone.objects.create(store_id=store_id, timezone_str='Asia/Kolkata')
+        BusinessHour.objects.filter(store_id=store_id).delete()
+        self.assertEqual(update_aggregates(), StoreStatus.objects.filter(store_id=store_id).count())
+        now_utc, windows = report_windows()
+        self.assertEqual(list(incremental_report_rows(now_utc, *windows)), report_rows(iter_store_inputs))
+
+
+class PollRetentionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        load_dataset(stores=12, days=16, poll_minutes=150, seed=6)
+        # A store whose polls all predate the report week
+        now_utc, _ = report_windows()
+        StoreStatus.objects.create(store_id='stale', timestamp_utc=now_utc - timedelta(days=12), status='active')
+
+    def test_windowed_loading_matches_full_history(self):
+        now_utc, windows = report_windows()
+        since = windows[-1]
+        expected = report_rows(iter_store_inputs)
+        self.assertIn('stale', [row[0] for row in expected])
+        for engine in (iter_store_inputs, iter_store_inputs_per_store):
+            with self.subTest(engine=engine.__name__):
+                self.assertEqual(report_rows(lambda: engine(since=since)), expected)
+        self.assertEqual(list(vectorized_report_rows(now_utc, *windows)), expected)
+        self.assertLess(len(load_poll_columns(since=since)[1]), StoreStatus.objects.count())
+
+        path = tempfile.mkdtemp()
+        compact_poll_store(path)
+        store_ids, store_idx, epochs, active = PollStore(path).load_columns(since=since)
+        inputs = (store_ids, store_idx, epochs, active, load_schedules(store_ids))
+        self.assertEqual(list(vectorized_rows(inputs, now_utc, *windows)), expected)
+        self.assertLess(len(epochs), StoreStatus.objects.count())
+
+    def test_archive_keeps_reports_and_summarizes(self):
+        now_utc, windows = report_windows()
+        expected = report_rows(iter_store_inputs)
+        total = StoreStatus.objects.count()
+        with self.assertRaises(ValueError):
+            archive_polls(keep_days=3)
+
+        stats = archive_polls(keep_days=8)
+        self.assertGreater(stats['archived'], 0)
+        self.assertEqual(StoreStatus.objects.count(), total - stats['archived'])
+        self.assertEqual(StoreDailySummary.objects.aggregate(n=Sum('polls'))['n'], stats['archived'])
+        self.assertEqual(report_rows(iter_store_inputs), expected)
+        self.assertEqual(list(vectorized_report_rows(now_utc, *windows)), expected)
+        self.assertEqual(archive_polls(keep_days=8)['archived'], 0)
+
+
+class SyntheticDatasetTests(SimpleTestCase):
+    def test_knobs_are_deterministic_and_shape_the_data(self):
+        options = dict(stores=40, days=3, poll_minutes=30, seed=9, timezone_mix={'UTC': 1, 'Asia/Kolkata': 3},
+                       hour_shapes={'overnight': 1, 'weekdays': 1, 'all_day': 1}, outage_minutes=240,
+                       jitter_minutes=10, drop_rate=0.2)
+        timezones, hours, polls = generate_dataset(**options)
+        again = generate_dataset(**options)
+        self.assertEqual([(p.store_id, p.timestamp_utc, p.status) for p in polls],
+                         [(p.store_id, p.timestamp_utc, p.status) for p in again[2]])
+
+        self.assertEqual({t.timezone_str for t in timezones}, {'UTC', 'Asia/Kolkata'})
+        self.assertTrue(all(h.end_time_local < h.start_time_local or h.day_of_week < 5 for h in hours))
+        self.assertLess(len({h.store_id for h in hours}), 40)
+        self.assertEqual(len({(p.store_id, p.timestamp_utc) for p in polls}), len(polls))
+        self.assertLess(len(polls), 40 * 3 * 48 * 0.9)
+
+        # Bursty outages: runs of inactive polls are longer than with independent polls
+        def mean_outage_run(polls):
+            runs = [len(list(group)) for (_, status), group in groupby(polls, key=lambda p: (p.store_id, p.status))
+                    if status == 'inactive']
+            return sum(runs) / len(runs)
+        independent = generate_dataset(stores=40, days=3, poll_minutes=30, seed=9)[2]
+        self.assertGreater(mean_outage_run(polls), 2 * mean_outage_run(independent))
+
+
+class StreamingImportTests(TestCase):
+    def setUp(self):
+        self.data_path = tempfile.mkdtemp()
+        write_csvs(self.data_path, stores=12, days=2, seed=5)
+
+    def test_import_matches_generated_rows(self):
+        stats, missing = import_all(self.data_path, chunksize=100)
+        self.assertEqual(missing, [])
+        timezones, hours, polls = generate_dataset(stores=12, days=2, seed=5)
+        self.assertEqual([s['rows'] for s in stats], [len(timezones), len(hours), len(polls)])
+        self.assertEqual(
+            list(StoreStatus.objects.order_by('store_id', 'timestamp_utc').values_list('store_id', 'timestamp_utc', 'status')),
+            sorted((p.store_id, p.timestamp_utc, p.status) for p in polls),
+        )
+        self.assertEqual(
+            sorted(BusinessHour.objects.values_list('store_id', 'day_of_week', 'start_time_local', 'end_time_local')),
+            sorted((h.store_id, h.day_of_week, h.start_time_local, h.end_time_local) for h in hours),
+        )
+        self.assertEqual(Timezone.objects.count(), len(timezones))
+
+    def test_reimport_skips_ingested_rows(self):
+        first, _ = import_all(self.data_path)
+        again, _ = import_all(self.data_path)
+        self.assertEqual([s['inserted'] for s in again], [0, 0, 0])
+        self.assertEqual([s['skipped'] for s in again], [s['rows'] for s in first])
+
+        # Appended polls: only rows past the watermark are inserted, duplicates never are
+        polls = StoreStatus.objects.count()
+        store_id = StoreStatus.objects.values_list('store_id', flat=True).first()
+        with open(os.path.join(self.data_path, 'store_status.csv'), 'a') as f:
+            f.write(f'{store_id},inactive,2023-01-25 19:00:00 UTC\n{store_id},inactive,2023-01-25 19:30:00 UTC\n')
+        stats, _ = import_all(self.data_path)
+        self.assertEqual((stats[2]['inserted'], stats[2]['skipped']), (2, polls))
+        self.assertEqual(StoreStatus.objects.count(), polls + 2)
+        self.assertEqual(StoreUptimeState.objects.get(store_id=store_id).last_poll_ts,
+                         datetime(2023, 1, 25, 19, 30, tzinfo=pytz.utc))
+
+        stats, _ = import_all(self.data_path, full=True)
+        self.assertEqual(sum(s['inserted'] for s in stats), 0)
+        self.assertEqual(StoreStatus.objects.count(), polls + 2)
+
+    def test_backfilled_and_late_polls(self):
+        import_all(self.data_path)
+        store_id, first, last = StoreStatus.objects.values_list('store_id').annotate(
+            Min('timestamp_utc'), Max('timestamp_utc')).order_by('store_id').first()
+        late = first + (last - first) / 2 + timedelta(seconds=1)
+        with open(os.path.join(self.data_path, 'store_status.csv'), 'a') as f:
+            # A new store's history, older than every ingested poll, and a late poll for a known store
+            f.write(''.join(f'backfill,active,{first - timedelta(hours=h):%Y-%m-%d %H:%M:%S} UTC\n' for h in (1, 2)))
+            f.write(f'{store_id},inactive,{late:%Y-%m-%d %H:%M:%S.%f} UTC\n')
+        stats, _ = import_all(self.data_path)
+        self.assertEqual((stats[2]['inserted'], stats[2]['late']), (3, 1))
+        self.assertEqual(StoreStatus.objects.filter(store_id='backfill').count(), 2)
+        self.assertTrue(StoreStatus.objects.filter(store_id=store_id, timestamp_utc=late).exists())
+
+        # The late poll's store was recomputed, so the buckets match a full rebuild
+        def buckets():
+            return sorted(StoreHourlyUptime.objects.values_list(
+                'store_id', 'hour_start', 'uptime_seconds', 'downtime_seconds'))
+        imported = buckets()
+        rebuild_aggregates()
+        self.assertEqual(imported, buckets())
+
+    def test_rewritten_file_is_reread(self):
+        import_all(self.data_path)
+        polls = StoreStatus.objects.count()
+        path = os.path.join(self.data_path, 'store_status.csv')
+        with open(path) as f:
+            header, *lines = f.readlines()
+        # A poll inserted mid-file (not appended) is found by re-reading the whole file
+        lines.insert(len(lines) // 2, 'rewritten,active,2023-01-20 12:00:00 UTC\n')
+        with open(path, 'w') as f:
+            f.writelines([header, *lines])
+        stats, _ = import_all(self.data_path)
+        self.assertEqual((stats[2]['rows'], stats[2]['inserted'], stats[2]['skipped']), (polls + 1, 1, polls))
+        self.assertTrue(StoreStatus.objects.filter(store_id='rewritten').exists())
+
+    def test_reimported_hours_refresh_aggregates(self):
+        import_all(self.data_path)
+        store_id = StoreStatus.objects.values_list('store_id', flat=True).first()
+        with open(os.path.join(self.data_path, 'menu_hours.csv'), 'a') as f:
+            f.write(''.join(f'{store_id},{day},02:00:00,03:00:00\n' for day in range(7)))
+        import_all(self.data_path)
+
+        def buckets():
+            return sorted(StoreHourlyUptime.objects.values_list(
+                'store_id', 'hour_start', 'uptime_seconds', 'downtime_seconds'))
+        imported = buckets()
+        rebuild_aggregates()
+        self.assertEqual(imported, buckets())
+
+    def test_timestamp_lookups_after_import(self):
+        import_all(self.data_path)
+        poll = StoreStatus.objects.order_by('timestamp_utc').first()
+        self.assertEqual(StoreStatus.objects.filter(timestamp_utc=poll.timestamp_utc).count(), 1)
+
+    def test_loader_choice(self):
+        # COPY is PostgreSQL-only; everything else uses executemany
+        self.assertEqual(ingest._loader(), 'insert')
+        with override_settings(INGEST_LOADER='copy'), self.assertRaises(ValueError):
+            import_all(self.data_path)
+        buffer = ingest._copy_buffer([('a,b', None, '2023-01-25 19:00:00'), ('c"d', 1, '')])
+        self.assertEqual(buffer.read(), '"a,b",\\N,2023-01-25 19:00:00\n"c""d",1,\n')
+
+
+class PollPartitionTests(SimpleTestCase):
+    def test_month_ranges(self):
+        ranges = month_ranges(datetime(2022, 11, 15, tzinfo=pytz.utc), datetime(2023, 1, 1, tzinfo=pytz.utc))
+        self.assertEqual([lo.strftime('%Y%m') for lo, _ in ranges], ['202211', '202212', '202301'])
+        self.assertEqual(ranges[1], (datetime(2022, 12, 1, tzinfo=pytz.utc), datetime(2023, 1, 1, tzinfo=pytz.utc)))
+
+    def test_needs_postgres(self):
+        with self.assertRaises(ValueError):
+            partition_store_status()
+
+
+class DataTableTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        load_dataset(stores=4, days=1, poll_minutes=120, seed=9)
+
+    def test_keyset_pages_cover_table_in_order(self):
+        expected = [
+            [store_id, ts.isoformat().replace('+00:00', 'Z'), status]
+            for store_id, ts, status in StoreStatus.objects.order_by('store_id', 'timestamp_utc')
+            .values_list('store_id', 'timestamp_utc', 'status')
+        ]
+        rows, url, pages = [], '/data/storestatus/?limit=7', 0
+        while url:
+            page = self.client.get(url).json()
+            rows += [[r['store_id'], r['timestamp_utc'], r['status']] for r in page['results']]
+            url, pages = page['next'], pages + 1
+        self.assertEqual(rows, expected)
+        self.assertEqual(pages, -(-len(expected) // 7))
+
+        hours = self.client.get('/data/businesshour/?limit=3').json()
+        after = self.client.get(f"/data/businesshour/?limit=3&cursor={hours['next_cursor']}").json()
+        self.assertEqual(len(after['results']), 3)
+        self.assertLess([hours['results'][-1][k] for k in ('store_id', 'day_of_week')],
+                        [after['results'][0][k] for k in ('store_id', 'day_of_week')])
+
+    def test_store_and_time_filters(self):
+        poll = StoreStatus.objects.order_by('store_id', 'timestamp_utc')[3]
+        until = poll.timestamp_utc + timedelta(hours=6)
+        page = self.client.get('/data/storestatus/', {
+            'store_id': poll.store_id, 'since': poll.timestamp_utc.isoformat(), 'until': until.isoformat(),
+        }).json()
+        self.assertEqual(len(page['results']), StoreStatus.objects.filter(
+            store_id=poll.store_id, timestamp_utc__gte=poll.timestamp_utc, timestamp_utc__lt=until).count())
+        self.assertTrue(page['results'] and all(r['store_id'] == poll.store_id for r in page['results']))
+        self.assertIsNone(page['next_cursor'])
+
+    def test_ndjson_export(self):
+        store_id = StoreStatus.objects.values_list('store_id', flat=True).first()
+        response = self.client.get(f'/data/storestatus/?store_id={store_id}&export=ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), StoreStatus.objects.filter(store_id=store_id).count())
+        self.assertEqual(set(json.loads(lines[0])), {'store_id', 'timestamp_utc', 'status'})
+
+    def test_bad_requests(self):
+        for url in ('/data/nope/', '/data/storestatus/?cursor=abc', '/data/storestatus/?limit=5000',
+                    '/data/timezone/?since=2023-01-01T00:00:00Z'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 400)
+
+
+class IngestJobTests(TestCase):
+    def setUp(self):
+        self.data_path = tempfile.mkdtemp()
+        self.polls = write_csvs(self.data_path, stores=5, days=1, seed=6)
+
+    def run_inline(self, job_id, data_path):
+        ingest_store_data(job_id, self.data_path)
+
+    def test_post_returns_job_and_status_reports_progress(self):
+        with mock.patch.object(ingest_store_data, 'delay', side_effect=self.run_inline), \
+                self.assertLogs('store_monitor', 'INFO') as logs:
+            response = self.client.post('/data/')
+        self.assertEqual(response.status_code, 202)
+        queued, done = [json.loads(record.getMessage()) for record in logs.records]
+        self.assertEqual((queued['event'], done['event']), ('ingest_queued', 'ingest_complete'))
+        self.assertLessEqual({'parse', 'insert', 'aggregate'}, set(done['stages']))
+        job = self.client.get(f"/data/jobs/{response.json()['job_id']}/").json()
+        self.assertEqual(job['state'], 'complete')
+        self.assertEqual(job['files']['store_status.csv']['rows_inserted'], self.polls)
+        self.assertEqual(job['rows_parsed'], job['rows_inserted'])
+        self.assertEqual(job['current_files'], [])
+        self.assertEqual(StoreStatus.objects.count(), self.polls)
+
+    def test_progress_written_by_worker_process(self):
+        with shared_cache():
+            IngestProgress('elsewhere').queue()
+            self.assertEqual(in_other_process(ingest_store_data, 'elsewhere', self.data_path), 0)
+            job = self.client.get('/data/jobs/elsewhere/').json()
+        self.assertEqual(job['state'], 'complete')
+        self.assertEqual(job['files']['store_status.csv']['rows_inserted'], self.polls)
+
+    def test_failed_job_reports_error(self):
+        with open(os.path.join(self.data_path, 'store_status.csv'), 'w') as f:
+            f.write('store_id,status,timestamp_utc\n1,active,not-a-date\n')
+        ingest_store_data('broken', self.data_path)
+        job = self.client.get('/data/jobs/broken/').json()
+        self.assertEqual(job['state'], 'failed')
+        self.assertEqual(len(job['errors']), 1)
+
+    def test_unknown_job(self):
+        self.assertEqual(self.client.get('/data/jobs/nope/').status_code, 404)
+
+
+class ShardedReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        load_dataset(stores=25, days=2, seed=3)
+
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+
+    def read_report(self, report_id):
+        with open(os.path.join(self.base_dir, 'reports', f'{report_id}.csv')) as f:
+            return f.read()
+
+    def test_local_process_pool_matches_single_task(self):
+        for engine in ('columnar', 'vectorized', 'pollstore'):
+            with self.subTest(engine=engine), override_settings(
+                BASE_DIR=self.base_dir, REPORT_ENGINE=engine, CELERY_TASK_ALWAYS_EAGER=True,
+                REPORT_LOCAL_WORKERS=2, POLL_STORE_PATH=os.path.join(self.base_dir, 'poll_store'),
+            ):
+                with override_settings(REPORT_SHARD_SIZE=0):
+                    generate_report(f'single-{engine}')
+                with override_settings(REPORT_SHARD_SIZE=4):
+                    generate_report(f'sharded-{engine}')
+                self.assertEqual(self.read_report(f'sharded-{engine}'), self.read_report(f'single-{engine}'))
+                self.assertEqual(report_progress(f'sharded-{engine}'), {'shards_done': 7, 'shards_total': 7})
+        self.assertEqual(self.read_report('single-pollstore'), self.read_report('single-vectorized'))
+
+    def test_progress_counted_across_processes(self):
+        with shared_cache():
+            cache.set('report:spread:shards_total', 3)
+            # Shards finish in worker processes; the web process reads the count
+            for _ in range(2):
+                self.assertEqual(in_other_process(_shard_done, 'spread'), 0)
+            self.assertEqual(report_progress('spread'), {'shards_done': 2, 'shards_total': 3})
+
+
+class StoreReportCacheTests(SimpleTestCase):
+    def setUp(self):
+        store_report_cache.clear()
+        caches['store_reports'].clear()
+        cache.clear()
+        self.tz = pytz.timezone('America/New_York')
+        self.hours = {d: (time(9, 0), time(17, 0)) for d in range(7)}
+        self.now = datetime(2023, 1, 25, 18, 0, tzinfo=pytz.utc)
+        self.polls = [(self.now - timedelta(hours=h), h % 3 != 0) for h in range(48, 0, -1)]
+
+    def row(self, hours=None, polls=None):
+        windows = (self.now - timedelta(hours=1), self.now - timedelta(days=1), self.now - timedelta(days=7))
+        return get_store_report('s1', self.now, *windows, self.tz, hours or self.hours,
+                                self.polls if polls is None else polls)
+
+    def test_versioned_keys_and_counters(self):
+        first = self.row()
+        self.assertEqual(self.row(), first)
+        store_report_cache.local.clear()
+        self.assertEqual(self.row(), first)
+        # Different hours or a new poll is a new version, not a stale hit
+        self.assertNotEqual(self.row(hours={d: (time(0, 0), time(23, 59)) for d in range(7)}), first)
+        self.row(polls=self.polls + [(self.now, False)])
+        self.assertEqual(cache_stats(), {'local_hits': 1, 'shared_hits': 1, 'misses': 3, 'hit_rate': 0.4})
+
+    def test_lru_evicts_by_size(self):
+        lru = LRUCache(max_bytes=100)
+        for key in 'abc':
+            lru.set(key, key, 40)
+        self.assertIsNone(lru.get('a'))
+        lru.get('b')
+        lru.set('d', 'd', 40)
+        self.assertEqual(list(lru.entries), ['b', 'd'])
+        self.assertEqual(lru.size, 80)
+        lru.set('huge', 'x', 101)
+        self.assertIsNone(lru.get('huge'))
+
+
+@override_settings(BASE_DIR=tempfile.mkdtemp())
+class ReportDownloadTests(TestCase):
+    def setUp(self):
+        rows = [[f'store-{i}', i % 60, i % 24, i % 168, 0, 0, 0] for i in range(20000)]
+        write_report('r1', rows)
+        with open(report_path('r1'), 'rb') as f:
+            self.content = f.read()
+        Report.objects.create(report_id='r2')
+
+    def test_streams_whole_file_with_validators(self):
+        response = self.client.get('/get_report/r1/download/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(int(response['Content-Length']), len(self.content))
+        not_modified = self.client.get('/get_report/r1/download/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_gzip_negotiation(self):
+        response = self.client.get('/get_report/r1/download/', HTTP_ACCEPT_ENCODING='br, gzip;q=0.8')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.content)
+        refused = self.client.get('/get_report/r1/download/', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(refused.has_header('Content-Encoding'))
+
+    def test_concurrent_gzip_copies(self):
+        # Threads compressing at once each write their own temp file
+        with mock.patch('os.path.exists', return_value=False), ThreadPoolExecutor(4) as pool:
+            copies = list(pool.map(gzip_path, [report_path('r1')] * 8))
+        with gzip.open(copies[0]) as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual([name for name in os.listdir(os.path.dirname(copies[0])) if name.endswith('.tmp')], [])
+
+    def test_range_requests(self):
+        size = len(self.content)
+        for header, expected in (('bytes=10-19', self.content[10:20]), ('bytes=-5', self.content[-5:]),
+                                 (f'bytes={size - 3}-', self.content[-3:])):
+            with self.subTest(header=header):
+                response = self.client.get('/get_report/r1/download/', HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(b''.join(response.streaming_content), expected)
+        self.assertEqual(self.client.get('/get_report/r1/download/', HTTP_RANGE=f'bytes={size}-').status_code, 416)
+        stale = self.client.get('/get_report/r1/download/', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"other"')
+        self.assertEqual(stale.status_code, 200)
+
+    def test_status_only(self):
+        complete = self.client.get('/get_report/r1/status/').json()
+        self.assertEqual((complete['status'], complete['rows'], complete['size'], complete['download_url']),
+                         ('Complete', 20000, len(self.content), '/get_report/r1/download/'))
+        self.assertEqual(self.client.get('/get_report/r2/status/').json(), {'status': 'Queued'})
+        self.assertEqual(self.client.get('/get_report/r2/download/').status_code, 404)
+        self.assertEqual(self.client.get('/get_report/r3/status/').status_code, 404)
+        self.assertFalse([name for name in os.listdir(os.path.dirname(report_path('r1'))) if name.endswith('.tmp')])
+
+    def test_compressed_format_streams_to_disk(self):
+        Report.objects.create(report_id='gz', format='csv.gz')
+        with mock.patch('store_monitor.report_formats.BATCH_ROWS', 7):
+            write_report('gz', ([f'store-{i}', i % 60, i % 24, i % 168, 0, 0, 0] for i in range(20000)))
+        with gzip.open(report_path('gz', 'csv.gz'), 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertIsNone(cache.get('report:gz'))
+
+        report = self.client.get('/get_report/gz/').json()
+        self.assertEqual((report['format'], report['download_url']), ('csv.gz', '/get_report/gz/download/'))
+        self.assertNotIn('csv_content', report)
+        response = self.client.get('/get_report/gz/download/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('gz.csv.gz', response['Content-Disposition'])
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.content)
+
+    def test_trigger_rejects_unknown_or_unavailable_format(self):
+        self.assertEqual(self.client.post('/trigger_report/', {'format': 'xlsx'}).status_code, 400)
+        for fmt in set(REPORT_FORMATS) - set(available_formats()):
+            with self.subTest(fmt=fmt):
+                self.assertEqual(self.client.post('/trigger_report/', {'format': fmt}).status_code, 400)
+
+    @unittest.skipUnless(report_formats.HAS_PYARROW, "pyarrow is not installed")
+    def test_parquet_round_trip(self):
+        import pyarrow.parquet as parquet
+        Report.objects.create(report_id='pq', format='parquet')
+        rows = [[f'store-{i}', i % 60, i % 24, i % 168, 0, 0, 0] for i in range(20000)]
+        write_report('pq', rows)
+        table = parquet.read_table(report_path('pq', 'parquet'))
+        self.assertEqual([list(row.values()) for row in table.to_pylist()], rows)
+
+
+@override_settings(BASE_DIR=tempfile.mkdtemp())
+class ReportLifecycleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_states_and_latency_stats(self):
+        load_dataset(stores=5, days=1, seed=8)
+        with mock.patch.object(generate_report, 'delay', side_effect=generate_report):
+            report_id = self.client.post('/trigger_report/').json()['report_id']
+        report = Report.objects.get(report_id=report_id)
+        self.assertEqual((report.state, report.rows), (Report.COMPLETE, 5))
+        self.assertEqual(report.bytes, os.path.getsize(report_path(report_id)))
+        self.assertLessEqual(report.created_at, report.started_at)
+        self.assertEqual(self.client.get(f'/get_report/{report_id}/').json()['status'], 'Complete')
+
+        stats = self.client.get('/reports/stats/').json()
+        self.assertEqual(stats['reports'], 1)
+        self.assertEqual(stats['compute']['p50'], report.compute_seconds)
+
+    def test_triggers_share_work_per_snapshot(self):
+        load_dataset(stores=5, days=1, seed=8)
+        with mock.patch.object(generate_report, 'delay') as delay:
+            first = self.client.post('/trigger_report/').json()['report_id']
+            second = self.client.post('/trigger_report/').json()['report_id']
+        delay.assert_called_once_with(first)
+        self.assertEqual(Report.objects.get(report_id=second).coalesced_into, first)
+        self.assertEqual(self.client.get(f'/get_report/{second}/status/').json()['status'], 'Queued')
+
+        # The in-flight report finishes its followers; later triggers are served at once
+        generate_report(first)
+        with mock.patch.object(generate_report, 'delay') as delay:
+            third = self.client.post('/trigger_report/').json()['report_id']
+        delay.assert_not_called()
+        for report_id in (second, third):
+            self.assertEqual(Report.objects.get(report_id=report_id).state, Report.COMPLETE)
+            with open(report_path(report_id)) as a, open(report_path(first)) as b:
+                self.assertEqual(a.read(), b.read())
+
+        # New data is a new snapshot
+        StoreStatus.objects.create(store_id='new', timestamp_utc=datetime(2023, 1, 26, tzinfo=pytz.utc), status='active')
+        with mock.patch.object(generate_report, 'delay') as delay:
+            fourth = self.client.post('/trigger_report/').json()['report_id']
+        delay.assert_called_once_with(fourth)
+
+    def test_missing_file_is_recomputed(self):
+        load_dataset(stores=5, days=1, seed=8)
+        with mock.patch.object(generate_report, 'delay', side_effect=generate_report):
+            first = self.client.post('/trigger_report/').json()['report_id']
+        os.remove(report_path(first))
+        self.assertEqual(self.client.get(f'/get_report/{first}/').status_code, 410)
+        self.assertEqual(self.client.get(f'/get_report/{first}/download/').status_code, 410)
+        # The finished report's file is gone: a new computation is queued instead of a 500
+        with mock.patch.object(generate_report, 'delay') as delay:
+            response = self.client.post('/trigger_report/')
+        self.assertEqual(response.status_code, 200)
+        second = response.json()['report_id']
+        delay.assert_called_once_with(second)
+        with mock.patch.object(generate_report, 'delay') as delay:
+            third = self.client.post('/trigger_report/').json()['report_id']
+        delay.assert_not_called()
+        self.assertEqual(Report.objects.get(report_id=third).coalesced_into, second)
+
+    def test_report_file_without_row(self):
+        # Written before reports had a Report row, like the sample in reports/
+        os.makedirs(os.path.dirname(report_path('legacy')), exist_ok=True)
+        with open(report_path('legacy'), 'w') as f:
+            f.write(','.join(report_formats.REPORT_HEADER) + '\n1,60,24,168,0,0,0\n')
+        response = self.client.get('/get_report/legacy/')
+        self.assertEqual(response.json()['status'], 'Complete')
+        self.assertIn('1,60,24,168,0,0,0', response.json()['csv_content'])
+        self.assertEqual(Report.objects.get(report_id='legacy').rows, 1)
+        self.assertEqual(self.client.get('/get_report/legacy/status/').json()['rows'], 1)
+        self.assertEqual(self.client.get('/get_report/missing/').status_code, 404)
+
+    def test_status_written_by_another_process(self):
+        with shared_cache():
+            set_report_state('elsewhere', Report.QUEUED)
+            self.assertEqual(self.client.get('/get_report/elsewhere/status/').json()['status'], 'Queued')
+            # A worker finishes the report; the web process's next status read sees it
+            self.assertEqual(in_other_process(set_report_state, 'elsewhere', Report.COMPLETE), 0)
+            self.assertEqual(self.client.get('/get_report/elsewhere/status/').json()['status'], 'Complete')
+
+    def test_failure_is_recorded(self):
+        generate_report('empty')
+        self.assertEqual(self.client.get('/get_report/empty/').json(), {'status': 'Failed', 'error': 'No data'})
+        load_dataset(stores=2, days=1, seed=8)
+        with override_settings(REPORT_ENGINE='missing'), self.assertRaises(KeyError):
+            generate_report('broken')
+        self.assertEqual(Report.objects.get(report_id='broken').state, Report.FAILED)
+        self.assertEqual(self.client.get('/get_report/broken/status/').json()['status'], 'Failed')
+
+
+@override_settings(BASE_DIR=tempfile.mkdtemp(), REPORT_EVENTS_POLL_SECONDS=0.01, REPORT_EVENTS_TIMEOUT=5)
+class ReportEventsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_status_served_from_cache(self):
+        set_report_state('queued', Report.QUEUED)
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                self.assertEqual(self.client.get('/get_report/queued/status/').json(), {'status': 'Queued'})
+        self.assertEqual(self.client.get('/get_report/missing/events/').status_code, 404)
+
+    def test_async_variants(self):
+        load_dataset(stores=3, days=1, seed=8)
+        for url, fmt in (('/trigger_report/', 'csv.gz'), ('/trigger_report/async/', 'csv')):
+            with mock.patch.object(generate_report, 'delay', side_effect=generate_report):
+                report_id = self.client.post(url, {'format': fmt}).json()['report_id']
+            self.assertEqual(Report.objects.get(report_id=report_id).format, fmt)
+        status = self.client.get(f'/get_report/{report_id}/status/').json()
+        self.assertEqual(status['status'], 'Complete')
+        self.assertEqual(self.client.get(f'/get_report/{report_id}/status/async/').json(), status)
+        self.assertEqual(self.client.get('/get_report/missing/status/async/').status_code, 404)
+        # The DRF endpoints are the documented ones
+        paths = self.client.get('/swagger.json').json()['paths']
+        self.assertIn('post', paths['/trigger_report/'])
+        self.assertIn('get', paths['/get_report/{report_id}/status/'])
+
+    async def events(self, report_id):
+        response = await self.async_client.get(f'/get_report/{report_id}/events/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        async for chunk in response.streaming_content:
+            fields = dict(line.split(': ', 1) for line in chunk.decode().splitlines() if ': ' in line)
+            if 'event' in fields:
+                yield fields['event'], json.loads(fields['data'])
+
+    async def test_progress_then_complete(self):
+        await sync_to_async(set_report_state)('r1', Report.RUNNING)
+        cache.set('report:r1:shards_total', 2)
+        events = []
+        async for event in self.events('r1'):
+            events.append(event)
+            # Shards finish while the client is listening
+            if len(events) < 3:
+                await sync_to_async(_shard_done)('r1')
+            if len(events) == 3:
+                await sync_to_async(write_report)('r1', [['s1', 1, 2, 3, 4, 5, 6]])
+        self.assertEqual([(name, data.get('shards_done')) for name, data in events],
+                         [('progress', 0), ('progress', 1), ('progress', 2), ('complete', None)])
+        self.assertEqual((events[-1][1]['rows'], events[-1][1]['download_url']), (1, '/get_report/r1/download/'))
+
+    async def test_state_written_by_worker_process(self):
+        with shared_cache():
+            await sync_to_async(set_report_state)('r2', Report.RUNNING)
+            events = []
+            async for event in self.events('r2'):
+                events.append(event)
+                if len(events) == 1:
+                    # The worker finishes the report in its own process
+                    exitcode = await sync_to_async(in_other_process)(
+                        set_report_state, 'r2', Report.COMPLETE, rows=4, bytes=100)
+                    self.assertEqual(exitcode, 0)
+        self.assertEqual([(name, data['status']) for name, data in events],
+                         [('progress', 'Running'), ('complete', 'Complete')])
+        self.assertEqual(events[-1][1]['rows'], 4)
+
+
+@override_settings(BASE_DIR=tempfile.mkdtemp())
+class ReportParamsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        load_dataset(stores=8, days=9, poll_minutes=90, seed=12)
+
+    def setUp(self):
+        cache.clear()
+
+    def trigger(self, **data):
+        with mock.patch.object(generate_report, 'delay', side_effect=generate_report):
+            response = self.client.post('/trigger_report/', data, content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        with open(report_path(response.json()['report_id'])) as f:
+            return list(csv.reader(f))
+
+    def test_default_windows_match_standard_report(self):
+        self.assertEqual(self.trigger(windows=['1h', '1d', '7d']), self.trigger())
+
+    def test_as_of_ignores_later_polls(self):
+        as_of = StoreStatus.objects.aggregate(Max('timestamp_utc'))['timestamp_utc__max'] - timedelta(days=1, minutes=7)
+        windows = (as_of - timedelta(hours=1), as_of - timedelta(days=1), as_of - timedelta(days=7))
+        expected = [
+            [str(v) for v in store_report_row(store_id, as_of, *windows, tz, hours, [p for p in polls if p[0] <= as_of])]
+            for store_id, tz, hours, polls in iter_store_inputs()
+            if polls[0][0] <= as_of
+        ]
+        rows = self.trigger(as_of=as_of.isoformat())
+        self.assertEqual(rows[1:], expected)
+
+    def test_custom_windows_and_store_subset(self):
+        stores = sorted(set(StoreStatus.objects.values_list('store_id', flat=True)))[2:4]
+        rows = self.trigger(windows='30m,3d', store_ids=','.join(stores))
+        self.assertEqual(rows[0], ['store_id', 'uptime_last_30m', 'uptime_last_3d',
+                                   'downtime_last_30m', 'downtime_last_3d'])
+        self.assertEqual([row[0] for row in rows[1:]], stores)
+        now_utc = StoreStatus.objects.aggregate(Max('timestamp_utc'))['timestamp_utc__max']
+        inputs = {store_id: (tz, hours, polls) for store_id, tz, hours, polls in iter_store_inputs()}
+        for row in rows[1:]:
+            up, down = compute_uptime_downtime(now_utc - timedelta(minutes=30), now_utc, *inputs[row[0]])
+            self.assertEqual((int(row[1]), int(row[3])), (round(up), round(down)))
+
+        # Only the subset's polls are read
+        metrics = Metrics()
+        window_report_rows({'windows': ['3d'], 'store_ids': stores}, now_utc, metrics)
+        since = now_utc - timedelta(days=3)
+        in_window = StoreStatus.objects.filter(store_id__in=stores, timestamp_utc__gt=since).count()
+        self.assertEqual(metrics.counts['polls'], in_window + len(stores))
+
+    def test_subset_stores_without_polls(self):
+        # 'quiet' has a timezone but no polls; the first poll of `late` comes after as_of
+        Timezone.objects.create(store_id='quiet', timezone_str='Asia/Tokyo')
+        late = StoreStatus.objects.order_by('-timestamp_utc').values_list('store_id', flat=True).first()
+        first_poll = StoreStatus.objects.filter(store_id=late).aggregate(Min('timestamp_utc'))['timestamp_utc__min']
+        as_of = first_poll - timedelta(minutes=1)
+        rows = self.trigger(as_of=as_of.isoformat(), windows=['1h', '1d'], store_ids=[late, 'quiet'])
+        self.assertEqual(sorted(row[0] for row in rows[1:]), sorted([late, 'quiet']))
+        inputs = {store_id: (tz, hours) for store_id, tz, hours, _ in iter_store_inputs()}
+        lookups = store_lookups()
+        inputs['quiet'] = (lookups.schedule('quiet').tz, lookups.schedule('quiet'))
+        for row in rows[1:]:
+            with self.subTest(store_id=row[0]):
+                # Same as any store without polls: down for the window's business hours
+                expected = [compute_uptime_downtime(as_of - length, as_of, *inputs[row[0]], [])
+                            for length in (timedelta(hours=1), timedelta(days=1))]
+                self.assertEqual([int(v) for v in row[1:]], [
+                    0, 0, round(expected[0][1]), round(expected[1][1] / 60)])
+
+    def test_unknown_store_ids(self):
+        store = StoreStatus.objects.values_list('store_id', flat=True).first()
+        response = self.client.post('/trigger_report/', {'store_ids': [store, 'no-such-store']},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('no-such-store', response.json()['store_ids'][0])
+
+    def test_invalid_params(self):
+        for data in ({'windows': ['1x']}, {'windows': []}, {'as_of': 'yesterday'}, {'store_ids': []},
+                     ['csv'], '"csv"', '1', 'null'):
+            for url in ('/trigger_report/', '/trigger_report/async/'):
+                with self.subTest(data=data, url=url):
+                    response = self.client.post(url, data, content_type='application/json')
+                    self.assertEqual(response.status_code, 400)
+
+
+class StoreUptimeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        load_dataset(stores=5, days=8, poll_minutes=60, seed=21)
+
+    def setUp(self):
+        cache.clear()
+        refresh_poll_index()
+
+    def test_matches_report_row(self):
+        for row in report_rows(iter_store_inputs):
+            with self.subTest(store_id=row[0]), self.assertNumQueries(0):
+                response = self.client.get(f'/stores/{row[0]}/uptime/')
+                self.assertEqual(response.status_code, 200)
+                body = response.json()
+                self.assertEqual([body[name] for name in report_formats.REPORT_HEADER], row)
+
+    def test_unknown_store(self):
+        self.assertEqual(self.client.get('/stores/no-such-store/uptime/').status_code, 404)
+
+    def test_stale_after_ingestion(self):
+        index = refresh_poll_index()
+        self.assertFalse(index.stale())
+        ingest.bump_data_generation()
+        self.assertTrue(index.stale())
+
+        # Without a generation bump (e.g. a per-process cache), the periodic recheck notices new polls
+        index = refresh_poll_index()
+        latest = StoreStatus.objects.order_by('-timestamp_utc').first()
+        StoreStatus.objects.create(store_id=latest.store_id, status='active',
+                                   timestamp_utc=latest.timestamp_utc + timedelta(hours=1))
+        with override_settings(POLL_INDEX_RECHECK_SECONDS=0):
+            self.assertTrue(index.stale())
+        self.assertEqual(refresh_poll_index().now, latest.timestamp_utc + timedelta(hours=1))
+
+    def test_stale_after_lookup_edit(self):
+        index = refresh_poll_index()
+        tz = Timezone.objects.first()
+        tz.timezone_str = 'Asia/Tokyo' if tz.timezone_str != 'Asia/Tokyo' else 'America/Chicago'
+        tz.save()
+        with override_settings(POLL_INDEX_RECHECK_SECONDS=0):
+            self.assertTrue(index.stale())
+        self.assertEqual(refresh_poll_index().lookups.schedule(tz.store_id).tz.zone, tz.timezone_str)
+
+    def test_loading_after_restart(self):
+        # The first build runs in the background; until it lands lookups get a 503
+        with mock.patch.object(poll_index_module, '_current', None), \
+                mock.patch.object(poll_index_module, '_refresh_in_background') as refresh:
+            response = self.client.get('/stores/no-such-store/uptime/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        refresh.assert_called_once_with()
+
+
+class StartupTests(TestCase):
+    def test_entry_points_defer_heavy_imports(self):
+        from store_monitor.management.commands.benchmark_startup import ENTRY_POINTS
+        for entry in ('wsgi', 'worker'):
+            with self.subTest(entry=entry):
+                code = ENTRY_POINTS[entry] + "; import sys; print(sorted({'numpy', 'pandas'} & set(sys.modules)))"
+                result = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, capture_output=True,
+                                        text=True, check=True)
+                self.assertEqual(result.stdout.strip(), '[]')
+
+    def test_warm_start_once_per_process(self):
+        load_dataset(stores=3, days=1, seed=3)
+        warmup._warmed_pid = None
+        with self.assertLogs('store_monitor', 'INFO') as logs:
+            self.assertIsNotNone(warmup.warm_start())
+        self.assertEqual(json.loads(logs.records[0].getMessage())['event'], 'worker_warm')
+        self.assertLessEqual(set(warmup.WARM_MODULES), set(sys.modules))
+        self.assertIsNone(warmup.warm_start())
+        # Lookups are compiled and current, so the first report only checks their versions
+        lookups = store_lookups()
+        with self.assertNumQueries(3):
+            self.assertIs(store_lookups(), lookups)
+
+
+@override_settings(BASE_DIR=tempfile.mkdtemp())
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        store_report_cache.clear()
+        store_report_cache.shared.clear()
+
+    def report_events(self, report_id):
+        Report.objects.create(report_id=report_id)
+        with self.assertLogs('store_monitor', 'INFO') as logs:
+            generate_report(report_id)
+        return [json.loads(record.getMessage()) for record in logs.records]
+
+    def test_report_stages_and_counters(self):
+        load_dataset(stores=6, days=2, seed=4)
+        for engine in ('columnar', 'vectorized', 'incremental'):
+            with self.subTest(engine=engine), override_settings(REPORT_ENGINE=engine):
+                [event] = self.report_events(f'timed-{engine}')
+                self.assertEqual((event['event'], event['engine'], event['stores']), ('report_complete', engine, 6))
+                self.assertGreater(event['queries'], 0)
+                self.assertLessEqual({'query', 'serialize', 'write'}, set(event['stages']))
+                if engine != 'incremental':
+                    self.assertEqual(event['polls'], StoreStatus.objects.count())
+                    self.assertIn('compute', event['stages'])
+        # The scalar engine also reports per-store cache lookups
+        with override_settings(REPORT_ENGINE='columnar'):
+            [event] = self.report_events('timed-again')
+        self.assertEqual(event.get('cache_local_hits'), 6)
+
+    def test_metrics_endpoint(self):
+        load_dataset(stores=3, days=1, seed=4)
+        self.report_events('exported')
+        text = self.client.get('/metrics/').content.decode()
+        self.assertIn('store_monitor_reports_total{engine="columnar",state="complete"} 1', text)
+        self.assertIn('store_monitor_reports{state="complete"} 1', text)
+        self.assertIn('store_monitor_report_stores_total 3', text)
+        self.assertIn('# TYPE store_monitor_report_stage_seconds_total counter', text)
+        with override_settings(METRICS_ENABLED=False):
+            self.assertEqual(self.client.get('/metrics/').status_code, 404)
+
+    def test_metrics_from_worker_processes(self):
+        load_dataset(stores=3, days=1, seed=4)
+        with shared_cache():
+            Report.objects.create(report_id='elsewhere')
+            self.assertEqual(in_other_process(generate_report, 'elsewhere'), 0)
+            text = self.client.get('/metrics/').content.decode()
+        self.assertIn('store_monitor_reports_total{engine="columnar",state="complete"} 1', text)
+        self.assertIn('store_monitor_report_stores_total 3', text)
+        self.assertIn('store_monitor_store_cache_total{result="misses"} 3', text)
+
+    def test_profile_saved_next_to_report(self):
+        load_dataset(stores=2, days=1, seed=4)
+        with override_settings(REPORT_PROFILE='cprofile'):
+            [event] = self.report_events('profiled')
+        self.assertEqual(event['profile'], os.path.splitext(report_path('profiled'))[0] + '.prof')
+        self.assertGreater(pstats.Stats(event['profile']).total_calls, 0)
+
+
+class VectorizedDstTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Week spanning the US spring-forward transition, sparse polls
+        load_dataset(stores=15, days=9, poll_minutes=170, seed=2,
+                     end=datetime(2023, 3, 14, 9, 30, tzinfo=pytz.utc))
+        # A store whose only polls are inside the last hour
+        StoreStatus.objects.create(store_id='late', timestamp_utc=datetime(2023, 3, 14, 9, 0, tzinfo=pytz.utc), status='inactive')
+
+    def test_vectorized_matches_scalar(self):
+        now_utc, windows = report_windows()
+        self.assertEqual(list(vectorized_report_rows(now_utc, *windows)), report_rows(iter_store_inputs))
+
+    def test_poll_store_matches_orm_columns(self):
+        path = tempfile.mkdtemp()
+        manifest = compact_poll_store(path)
+        self.assertEqual(manifest['rows'], StoreStatus.objects.count())
+        self.assertEqual(len(manifest['partitions']), 10)
+        store = PollStore(path)
+        store_ids = load_poll_columns()[0]
+        for store_range in (None, (store_ids[3], store_ids[9]), ('late', 'late')):
+            with self.subTest(store_range=store_range):
+                expected, actual = load_poll_columns(store_range), store.load_columns(store_range)
+                self.assertEqual(actual[0], expected[0])
+                self.assertEqual(actual[1].tolist(), expected[1].tolist())
+                self.assertTrue(np.allclose(actual[2], expected[2], rtol=0, atol=1e-6))
+                self.assertEqual(actual[3].tolist(), expected[3].tolist())
+
+        # Unchanged table: refresh keeps the export; a new poll triggers re-compaction
+        self.assertEqual(refresh_poll_store(path), manifest)
+        StoreStatus.objects.create(store_id='late', timestamp_utc=datetime(2023, 3, 14, 9, 45, tzinfo=pytz.utc),
+                                   status='active')
+        self.assertEqual(refresh_poll_store(path)['rows'], manifest['rows'] + 1)
+
+    def test_poll_store_versions(self):
+        path = tempfile.mkdtemp()
+        first = compact_poll_store(path)
+        store = PollStore(path)
+        expected = store.load_columns()[0]
+        # A reader keeps the export it opened while a newer one lands; one more export retires it
+        second = compact_poll_store(path)
+        self.assertEqual(read_manifest(path), second)
+        self.assertEqual(store.load_columns()[0], expected)
+        third = compact_poll_store(path)
+        self.assertEqual(sorted(os.listdir(path)), sorted([MANIFEST, second['version'], third['version']]))
+        self.assertNotEqual(first['version'], third['version'])
+
+    def test_compactions_take_turns(self):
+        path = tempfile.mkdtemp()
+        with shared_cache():
+            before = compact_poll_store(path)
+            other = multiprocessing.get_context('fork').Process(target=compact_poll_store, args=(path,))
+            with compaction_lock(path):
+                other.start()
+                other.join(1)
+                # Blocked on the lock held here
+                self.assertTrue(other.is_alive())
+                self.assertEqual(read_manifest(path), before)
+            other.join()
+        self.assertEqual(other.exitcode, 0)
+        self.assertNotEqual(read_manifest(path)['version'], before['version'])
+
+
+# Original day-by-day implementation, kept as the reference for WeeklySchedule
+def reference_business_minutes(start_utc, end_utc, tz, business_hours):
+    if start_utc >= end_utc:
+        return 0
+    local_start = start_utc.astimezone(tz)
+    local_end = end_utc.astimezone(tz)
+    total_minutes = 0
+    current = local_start
+    while current < local_end:
+        day = current.weekday()
+        next_day = (current + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        if day in business_hours:
+            start_time, end_time = business_hours[day]
+            day_start = current.replace(hour=start_time.hour, minute=start_time.minute)
+            day_end = current.replace(hour=end_time.hour, minute=end_time.minute)
+            b_start = max(day_start, current)
+            b_end = min(day_end, min(local_end, next_day))
+            if b_start < b_end:
+                total_minutes += (b_end - b_start).total_seconds() / 60
+        current = next_day
+    return total_minutes
+
+
+class WeeklyScheduleTests(SimpleTestCase):
+    def test_overnight_shift_runs_into_next_day(self):
+        hours = {0: (time(22, 0), time(2, 0))}
+        start = datetime(2023, 1, 23, 21, 0, tzinfo=pytz.utc)  # Monday
+        self.assertEqual(business_minutes(start, start + timedelta(hours=6), pytz.utc, hours), 240)
+
+    def test_sunday_overnight_wraps_to_monday(self):
+        hours = {6: (time(22, 0), time(2, 0))}
+        start = datetime(2023, 1, 29, 23, 0, tzinfo=pytz.utc)  # Sunday
+        self.assertEqual(business_minutes(start, start + timedelta(hours=2), pytz.utc, hours), 120)
+
+    def test_dst_spring_forward_shortens_the_day(self):
+        # Chicago skips 02:00-03:00 local on 2023-03-12, so 00:00-06:00 is five real hours
+        tz = pytz.timezone('America/Chicago')
+        start = datetime(2023, 3, 12, 6, 0, tzinfo=pytz.utc)
+        self.assertEqual(business_minutes(start, start + timedelta(days=1), tz, {6: (time(0, 0), time(6, 0))}), 300)
+
+    def test_dst_fall_back_repeats_an_hour(self):
+        tz = pytz.timezone('America/Chicago')
+        start = datetime(2023, 11, 5, 5, 0, tzinfo=pytz.utc)
+        self.assertEqual(business_minutes(start, start + timedelta(days=1), tz, {6: (time(0, 0), time(6, 0))}), 420)
+
+    def test_no_hours_means_open_all_day(self):
+        tz = pytz.timezone(DEFAULT_TIMEZONE)
+        start = datetime(2023, 1, 23, 6, 0, tzinfo=pytz.utc)
+        self.assertEqual(WeeklySchedule(None, tz).minutes(start, start + timedelta(days=7)), 7 * 24 * 60)
+
+    def test_offset_table_matches_pytz_lookups(self):
+        hours = {0: (time(9, 0), time(17, 0)), 5: (time(22, 0), time(3, 0)), 6: (time(0, 0), time(6, 0))}
+        for zone, start in (('America/Chicago', datetime(2023, 3, 8, tzinfo=pytz.utc)),
+                            ('Europe/London', datetime(2023, 10, 25, tzinfo=pytz.utc))):
+            tz = pytz.timezone(zone)
+            plain, tabled = WeeklySchedule(hours, tz), WeeklySchedule(hours, tz)
+            tabled.offset_table = OffsetTable(tz, start.timestamp(), (start + timedelta(days=10)).timestamp())
+            for hour in range(0, 9 * 24, 7):
+                a = start + timedelta(hours=hour)
+                for b in (a + timedelta(hours=1), a + timedelta(days=1), a + timedelta(days=7)):
+                    with self.subTest(zone=zone, start=a, end=b):
+                        self.assertEqual(tabled.minutes(a, b), plain.minutes(a, b))
+
+    def test_matches_reference_implementation(self):
+        zones = ['UTC', 'Asia/Kolkata', 'America/Chicago', 'Europe/London', 'Australia/Sydney']
+        minute_of_day = st.integers(0, 24 * 60 - 1)
+        hours = st.dictionaries(st.integers(0, 6), st.tuples(minute_of_day, minute_of_day), max_size=7)
+        instant = st.datetimes(datetime(2022, 1, 1), datetime(2024, 1, 1))
+
+        @hypothesis_settings(max_examples=300, deadline=None)
+        @given(st.sampled_from(zones), hours, instant, st.integers(0, 8 * 24 * 3600))
+        def check(zone, raw_hours, start, duration):
+            tz = pytz.timezone(zone)
+            start_utc = pytz.utc.localize(start)
+            end_utc = start_utc + timedelta(seconds=duration)
+            # The reference uses the start's UTC offset throughout and skips overnight shifts
+            assume(start_utc.astimezone(tz).utcoffset() == end_utc.astimezone(tz).utcoffset())
+            business_hours = {
+                day: (time(*divmod(min(a, b), 60)), time(*divmod(max(a, b), 60)))
+                for day, (a, b) in raw_hours.items()
+            }
+            expected = reference_business_minutes(start_utc, end_utc, tz, business_hours)
+            schedule = WeeklySchedule(business_hours, tz)
+            # The reference keeps the start's seconds on the first day's open/close
+            self.assertAlmostEqual(schedule.minutes(start_utc, end_utc), expected, delta=1)
+
+        check()
@@ -18,8 +18,17 @@ schema_view = get_schema_view(
 
 urlpatterns = [
     path('trigger_report/', TriggerReportView.as_view(), name='trigger_report'),
+    path('trigger_report/async/', AsyncTriggerReportView.as_view(), name='trigger_report_async'),
     path('get_report/<str:report_id>/', GetReportView.as_view(), name='get_report'),
+    path('get_report/<str:report_id>/status/', ReportStatusView.as_view(), name='report_status'),
+    path('get_report/<str:report_id>/status/async/', AsyncReportStatusView.as_view(), name='report_status_async'),
+    path('get_report/<str:report_id>/events/', ReportEventsView.as_view(), name='report_events'),
+    path('get_report/<str:report_id>/download/', ReportDownloadView.as_view(), name='report_download'),
+    path('stores/<str:store_id>/uptime/', StoreUptimeView.as_view(), name='store_uptime'),
+    path('reports/stats/', ReportStatsView.as_view(), name='report_stats'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('data/', DataCollectionView.as_view(), name='data_collection'), 
+    path('data/jobs/<str:job_id>/', IngestJobView.as_view(), name='ingest_job'),
     path('data/<str:table>/', DataTableView.as_view(), name='data_table'),
     re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
@@ -0,0 +1,218 @@
+from array import array
+import numpy as np
+from store_monitor.engine import POLL_CHUNK_SIZE, report_polls, report_row, window_length, window_row
+from store_monitor.lookups import store_lookups
+from store_monitor.schedule import EPOCH_MONDAY_SHIFT, WEEK_SECONDS, utc_offset, utc_transitions
+
+
+# Polls as flat columns sorted by (store, time): (store_ids, store_idx, epochs, active).
+# `since`, `until` and `subset` limit them to what a report needs, see engine.report_polls.
+# Every store in `subset` is listed, including those without polls up to `until`, which
+# compute_uptime_matrix reports as down for the whole window like any other poll-less store
+def load_poll_columns(store_range=None, chunk_size=POLL_CHUNK_SIZE, since=None, until=None, subset=None):
+    store_ids = []
+    store_idx, epochs, active = array('q'), array('d'), bytearray()
+    rows = report_polls(store_range, since, until, subset)
+    for store_id, ts, status in rows.iterator(chunk_size=chunk_size):
+        if not store_ids or store_ids[-1] != store_id:
+            store_ids.append(store_id)
+        store_idx.append(len(store_ids) - 1)
+        epochs.append(ts.timestamp())
+        active.append(status == 'active')
+    if subset is not None:
+        store_ids += sorted(set(subset) - set(store_ids))
+    return (
+        store_ids,
+        np.frombuffer(store_idx, dtype=np.int64),
+        np.frombuffer(epochs, dtype=np.float64),
+        np.frombuffer(active, dtype=np.bool_),
+    )
+
+
+# Compiled schedule per store (same fallbacks as the scalar engines)
+def load_schedules(store_ids):
+    lookups = store_lookups()
+    return [lookups.schedule(store_id) for store_id in store_ids]
+
+
+class ScheduleTable:
+    """Distinct WeeklySchedules flattened into arrays for vectorized lookups.
+
+    Segment offsets of schedule g are shifted by g weeks so one searchsorted
+    covers every schedule. `store_gid[i]` is the schedule of store i.
+    """
+
+    def __init__(self, schedules):
+        gids = {}
+        self.schedules = []
+        self.store_gid = np.empty(len(schedules), dtype=np.int64)
+        for i, schedule in enumerate(schedules):
+            if schedule.key not in gids:
+                gids[schedule.key] = len(self.schedules)
+                self.schedules.append(schedule)
+            self.store_gid[i] = gids[schedule.key]
+
+        opens, closes, prefix, owner = [], [], [], []
+        for gid, schedule in enumerate(self.schedules):
+            opens.extend(o + gid * WEEK_SECONDS for o in schedule.opens)
+            closes.extend(c + gid * WEEK_SECONDS for c in schedule.closes)
+            prefix.extend(schedule.prefix)
+            owner.extend([gid] * len(schedule.opens))
+        self.opens = np.asarray(opens, dtype=np.float64)
+        self.closes = np.asarray(closes, dtype=np.float64)
+        self.prefix = np.asarray(prefix, dtype=np.float64)
+        self.owner = np.asarray(owner, dtype=np.int64)
+        self.week_total = np.asarray([s.week_total for s in self.schedules], dtype=np.float64)
+
+        tz_ids = {}
+        self.timezones = []
+        self.gid_tz = np.empty(len(self.schedules), dtype=np.int64)
+        for gid, schedule in enumerate(self.schedules):
+            zone = str(schedule.tz)
+            if zone not in tz_ids:
+                tz_ids[zone] = len(self.timezones)
+                self.timezones.append(schedule.tz)
+            self.gid_tz[gid] = tz_ids[zone]
+
+    # Business seconds in [Monday 00:00 of the epoch week, local) per point
+    def _local_cumulative(self, local, gids):
+        weeks, offset = np.divmod(local + EPOCH_MONDAY_SHIFT, WEEK_SECONDS)
+        total = weeks * self.week_total[gids]
+        if len(self.opens):
+            key = offset + gids * WEEK_SECONDS
+            i = np.searchsorted(self.opens, key, side='right') - 1
+            j = np.maximum(i, 0)
+            inside = (i >= 0) & (self.owner[j] == gids)
+            total += np.where(inside, self.prefix[j] + np.minimum(key, self.closes[j]) - self.opens[j], 0)
+        return total
+
+    def cumulative(self, epochs, gids):
+        """Business seconds up to each epoch, consistent across DST transitions.
+
+        Vectorized form of WeeklySchedule.seconds_between: the difference of
+        two values of the same schedule is the business time between them.
+        The local-time jump at each transition is subtracted so skipped and
+        repeated hours are counted the way the scalar path counts them.
+        """
+        result = np.empty(len(epochs))
+        point_tz = self.gid_tz[gids]
+        order = np.argsort(point_tz, kind='stable')
+        splits = np.searchsorted(point_tz[order], np.arange(1, len(self.timezones)))
+        for tz, idx in zip(self.timezones, np.split(order, splits)):
+            if not len(idx):
+                continue
+            points, point_gids = epochs[idx], gids[idx]
+            first = float(points.min())
+            boundaries, offsets = [first], [utc_offset(tz, first)]
+            for transition, new_offset in utc_transitions(tz, first, float(points.max())):
+                boundaries.append(transition)
+                offsets.append(new_offset)
+            piece = np.searchsorted(np.asarray(boundaries), points, side='right') - 1
+            local = points + np.asarray(offsets, dtype=np.float64)[piece]
+            total = self._local_cumulative(local, point_gids)
+
+            if len(boundaries) > 1:
+                # jumps[g, j]: business time gained in local time at transition j
+                group_ids = np.unique(point_gids)
+                at = np.asarray(boundaries[1:], dtype=np.float64)
+                new = np.asarray(offsets[1:], dtype=np.float64)
+                old = np.asarray(offsets[:-1], dtype=np.float64)
+                g = np.repeat(group_ids, len(at))
+                jumps = (self._local_cumulative(np.tile(at + new, len(group_ids)), g)
+                         - self._local_cumulative(np.tile(at + old, len(group_ids)), g))
+                jumps = np.cumsum(jumps.reshape(len(group_ids), len(at)), axis=1)
+                jumps = np.hstack([np.zeros((len(group_ids), 1)), jumps])
+                total -= jumps[np.searchsorted(group_ids, point_gids), piece]
+            result[idx] = total
+        return result
+
+
+def compute_uptime_matrix(store_idx, epochs, active, schedules, now, window_starts):
+    """Uptime/downtime business minutes for every store and window at once.
+
+    Polls are flat arrays sorted by (store_idx, epochs). Returns an
+    (n_stores, 2 * len(window_starts)) matrix: uptime per window, then
+    downtime per window. Matches compute_uptime_downtime: each poll's status
+    holds until the next poll (or `now`), an interval counts when it ends
+    after the window start, and a store whose first poll is inside the window
+    gets that poll's status from the window start.
+    """
+    n_stores = len(schedules)
+    n_windows = len(window_starts)
+    table = ScheduleTable(schedules)
+
+    # Interval k runs from poll k to the next poll of the same store (or now)
+    last_of_store = np.ones(len(epochs), dtype=bool)
+    last_of_store[:-1] = np.diff(store_idx) != 0
+    ends = np.empty_like(epochs)
+    ends[:-1] = epochs[1:]
+    ends[last_of_store] = now
+
+    # Cumulative business seconds at every poll, plus every window start and now per store
+    # (one call, so all values of a schedule share the same DST baseline)
+    bounds = np.append(np.asarray(window_starts, dtype=np.float64), now)
+    cum = table.cumulative(
+        np.concatenate([epochs, np.tile(bounds, n_stores)]),
+        np.concatenate([table.store_gid[store_idx], np.repeat(table.store_gid, n_windows + 1)]),
+    )
+    poll_cum = cum[:len(epochs)]
+    bound_cum = cum[len(epochs):].reshape(n_stores, n_windows + 1)
+    now_cum = bound_cum[:, -1]
+
+    end_cum = np.empty_like(poll_cum)
+    end_cum[:-1] = poll_cum[1:]
+    end_cum[last_of_store] = now_cum[store_idx[last_of_store]]
+    coverage = end_cum - poll_cum
+
+    first_of_store = np.ones(len(epochs), dtype=bool)
+    first_of_store[1:] = last_of_store[:-1]
+    first_idx = np.full(n_stores, -1)
+    first_idx[store_idx[first_of_store]] = np.flatnonzero(first_of_store)
+    has_polls = first_idx >= 0
+    first = first_idx[has_polls]
+
+    result = np.zeros((n_stores, 2 * n_windows))
+    for w, window_start in enumerate(bounds[:-1]):
+        counted = ends > window_start
+        # (float even without any polls, where bincount would return ints)
+        up = np.bincount(store_idx, weights=coverage * (counted & active), minlength=n_stores).astype(np.float64)
+        down = np.bincount(store_idx, weights=coverage * (counted & ~active), minlength=n_stores).astype(np.float64)
+
+        # Lead-in from the window start to a first poll inside the window
+        lead_in = np.where(epochs[first] > window_start, poll_cum[first] - bound_cum[has_polls, w], 0)
+        up[has_polls] += np.where(active[first], lead_in, 0)
+        down[has_polls] += np.where(active[first], 0, lead_in)
+
+        # No polls at all: the whole window is downtime
+        down[~has_polls] = (now_cum - bound_cum[:, w])[~has_polls]
+
+        result[:, w] = up / 60
+        result[:, n_windows + w] = down / 60
+    return result
+
+
+# Everything the vectorized backend needs for a range of stores (picklable)
+def load_vectorized_inputs(store_range=None, since=None, until=None, subset=None):
+    store_ids, store_idx, epochs, active = load_poll_columns(store_range, since=since, until=until, subset=subset)
+    return store_ids, store_idx, epochs, active, load_schedules(store_ids)
+
+
+def vectorized_rows(inputs, now_utc, last_hour, last_day, last_week):
+    store_ids, store_idx, epochs, active, schedules = inputs
+    window_starts = [last_hour.timestamp(), last_day.timestamp(), last_week.timestamp()]
+    matrix = compute_uptime_matrix(store_idx, epochs, active, schedules, now_utc.timestamp(), window_starts)
+    return [report_row(store_id, *minutes) for store_id, minutes in zip(store_ids, matrix.tolist())]
+
+
+# Report rows for every store via the vectorized backend
+def vectorized_report_rows(now_utc, last_hour, last_day, last_week):
+    return vectorized_rows(load_vectorized_inputs(since=last_week), now_utc, last_hour, last_day, last_week)
+
+
+# Rows for arbitrary windows ending at now_utc (see engine.window_row), e.g. a
+# point-in-time report over a subset of stores
+def window_rows(inputs, now_utc, windows):
+    store_ids, store_idx, epochs, active, schedules = inputs
+    window_starts = [(now_utc - window_length(w)).timestamp() for w in windows]
+    matrix = compute_uptime_matrix(store_idx, epochs, active, schedules, now_utc.timestamp(), window_starts)
+    return [window_row(store_id, minutes, windows) for store_id, minutes in zip(store_ids, matrix.tolist())]
@@ -2,131 +2,356 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from .serializers import *
-from .tasks import generate_report
+from .browse import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, TABLES, InvalidCursor, ndjson_lines, table_page
+from .downloads import report_path, serve_file
+from .report_formats import DEFAULT_FORMAT, REPORT_HEADER, format_content_type, format_extension
+from .ingest import DATA_PATH, IMPORTERS, IngestProgress, bump_data_generation
+from .instrumentation import REPORT_ENGINE_NAMES, log_event, render_metrics
+from .poll_index import poll_index
+from .result_cache import cache_stats
+from .tasks import (
+    ingest_store_data, report_latency_stats, report_params, report_progress, report_status, request_report,
+)
+import asyncio
+import json
 from uuid import uuid4
-from datetime import datetime
-import pandas as pd
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.db import transaction
+from django.db.models import Count
+from django.http import HttpResponse, JsonResponse, QueryDict, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.utils.encoders import JSONEncoder
+from django.urls import reverse
 from .models import *
-import os
-from .models import Timezone, BusinessHour, StoreStatus
-from .serializers import TimezoneSerializer, BusinessHourSerializer, StoreStatusSerializer
+from .models import Timezone, BusinessHour, StoreStatus, StoreHourlyUptime, StoreUptimeState, IngestionWatermark, Report
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
+# Parameters are the query string overlaid by the body; returns (report_id, None) or
+# (None, errors). Shared by the DRF endpoint and its async variant.
+def trigger_report(query, body):
+    if not isinstance(body, dict):
+        return None, {'detail': f'Expected a JSON object, got {type(body).__name__}'}
+    params = TriggerReportRequestSerializer(data={**query, **body})
+    if not params.is_valid():
+        return None, params.errors
+    # Reuses a finished or in-flight report for the same data snapshot when there is one
+    data = params.validated_data
+    return request_report(data['format'], report_params(
+        data.get('as_of'), data.get('windows'), data.get('store_ids'))), None
+
+
 class TriggerReportView(APIView):
     @swagger_auto_schema(
-        operation_description="Trigger a new report generation task",
+        operation_description="Trigger a new report generation task. 'format' is csv (default), csv.gz, "
+                              "csv.zst or parquet (the last two need zstandard / pyarrow installed). Optional "
+                              "'as_of' (report as of that time instead of the newest poll), 'windows' (e.g. "
+                              "['1h', '3d', '30d']; default 1h, 1d, 7d) and 'store_ids' (only those stores). "
+                              "POST /trigger_report/async/ is the same endpoint as an async view",
+        request_body=TriggerReportRequestSerializer,
         responses={200: openapi.Response("Report triggered", TriggerReportSerializer,examples={
                     "application/json": {
                         "report_id": "a1b2c3d4-e5f6-7890-1234-56789abcdef0"
                     }
-                })}
+                }), 400: "Invalid parameters or unavailable format"}
     )
     def post(self, request):
-        report_id = str(uuid4())
-        generate_report.delay(report_id)
+        # Form bodies parse to a QueryDict, whose values would unpack as lists
+        body = request.data.dict() if isinstance(request.data, QueryDict) else request.data
+        report_id, errors = trigger_report(request.query_params.dict(), body)
+        if errors is not None:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
         return Response(TriggerReportSerializer({'report_id': report_id}).data, status=status.HTTP_200_OK)
 
+
+# Async variants of trigger and status (plain Django views: DRF views are sync-only), so
+# under ASGI they don't hold a worker thread while waiting; the DB and cache calls run
+# through sync_to_async. Same parameters and bodies as the DRF endpoints, which are the
+# ones described in the Swagger schema.
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncTriggerReportView(View):
+    """POST: TriggerReportView as an async view (JSON or form body, or query string)."""
+
+    async def post(self, request):
+        try:
+            if request.content_type == 'application/json':
+                body = json.loads(request.body or b'{}')
+            else:
+                body = request.POST.dict()
+        except ValueError as e:
+            return JsonResponse({'detail': f'JSON parse error - {e}'}, status=status.HTTP_400_BAD_REQUEST)
+        report_id, errors = await sync_to_async(trigger_report)(request.GET.dict(), body)
+        if errors is not None:
+            return JsonResponse(errors, status=status.HTTP_400_BAD_REQUEST)
+        return JsonResponse(TriggerReportSerializer({'report_id': report_id}).data)
+
+
+# Status fields shared by the report endpoints (state from the Report row, progress from the cache)
+def report_state_data(report_id, report):
+    data = {'status': dict(Report.STATES)[report['state']]}
+    if report['state'] in (Report.QUEUED, Report.RUNNING):
+        data.update(report_progress(report_id) or {})
+    elif report['state'] == Report.FAILED:
+        data['error'] = report['error']
+    return data
+
+
 class GetReportView(APIView):
     @swagger_auto_schema(
         operation_description="Get report status or download report",
         responses={
-            200: "Returns 'Running' or 'Complete' with CSV file",
-            404: "Report not found"
+            200: "Returns 'Queued', 'Running', 'Failed' or 'Complete' with CSV file",
+            404: "Report not found",
+            410: "Report file was removed; trigger the report again"
         }
     )
     def get(self, request, report_id):
-        path = os.path.join(settings.BASE_DIR, 'reports', f'{report_id}.csv')
-        if not os.path.exists(path):
-            return Response(GetReportSerializer({'status': 'Running'}).data, status=status.HTTP_200_OK)
-        with open(path, 'r') as f:
-            csv_content = f.read()
-        return Response(GetReportSerializer({'status': 'Complete', 'csv_content': csv_content}).data, status=status.HTTP_200_OK)
+        report = report_status(report_id)
+        if report is None:
+            return Response({"message": "Report not found"}, status=status.HTTP_404_NOT_FOUND)
+        data = report_state_data(report_id, report)
+        if report['state'] == Report.COMPLETE:
+            if report['format'] == DEFAULT_FORMAT:
+                try:
+                    with open(report_path(report_id), 'r') as f:
+                        data['csv_content'] = f.read()
+                except FileNotFoundError:
+                    return report_file_gone(report_id)
+            else:
+                # Binary formats are only available as a download
+                data.update(format=report['format'], download_url=reverse('report_download', args=[report_id]))
+        return Response(GetReportSerializer(data).data, status=status.HTTP_200_OK)
+
+
+# A complete report whose file was deleted or archived. Triggering the same report again
+# computes it afresh (tasks.request_report doesn't reuse a finished report without its file)
+def report_file_gone(report_id):
+    log_event('report_file_missing', report_id=report_id)
+    return Response({"message": "Report file is no longer available, trigger the report again"},
+                    status=status.HTTP_410_GONE)
+
+
+# Status endpoint body (no CSV): state, progress or error, timings, rows/bytes and
+# 'download_url' once complete. Served from the cache (see tasks.report_status); None
+# for unknown reports.
+def report_status_data(report_id):
+    report = report_status(report_id)
+    if report is None:
+        return None
+    data = report_state_data(report_id, report)
+    if report['queue_wait_seconds'] is not None:
+        data['queue_wait_seconds'] = report['queue_wait_seconds']
+    if report['state'] == Report.COMPLETE:
+        data.update(
+            rows=report['rows'], size=report['bytes'], compute_seconds=report['compute_seconds'],
+            format=report['format'], download_url=reverse('report_download', args=[report_id]),
+        )
+    if report.get('params'):
+        data['params'] = report['params']
+    return GetReportSerializer(data).data
+
+
+class ReportStatusView(APIView):
+    @swagger_auto_schema(
+        operation_description="Report status only (no CSV body): state, progress or error, timings, rows/bytes and "
+                              "'download_url' once complete. Served from the cache. "
+                              "GET /get_report/<report_id>/status/async/ is the same endpoint as an async view, "
+                              "/get_report/<report_id>/events/ streams it as server-sent events",
+        responses={200: GetReportSerializer, 404: "Report not found"}
+    )
+    def get(self, request, report_id):
+        data = report_status_data(report_id)
+        if data is None:
+            return Response({"message": "Report not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class AsyncReportStatusView(View):
+    """GET: ReportStatusView as an async view. 404 for unknown reports."""
+
+    async def get(self, request, report_id):
+        data = await sync_to_async(report_status_data)(report_id)
+        if data is None:
+            return JsonResponse({"message": "Report not found"}, status=status.HTTP_404_NOT_FOUND)
+        return JsonResponse(data)
+
+
+class ReportEventsView(View):
+    """GET: server-sent events for one report (text/event-stream).
+
+    Sends a 'progress' event whenever the state or shard count changes, then
+    'complete' or 'failed' with the status body and closes. The report is
+    checked every REPORT_EVENTS_POLL_SECONDS from the cache only; comment
+    lines keep idle connections open and the stream ends after
+    REPORT_EVENTS_TIMEOUT seconds (EventSource reconnects by itself).
+    """
 
+    async def get(self, request, report_id):
+        data = await sync_to_async(report_status_data)(report_id)
+        if data is None:
+            return JsonResponse({"message": "Report not found"}, status=status.HTTP_404_NOT_FOUND)
+        response = StreamingHttpResponse(report_events(report_id, data), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
 
 
-DATA_PATH = "store-monitoring-data"
+SSE_RETRY_MS = 2000
+SSE_KEEPALIVE_SECONDS = 15
+
+
+def sse_event(event, data, event_id):
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, cls=JSONEncoder)}\n\n"
+
+
+async def report_events(report_id, data):
+    interval = getattr(settings, 'REPORT_EVENTS_POLL_SECONDS', 0.5)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + getattr(settings, 'REPORT_EVENTS_TIMEOUT', 300)
+    keepalive = loop.time() + SSE_KEEPALIVE_SECONDS
+    yield f"retry: {SSE_RETRY_MS}\n\n"
+    last, event_id = None, 0
+    while True:
+        if data != last:
+            event_id += 1
+            last = data
+            finished = data['status'] in ('Complete', 'Failed')
+            yield sse_event(data['status'].lower() if finished else 'progress', data, event_id)
+            if finished:
+                return
+            keepalive = loop.time() + SSE_KEEPALIVE_SECONDS
+        elif loop.time() >= keepalive:
+            yield ": keep-alive\n\n"
+            keepalive = loop.time() + SSE_KEEPALIVE_SECONDS
+        if loop.time() >= deadline:
+            return
+        await asyncio.sleep(interval)
+        data = await sync_to_async(report_status_data)(report_id) or last
+
+
+class ReportDownloadView(APIView):
+    @swagger_auto_schema(
+        operation_description="Stream the report file in its format (plain CSV is gzipped when accepted; "
+                              "ETag/Last-Modified, Range requests)",
+        responses={200: "Report file", 206: "Partial content", 304: "Not modified", 404: "Report not ready or not found",
+                   410: "Report file was removed; trigger the report again"}
+    )
+    def get(self, request, report_id):
+        report = report_status(report_id)
+        if report is None or report['state'] != Report.COMPLETE:
+            return Response({"message": "Report not ready"}, status=status.HTTP_404_NOT_FOUND)
+        fmt = report['format']
+        try:
+            return serve_file(request, report_path(report_id, fmt), f'{report_id}.{format_extension(fmt)}',
+                              format_content_type(fmt), compressible=fmt == DEFAULT_FORMAT)
+        except FileNotFoundError:
+            return report_file_gone(report_id)
+
+
+class StoreUptimeView(APIView):
+    @swagger_auto_schema(
+        operation_description="One store's report row computed inline (no Celery) from this process's in-memory "
+                              "index of the last week's polls; 'as_of' is the newest poll the index holds",
+        responses={200: openapi.Response("Store uptime/downtime", examples={"application/json": {
+            "store_id": "3", "as_of": "2023-01-25T18:13:22Z", "uptime_last_hour": 60, "uptime_last_day": 23,
+            "uptime_last_week": 160, "downtime_last_hour": 0, "downtime_last_day": 1, "downtime_last_week": 8,
+        }}), 404: "Store not found", 503: "Index still loading after a restart (see Retry-After)"}
+    )
+    def get(self, request, store_id):
+        index = poll_index()
+        if index is None:
+            # The index is still being built after a (re)start
+            response = Response({"message": "Store index is loading, retry shortly"},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = '1'
+            return response
+        row = index.row(store_id)
+        if row is None:
+            return Response({"message": "Store not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'as_of': index.now, **dict(zip(REPORT_HEADER, row))}, status=status.HTTP_200_OK)
+
+
+class ReportStatsView(APIView):
+    @swagger_auto_schema(
+        operation_description="p50/p99 queue wait, compute and end-to-end seconds over the latest 1000 complete "
+                              "reports, plus per-store result cache hits and misses",
+        responses={200: "Latency percentiles and cache counters"}
+    )
+    def get(self, request):
+        return Response({**report_latency_stats(), 'store_cache': cache_stats()}, status=status.HTTP_200_OK)
+
 
 
 class DataCollectionView(APIView):
+    @swagger_auto_schema(
+        operation_description="Start loading the CSV files in the background",
+        responses={202: openapi.Response("Ingestion job queued", examples={
+            "application/json": {"job_id": "a1b2c3d4-e5f6-7890-1234-56789abcdef0"}
+        })}
+    )
     def post(self, request):
         try:
-            messages = []
-
-            # Load timezones
-            tz_file = os.path.join(DATA_PATH, "timezones.csv")
-            if os.path.exists(tz_file):
-                df = pd.read_csv(tz_file)
-                objs = [Timezone(store_id=str(r["store_id"]), timezone_str=r["timezone_str"]) for _, r in df.iterrows()]
-                self._bulk_insert(Timezone, objs)
-                messages.append(f"Loaded {len(objs)} timezones")
-            else:
-                messages.append("timezones.csv missing")
-
-            # Load business hours
-            hours_file = os.path.join(DATA_PATH, "menu_hours.csv")
-            if os.path.exists(hours_file):
-                df = pd.read_csv(hours_file)
-                objs = []
-                for _, r in df.iterrows():
-                    start = datetime.strptime(r["start_time_local"], "%H:%M:%S").time()
-                    end = datetime.strptime(r["end_time_local"], "%H:%M:%S").time()
-                    objs.append(BusinessHour(
-                        store_id=str(r["store_id"]),
-                        day_of_week=int(r["dayOfWeek"]),
-                        start_time_local=start,
-                        end_time_local=end,
-                    ))
-                self._bulk_insert(BusinessHour, objs)
-                messages.append(f"Loaded {len(objs)} business hours")
-            else:
-                messages.append("menu_hours.csv missing")
-
-            # Load store status
-            status_file = os.path.join(DATA_PATH, "store_status.csv")
-            if os.path.exists(status_file):
-                df = pd.read_csv(status_file)
-                objs = []
-                for _, r in df.iterrows():
-                    fmt = "%Y-%m-%d %H:%M:%S.%f %Z" if "." in r["timestamp_utc"] else "%Y-%m-%d %H:%M:%S %Z"
-                    ts = datetime.strptime(r["timestamp_utc"], fmt)
-                    objs.append(StoreStatus(
-                        store_id=str(r["store_id"]),
-                        timestamp_utc=ts,
-                        status=r["status"],
-                    ))
-                self._bulk_insert(StoreStatus, objs, batch_size=2000)
-                messages.append(f"Loaded {len(objs)} store status records")
-            else:
-                messages.append("store_status.csv missing")
-
-            return Response({"message": ", ".join(messages)}, status=status.HTTP_201_CREATED)
+            # Streamed in chunks by a Celery task (see ingest.py); poll /data/jobs/<job_id>/
+            job_id = str(uuid4())
+            IngestProgress(job_id).queue()
+            log_event('ingest_queued', job_id=job_id, data_path=DATA_PATH)
+            ingest_store_data.delay(job_id, DATA_PATH)
+            return Response({"job_id": job_id}, status=status.HTTP_202_ACCEPTED)
 
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     def delete(self, request):
         try:
-            StoreStatus.objects.all().delete()
+            deleted, _ = StoreStatus.objects.all().delete()
             BusinessHour.objects.all().delete()
             Timezone.objects.all().delete()
+            StoreHourlyUptime.objects.all().delete()
+            StoreUptimeState.objects.all().delete()
+            IngestionWatermark.objects.all().delete()
+            bump_data_generation()
+            log_event('data_cleared', polls=deleted)
             return Response({"message": "Database cleared"}, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    def _bulk_insert(self, model, objs, batch_size=1000):
-        """Helper for fast batch inserts"""
-        if objs:
-            with transaction.atomic():
-                model.objects.bulk_create(objs, batch_size=batch_size, ignore_conflicts=True)
+
+class MetricsView(APIView):
+    @swagger_auto_schema(
+        operation_description="Prometheus text format: report/ingestion counters and stage seconds, reports by "
+                              "state and per-store cache lookups (404 unless METRICS_ENABLED)",
+        responses={200: "Prometheus text exposition", 404: "Metrics disabled"}
+    )
+    def get(self, request):
+        if not getattr(settings, 'METRICS_ENABLED', False):
+            return Response({"message": "Metrics disabled"}, status=status.HTTP_404_NOT_FOUND)
+        report_states = dict.fromkeys(dict(Report.STATES), 0)
+        report_states.update(Report.objects.values_list('state').annotate(Count('report_id')).order_by())
+        store_cache = {name: count for name, count in cache_stats().items() if name != 'hit_rate'}
+        text = render_metrics(REPORT_ENGINE_NAMES, [filename for filename, _ in IMPORTERS], report_states, store_cache)
+        return HttpResponse(text, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class IngestJobView(APIView):
+    @swagger_auto_schema(
+        operation_description="Ingestion job status: rows parsed/inserted, current files, throughput, ETA and errors",
+        responses={200: "Job status", 404: "Job not found"}
+    )
+    def get(self, request, job_id):
+        job = IngestProgress.get(job_id)
+        if job is None:
+            return Response({"message": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(job, status=status.HTTP_200_OK)
 
 
 class DataTableView(APIView):
 
     @swagger_auto_schema(
-        operation_description="Get all records from a table",
+        operation_description="Browse a table in (store_id, timestamp_utc) order, one page at a time. Pass "
+                              "'next_cursor' back as 'cursor' for the next page; 'export=ndjson' streams every "
+                              "matching row as newline-delimited JSON instead",
         manual_parameters=[
             openapi.Parameter(
                 "table",
@@ -134,39 +359,63 @@ class DataTableView(APIView):
                 description="Table name (timezone, businesshour, storestatus)",
                 type=openapi.TYPE_STRING,
                 required=True,
-                enum=["timezone", "businesshour", "storestatus"],  # ✅ restrict values
-            )
+                enum=list(TABLES),
+            ),
+            openapi.Parameter("store_id", openapi.IN_QUERY, type=openapi.TYPE_STRING, description="Only this store"),
+            openapi.Parameter("since", openapi.IN_QUERY, type=openapi.TYPE_STRING, format=openapi.FORMAT_DATETIME,
+                              description="storestatus only: polls at or after this time"),
+            openapi.Parameter("until", openapi.IN_QUERY, type=openapi.TYPE_STRING, format=openapi.FORMAT_DATETIME,
+                              description="storestatus only: polls before this time"),
+            openapi.Parameter("limit", openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                              description=f"Rows per page (default {DEFAULT_PAGE_SIZE}, at most {MAX_PAGE_SIZE})"),
+            openapi.Parameter("cursor", openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description="'next_cursor' from the previous page"),
+            openapi.Parameter("export", openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=["ndjson"],
+                              description="Stream all matching rows (no paging)"),
         ],
         responses={
             200: openapi.Response(
-                description="List of records",
+                description="One page of records",
                 examples={
-                    "application/json": [
-                        {"store_id": "1", "timezone_str": "America/Chicago"},  # timezone sample
-                        {"store_id": "2", "day_of_week": 0, "start_time_local": "09:00:00", "end_time_local": "17:00:00"},  # businesshour sample
-                        {"store_id": "3", "timestamp_utc": "2023-05-10T10:14:00Z", "status": "active"}  # storestatus sample
-                    ]
+                    "application/json": {
+                        "results": [
+                            {"store_id": "3", "timestamp_utc": "2023-05-10T10:14:00Z", "status": "active"},
+                        ],
+                        "next_cursor": "WyIzIiwgIjIwMjMtMDUtMTBUMTA6MTQ6MDBaIl0",
+                        "next": "http://localhost:8000/data/storestatus/?cursor=WyIzIiwgIjIwMjMtMDUtMTBUMTA6MTQ6MDBaIl0",
+                    }
                 }
             ),
-            400: openapi.Response(description="Invalid table name"),
+            400: openapi.Response(description="Invalid table, filter or cursor"),
             500: openapi.Response(description="Server error"),
         }
     )
     def get(self, request, table):
+        if table not in TABLES:
+            return Response(
+                {"message": "Invalid table. Choose among timezone/businesshour/storestatus"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        params = TableQuerySerializer(data=request.query_params.dict())
+        if not params.is_valid():
+            return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+        query = params.validated_data
+        filters = {name: query.get(name) for name in ('store_id', 'since', 'until')}
+        if TABLES[table][3] is None and (query.get('since') or query.get('until')):
+            return Response({"message": f"'{table}' has no time column to filter on"},
+                            status=status.HTTP_400_BAD_REQUEST)
         try:
-            if table == "timezone":
-                data = TimezoneSerializer(Timezone.objects.all()[:100], many=True).data
-            elif table == "businesshour":
-                data = BusinessHourSerializer(BusinessHour.objects.all()[:100], many=True).data
-            elif table == "storestatus":
-                data = StoreStatusSerializer(StoreStatus.objects.all()[:100], many=True).data
-            else:
-                return Response(
-                    {"message": "Invalid table. Choose among timezone/businesshour/storestatus"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            return Response(data, status=status.HTTP_200_OK)
-
+            if query.get('export') == 'ndjson':
+                return StreamingHttpResponse(ndjson_lines(table, **filters), content_type='application/x-ndjson')
+            rows, next_cursor = table_page(table, query['limit'], query.get('cursor'), **filters)
+        except InvalidCursor as e:
+            return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        next_url = None
+        if next_cursor is not None:
+            next_query = request.query_params.copy()
+            next_query['cursor'] = next_cursor
+            next_url = request.build_absolute_uri(f"{request.path}?{next_query.urlencode()}")
+        return Response({'results': rows, 'next_cursor': next_cursor, 'next': next_url}, status=status.HTTP_200_OK)
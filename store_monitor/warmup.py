@@ -0,0 +1,41 @@
+import importlib
+import os
+import time as timer
+from django.db import connection
+from django.db.models import Max
+from store_monitor.instrumentation import log_event
+from store_monitor.lookups import store_lookups
+from store_monitor.models import StoreStatus
+
+# Imported on first use rather than at module level (so the web process never loads
+# them); workers import them up front instead
+WARM_MODULES = ('pandas', 'numpy', 'store_monitor.vectorized', 'store_monitor.pollstore')
+
+_warmed_pid = None
+
+
+def warm_start():
+    """Preload what a worker's first task would otherwise pay for, once per process.
+
+    Imports WARM_MODULES, compiles the timezone / business-hours lookups and
+    precomputes UTC offsets for the current report window (tasks.prepare_schedules).
+    Returns the seconds taken, or None if this process is already warm.
+    """
+    global _warmed_pid
+    if _warmed_pid == os.getpid():
+        return None
+    _warmed_pid = os.getpid()
+    start = timer.perf_counter()
+    for name in WARM_MODULES:
+        importlib.import_module(name)
+    from store_monitor.tasks import prepare_schedules
+    now_utc = StoreStatus.objects.aggregate(Max('timestamp_utc'))['timestamp_utc__max']
+    if now_utc is not None:
+        prepare_schedules(now_utc)
+    else:
+        store_lookups()
+    # Don't hand an open connection to processes forked from this one
+    connection.close()
+    seconds = timer.perf_counter() - start
+    log_event('worker_warm', pid=_warmed_pid, seconds=round(seconds, 3))
+    return seconds